@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""bench_build.py
+
+End to end build benchmark on a synthetic model.
+
+Generates a model with synth_model.py and builds it offline, with the
+java (PlantUML) and pyang stand-ins first in PATH:
+
+- graphyte.py main: the whole model is built the given number of
+  times, each time in a new interpreter, with --trace,
+- build_module: the first module is built the given number of times
+  in this process with build_module_spec, as graphyte.py does for
+  every module, with the file index and parameter worksheet shared.
+
+The time of every build stage is read from the build trace, summed
+over modules and the best of all runs kept. Results are appended to a
+JSON lines file with the git commit they were measured on, and
+compared with the last result measured on another commit with the
+same model and options, so regressions between commits are visible.
+Fails (exit status 1) with --check if any stage is slower than the
+previous result by more than the threshold.
+
+Usage: python3 benchmarks/bench_build.py [options], -h for help
+
+"""
+
+# imports
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAPHYTE_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "graphyte"))
+sys.path.insert(0, BENCH_DIR)
+from synth_model import DEFAULTS, FLAVORS, MODEL_NAME, MODEL_VERSION, \
+    PARAMS_NAME, generate_model, write_stubs  # noqa: E402
+
+# info
+__author__ = "Jorge Somavilla"
+
+DEFAULT_RESULTS = os.path.join(BENCH_DIR, "bench_build_results.jsonl")
+DEFAULT_RUNS = 5
+DEFAULT_THRESHOLD = 10.0
+# changes smaller than this are noise, whatever their percentage
+MIN_REGRESSION_MS = 2.0
+TRACE_NAME = "graphyte-trace.json"
+
+
+def git_commit():
+    """Identifies the code measured.
+
+    :return: short commit hash, followed by +dirty if there are
+     uncommitted changes, empty if not in a git repository
+    """
+    try:
+        commit = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+        changes = subprocess.check_output(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=BENCH_DIR, stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+    return commit + ("+dirty" if changes else "")
+
+
+def stage_times(events):
+    """Sums the wall time of every stage of a build trace.
+
+    :param events: trace events
+    :return: dictionary of stage name:milliseconds
+    """
+    stages = dict()
+    for event in events:
+        if event.get('ph') == 'X':
+            stages[event['name']] = stages.get(event['name'], 0.0) \
+                + event['dur'] / 1000
+    return stages
+
+
+def best_of(runs):
+    """Keeps the best time of every stage.
+
+    :param runs: list of (total ms, dictionary of stage name:ms)
+    :return: dictionary with total_ms and stages
+    """
+    stages = dict()
+    for total, run_stages in runs:
+        for name, ms in run_stages.items():
+            stages[name] = round(min(ms, stages.get(name, ms)), 3)
+    return {'total_ms': round(min(total for total, s in runs), 3),
+            'stages': stages}
+
+
+def bench_main(model_dir, env, runs, options):
+    """Builds the whole model with graphyte.py.
+
+    :param model_dir: input files directory
+    :param env: environment, with the tool stand-ins in PATH
+    :param runs: number of builds
+    :param options: additional graphyte.py arguments
+    :return: dictionary with total_ms and stages
+    """
+    results = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        p = subprocess.run(
+            [sys.executable, "graphyte.py", "-d", model_dir, "--trace"]
+            + options, cwd=GRAPHYTE_DIR, env=env, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        total = (time.perf_counter() - t0) * 1000
+        if p.returncode:
+            sys.exit("graphyte.py failed:\n" + p.stderr)
+        with open(os.path.join(model_dir, "www", TRACE_NAME)) as f:
+            results.append((total, stage_times(json.load(f)['traceEvents'])))
+    return best_of(results)
+
+
+def bench_build_module(model_dir, diagram, work_dir, runs, use_cache,
+                       cache_dir):
+    """Builds one module in this process, with the settings used by
+    graphyte.py.
+
+    :param model_dir: input files directory
+    :param diagram: module diagram file name
+    :param work_dir: work directory
+    :param runs: number of builds
+    :param use_cache: whether to use the render cache
+    :param cache_dir: render cache directory
+    :return: dictionary with total_ms and stages
+    """
+    # graphyte code expects to run from its own directory
+    os.chdir(GRAPHYTE_DIR)
+    sys.path.insert(0, GRAPHYTE_DIR)
+    sys.path.insert(0, os.path.join(GRAPHYTE_DIR, "utils"))
+    from graphyte_gen import ModuleSpec, build_module_spec
+    from index_utils import FileIndex
+    from param_utils import load_param_sheet
+    logging.getLogger('graphyte').addHandler(logging.NullHandler())
+
+    file_index = FileIndex(model_dir)
+    sheet = os.path.join(model_dir, PARAMS_NAME)
+    param_sheet = None
+    if os.path.exists(sheet):
+        param_sheet = load_param_sheet(sheet)
+    else:
+        sheet = ""
+    mod_name = os.path.splitext(diagram)[0]
+    spec = ModuleSpec(
+        os.path.join(model_dir, "diagrams", diagram),
+        os.path.join(work_dir, "www"), MODEL_NAME, MODEL_VERSION, mod_name,
+        model_dir, nav=mod_name, sheet=sheet,
+        work_dir=os.path.join(work_dir, "work"), use_cache=use_cache,
+        cache_dir=cache_dir or "", trace=True)
+    results = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        result = build_module_spec(spec, file_index, param_sheet)
+        total = (time.perf_counter() - t0) * 1000
+        if not result.ok:
+            sys.exit("build_module failed: {}\n{}".format(
+                diagram, result.traceback or result.error))
+        results.append((total, stage_times(result.trace)))
+    return best_of(results)
+
+
+def load_results(path):
+    """Reads the stored results.
+
+    :param path: results file
+    :return: list of results, oldest first
+    """
+    results = []
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    results.append(json.loads(line))
+    except (IOError, OSError, ValueError):
+        pass
+    return results
+
+
+def find_previous(results, record):
+    """Finds the result to compare with: the last one with the same
+    model, options and host measured on another commit, or the last
+    one with the same model, options and host if there is none.
+
+    :param results: stored results, oldest first
+    :param record: current result
+    :return: previous result, None if not found
+    """
+    same = [r for r in results if r['params'] == record['params']
+            and r.get('host') == record['host']]
+    other = [r for r in same if r['commit'] != record['commit']]
+    if other:
+        return other[-1]
+    return same[-1] if same else None
+
+
+def compare(name, current, previous, threshold):
+    """Prints the times of a benchmark and their change since the
+    previous result.
+
+    :param name: benchmark name
+    :param current: dictionary with total_ms and stages
+    :param previous: previous dictionary with total_ms and stages, None
+     if not available
+    :param threshold: slowdown percentage reported as a regression
+    :return: list of regressed stage names
+    """
+    print("{}:".format(name))
+    print("  {:<26} {:>11} {:>11} {:>9}".format(
+        "stage", "ms", "previous", "change"))
+    rows = [("(end to end)", current['total_ms'],
+             previous['total_ms'] if previous else None)]
+    for stage, ms in sorted(current['stages'].items(), key=lambda kv: -kv[1]):
+        rows.append((stage, ms, previous['stages'].get(stage)
+                     if previous else None))
+    regressions = []
+    for stage, ms, before in rows:
+        if before is None:
+            print("  {:<26} {:>11.1f}".format(stage, ms))
+            continue
+        change = (ms - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > threshold and ms - before > MIN_REGRESSION_MS:
+            flag = " REGRESSION"
+            regressions.append(name + " " + stage)
+        print("  {:<26} {:>11.1f} {:>11.1f} {:>+8.1f}%{}".format(
+            stage, ms, before, change, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a synthetic graphyte model and compare the "
+                    "time of every build stage with previous commits.")
+    parser.add_argument('--modules', type=int, default=DEFAULTS['modules'])
+    parser.add_argument('--templates', type=int, default=DEFAULTS['templates'],
+                        help='Templates per module.')
+    parser.add_argument('--template-lines', type=int, dest='template_lines',
+                        default=DEFAULTS['template_lines'])
+    parser.add_argument('--template-params', type=int,
+                        dest='template_params',
+                        default=DEFAULTS['template_params'],
+                        help='Worksheet parameters used by every template.')
+    parser.add_argument('--param-rows', type=int, dest='param_rows',
+                        default=DEFAULTS['param_rows'],
+                        help='Rows of the parameter worksheet, 0 for none.')
+    parser.add_argument('--svg-shapes', type=int, dest='svg_shapes',
+                        default=DEFAULTS['svg_shapes'],
+                        help='Shapes per diagram.')
+    parser.add_argument('--links', type=int, default=DEFAULTS['links'],
+                        help='Hyperlinked shapes per diagram.')
+    parser.add_argument('--flavor', choices=FLAVORS,
+                        default=DEFAULTS['flavor'], help='Diagram flavor.')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='Modules built in parallel by graphyte.py.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Use a render cache, warm after the first run.')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS,
+                        help='Builds measured, the best one is kept.')
+    parser.add_argument('--results', default=DEFAULT_RESULTS,
+                        help='JSON lines file storing the results.')
+    parser.add_argument('--no-save', action='store_true', dest='no_save',
+                        help='Do not store the results.')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Slowdown percentage reported as a regression.')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with status 1 if there are regressions.')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the generated model.')
+    args = parser.parse_args()
+
+    model_params = dict((k, getattr(args, k)) for k in DEFAULTS)
+    tmp_dir = tempfile.mkdtemp(prefix="graphyte-bench-")
+    model_dir = os.path.join(tmp_dir, "model")
+    diagrams = generate_model(model_dir, **model_params)
+    bin_dir = write_stubs(os.path.join(tmp_dir, "bin"))
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    cache_dir = os.path.join(tmp_dir, "cache") if args.cache else None
+    cache_options = ['--no-cache']
+    if args.cache:
+        cache_options = ['--cache-dir', cache_dir]
+
+    record = {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'params': dict(model_params, jobs=args.jobs, cache=args.cache,
+                       runs=args.runs)
+    }
+    print("commit {}, {}".format(record['commit'] or "unknown", ", ".join(
+        "{} {}".format(k, v) for k, v in sorted(record['params'].items()))))
+    try:
+        record['main'] = bench_main(
+            model_dir, os.environ.copy(), args.runs,
+            ['-j', str(args.jobs)] + cache_options)
+        record['build_module'] = bench_build_module(
+            model_dir, diagrams[0], os.path.join(tmp_dir, "module"),
+            args.runs, args.cache, cache_dir)
+    finally:
+        if args.keep:
+            print("model kept in " + model_dir)
+        else:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    previous = find_previous(load_results(args.results), record)
+    if previous:
+        print("compared with commit {} ({})".format(
+            previous['commit'] or "unknown", previous['date']))
+    regressions = []
+    for name in ('main', 'build_module'):
+        regressions += compare(name, record[name],
+                               previous[name] if previous else None,
+                               args.threshold)
+    if not args.no_save:
+        with open(args.results, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+        print("results stored in " + args.results)
+    if regressions:
+        print("slower by more than {:.0f}%: {}".format(
+            args.threshold, ", ".join(regressions)))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
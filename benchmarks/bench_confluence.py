@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""bench_confluence.py
+
+Benchmark of Confluence publishing against the local mock Confluence.
+
+Generates a synthetic model (module diagrams, templates, decision
+tables, variable workbook, changes file and zip) and publishes it
+to a mock Confluence server:
+
+- per fragment: every header, table, diagram and template is added to
+  its page with one page update, as graphyte used to do,
+- batched: build_confluence_page, every page is built locally and
+  published with a single create or update, one request at a time,
+- concurrent: build_confluence_page uploading attachments and
+  updating pages over several connections at a time,
+- sync: build_confluence_page in sync mode, publishing the unchanged
+  model again over the page tree of the concurrent run.
+
+The mock server delays every request by the given latency, to simulate
+the network round trip to a Confluence instance, and can fail one
+request of every N to exercise retries.
+
+Prints the number of requests, the connections opened and the bytes
+sent to the server.
+
+Usage: python3 benchmarks/bench_confluence.py [modules] [templates]
+       [latency ms] [concurrency] [fail every]
+
+"""
+
+# imports
+import builtins
+import copy
+import getpass
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "graphyte", "utils"))
+sys.path.insert(0, BENCH_DIR)
+import openpyxl  # noqa: E402
+from conflux import Conflux  # noqa: E402
+from confluence_utils import build_confluence_page  # noqa: E402
+from mock_confluence import start_server, SPACE_KEY  # noqa: E402
+
+# info
+__author__ = "Jorge Somavilla"
+
+
+def make_model(work_dir, modules, templates):
+    """Writes the files of a synthetic model.
+
+    :param work_dir: directory of the model files
+    :param modules: number of modules
+    :param templates: number of text templates per module
+    :return: model dictionary, as built by graphyte.py
+    """
+    title = "Bench Model v1.0"
+    d = {title: {}}
+    zip_path = os.path.join(work_dir, "graphyte-bench.zip")
+    with open(zip_path, "wb") as f:
+        f.write(os.urandom(256 * 1024))
+    d[title]['zipfile'] = zip_path
+    changes = os.path.join(work_dir, "CHANGES.txt")
+    with open(changes, "w") as f:
+        f.write("".join("- change " + str(i) + "\n" for i in range(50)))
+    d[title]['changesfile'] = changes
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Parameter", "Description", "Type"])
+    for i in range(200):
+        ws.append(["param" + str(i), "description " + str(i), "string"])
+    workbook = os.path.join(work_dir, "params.xlsx")
+    wb.save(workbook)
+    d[title]['auth_params'] = workbook
+    for m in range(modules):
+        name = "Module" + str(m) + ".svg"
+        svg = os.path.join(work_dir, name)
+        with open(svg, "w") as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg">'
+                    + '<rect width="10" height="10"/>' * 500 + '</svg>')
+        tpl = dict()
+        for t in range(templates):
+            path = os.path.join(work_dir, "m" + str(m) + "_t" + str(t) + ".txt")
+            with open(path, "w") as f:
+                f.write("".join("interface <intf" + str(i) + ">\n ip address "
+                                "<ip> <mask>\n!\n" for i in range(40)))
+            tpl[os.path.basename(path)] = path
+        csv = os.path.join(work_dir, "m" + str(m) + "_decisions.csv")
+        with open(csv, "w") as f:
+            f.write("Parameter,Value\n" + "".join(
+                "p" + str(i) + ",v" + str(i) + "\n" for i in range(20)))
+        tpl[os.path.basename(csv)] = csv
+        d[title][name] = {'modpath': svg, 'templates': tpl}
+    return d
+
+
+def publish_per_fragment(d, url, parent):
+    """Publishes the model adding every fragment to its page with one
+    page update, the way graphyte published models before page bodies
+    were built locally.
+
+    :param d: model dictionary
+    :param url: Confluence base URL
+    :param parent: parent page URL
+    :return: None
+    """
+    conflux = Conflux(url=url, username="bench", password="bench")
+    parent_id = conflux.get_page_id(parent)
+    title = next(iter(d))
+    page_id = conflux.create_empty_page_get_id(title, parent_id)
+    zip_file = d[title].pop("zipfile")
+    conflux.attach_file_get_id(zip_file, page_id, 'application/zip')
+    href = conflux.build_attachchment_href(
+        page_id, os.path.basename(zip_file),
+        "Full interactive documentation attached.")
+    conflux.append_header_to_page(page_id, "Full Model Documentation", "1")
+    conflux.append_body_to_page(page_id, href)
+    conflux.append_header_to_page(page_id, "Modules", "1")
+    conflux.append_children_macro(page_id)
+    changes = d[title].pop('changesfile')
+    conflux.append_header_to_page(page_id, "CHANGES", "1")
+    conflux.append_body_to_page(page_id, conflux.build_template_body(changes))
+    workbook = d[title].pop('auth_params')
+    child_id = conflux.create_empty_page_get_id("Variable List", page_id)
+    conflux.append_header_to_page(child_id, "Allowed Model Variables", "1")
+    conflux.attach_file_get_id(workbook, child_id, 'application/xls')
+    conflux.append_body_to_page(child_id, conflux.build_attachchment_href(
+        page_id, os.path.basename(workbook), "Download Variable List as file.\n"))
+    conflux.append_workbook_as_tables(child_id, workbook)
+    conflux.attach_file_get_id(workbook, page_id, 'application/vnd.ms-excel')
+    for m in d[title]:
+        child_id = conflux.create_empty_page_get_id(m, page_id)
+        conflux.append_body_to_page(child_id, conflux.build_scroll_ignore(
+            conflux.build_toc_with_header("Table of Contents")))
+        conflux.append_header_to_page(child_id, m, "1")
+        conflux.append_header_to_page(child_id, "Diagram", "2")
+        conflux.attach_svg_append_as_img(child_id, d[title][m]['modpath'])
+        conflux.append_header_to_page(child_id, "Module Templates", "2")
+        for t, fp in d[title][m]["templates"].items():
+            if t.endswith(".csv"):
+                conflux.append_csv_as_table(child_id, fp)
+            else:
+                att_id, name = conflux.attach_file_get_id(fp, page_id)
+                conflux.append_header_to_page(
+                    child_id, conflux.build_attachchment_href(page_id, name, name),
+                    "3")
+                conflux.append_body_to_page(child_id,
+                                            conflux.build_template_body(fp))
+
+
+def main():
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    templates = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.02
+    concurrency = int(sys.argv[4]) if len(sys.argv) > 4 else 8
+    fail_every = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+    work_dir = tempfile.mkdtemp(prefix="graphyte-bench-")
+    server, url = start_server(latency=latency, fail_every=fail_every)
+    parent = url + "/display/" + SPACE_KEY + "/Parent"
+    mock = server.confluence
+    # build_confluence_page asks for credentials
+    builtins.input = lambda prompt="": "bench"
+    getpass.getpass = lambda prompt="", stream=None: "bench"
+    stdout = sys.stdout
+    try:
+        d = make_model(work_dir, modules, templates)
+        state_path = os.path.join(work_dir, "confluence-state.json")
+        runs = (
+            ("per fragment",
+             lambda: publish_per_fragment(copy.deepcopy(d), url, parent)),
+            ("batched",
+             lambda: build_confluence_page(copy.deepcopy(d), url, parent, "",
+                                           1)),
+            ("concurrent",
+             lambda: build_confluence_page(copy.deepcopy(d), url, parent, "",
+                                           concurrency, False, state_path)),
+            ("sync",
+             lambda: build_confluence_page(copy.deepcopy(d), url, parent, "",
+                                           concurrency, True, state_path)),
+        )
+        if fail_every:
+            # the per fragment flow does not retry failed requests
+            runs = runs[1:]
+            Conflux.retry_backoff = 0.05
+        print("{} modules, {} templates per module, {:.0f} ms latency, "
+              "concurrency {}".format(modules, templates, latency * 1000,
+                                      concurrency))
+        print("{:>14} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8} {:>9} {:>9}".format(
+            "mode", "requests", "GET", "POST", "PUT", "failed", "conns",
+            "MB sent", "seconds"))
+        for name, run in runs:
+            mock.reset_stats()
+            t0 = time.perf_counter()
+            sys.stdout = open(os.devnull, "w")
+            try:
+                run()
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            elapsed = time.perf_counter() - t0
+            r = mock.requests
+            print("{:>14} {:>10} {:>8} {:>8} {:>8} {:>8} {:>8} {:>9.2f} "
+                  "{:>9.2f}".format(
+                      name, sum(r.values()), r["GET"], r["POST"], r["PUT"],
+                      mock.failed, mock.connections, mock.bytes_in / 1e6,
+                      elapsed))
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
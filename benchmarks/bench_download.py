@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""bench_download.py
+
+Benchmark of Conflux.download_all_attachments against the local mock
+Confluence.
+
+Attaches files of the given size to a mock Confluence page, with the
+hash comment added by graphyte uploads, and downloads them:
+
+- in memory: one file at a time, reading each whole response before
+  writing it, as download_all_attachments used to do,
+- streamed: download_all_attachments with the given concurrency,
+- up to date: download_all_attachments again, every file is skipped,
+- resumed: download_all_attachments after truncating every local file
+  to half its size and leaving it as a partial download.
+
+Prints the requests sent, the peak Python memory allocated and the
+time taken by every run.
+
+Usage: python3 benchmarks/bench_download.py [files] [MB per file]
+       [latency ms] [concurrency]
+
+"""
+
+# imports
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "graphyte", "utils"))
+sys.path.insert(0, BENCH_DIR)
+from conflux import Conflux, HASH_COMMENT_PREFIX, PARTIAL_SUFFIX  # noqa: E402
+from mock_confluence import start_server, PARENT_PAGE_ID  # noqa: E402
+
+# info
+__author__ = "Jorge Somavilla"
+
+
+def download_in_memory(conflux, page_id, dir):
+    """Downloads all attachments of a page one at a time, holding
+    every response in memory, the way graphyte downloaded them before
+    downloads were streamed.
+
+    :param conflux: Conflux instance
+    :param page_id: confluence id of page
+    :param dir: target directory
+    :return: True
+    """
+    d = conflux.get_attachments_urls(page_id)
+    for name in d:
+        if re.match(".*", name):
+            auth = (conflux.username, conflux.password)
+            r = conflux._session.get(conflux.url + d[name], verify=False, auth=auth)
+            with open(dir + '/' + name, 'wb') as f:
+                f.write(r.content)
+    return True
+
+
+def truncate_to_partial(dir):
+    """Leaves every downloaded file as a partial download of half its
+    size.
+
+    :param dir: download directory
+    :return: None
+    """
+    for name in os.listdir(dir):
+        path = os.path.join(dir, name)
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) // 2)
+        os.replace(path, path + PARTIAL_SUFFIX)
+
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    size = int(float(sys.argv[2]) * 1e6) if len(sys.argv) > 2 else 32 * 10 ** 6
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.02
+    concurrency = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    work_dir = tempfile.mkdtemp(prefix="graphyte-bench-")
+    server, url = start_server(latency=latency)
+    mock = server.confluence
+    digests = dict()
+    atts = mock.attachments.setdefault(PARENT_PAGE_ID, {})
+    for i in range(files):
+        name = "model" + str(i) + ".zip"
+        data = os.urandom(size)
+        digests[name] = hashlib.sha256(data).hexdigest()
+        atts[name] = {'id': 'att' + mock.new_id(), 'version': 1, 'data': data,
+                      'comment': HASH_COMMENT_PREFIX + digests[name]}
+    conflux = Conflux(url=url, username="bench", password="bench")
+    old_dir = os.path.join(work_dir, "in-memory")
+    new_dir = os.path.join(work_dir, "streamed")
+    os.makedirs(old_dir)
+    os.makedirs(new_dir)
+    runs = (
+        ("in memory", lambda: download_in_memory(conflux, PARENT_PAGE_ID, old_dir)),
+        ("streamed", lambda: conflux.download_all_attachments(
+            PARENT_PAGE_ID, new_dir, concurrency=concurrency)),
+        ("up to date", lambda: conflux.download_all_attachments(
+            PARENT_PAGE_ID, new_dir, concurrency=concurrency)),
+        ("resumed", lambda: (truncate_to_partial(new_dir),
+                             conflux.download_all_attachments(
+                                 PARENT_PAGE_ID, new_dir,
+                                 concurrency=concurrency))[1]),
+    )
+    try:
+        print("{} files of {:.1f} MB, {:.0f} ms latency, concurrency {}".format(
+            files, size / 1e6, latency * 1000, concurrency))
+        print("{:>12} {:>10} {:>14} {:>9} {:>4}".format(
+            "mode", "requests", "peak MB", "seconds", "ok"))
+        for name, run in runs:
+            mock.reset_stats()
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - t0
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            out_dir = old_dir if name == "in memory" else new_dir
+            ok = all(
+                hashlib.sha256(open(os.path.join(out_dir, n), 'rb').read())
+                .hexdigest() == digests[n] for n in digests
+            )
+            print("{:>12} {:>10} {:>14.1f} {:>9.2f} {:>4}".format(
+                name, sum(mock.requests.values()), peak / 1e6, elapsed, str(ok)))
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
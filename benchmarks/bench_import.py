@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""bench_import.py
+
+Cold start benchmark of graphyte.py.
+
+Imports graphyte.py in fresh interpreters run with -X importtime, and
+reports the best cumulative import time of the graphyte module and the
+modules taking the longest to import. Fails (exit status 1) if:
+
+- the import takes longer than the budget, or
+- any of the dependencies only needed to publish to Confluence or to
+  read spreadsheets (atlassian, requests, pandas, openpyxl, xlrd...)
+  is imported, as they are only loaded when their feature is used.
+
+Usage: python3 benchmarks/bench_import.py [budget ms] [runs]
+
+"""
+
+# imports
+import os
+import re
+import subprocess
+import sys
+
+# info
+__author__ = "Jorge Somavilla"
+
+GRAPHYTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "..", "graphyte")
+DEFAULT_BUDGET_MS = 200
+DEFAULT_RUNS = 5
+# top level packages that must not be imported at start up
+HEAVY_MODULES = ("atlassian", "requests", "urllib3", "pandas", "numpy",
+                 "openpyxl", "xlrd")
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times():
+    """Imports graphyte.py in a new interpreter.
+
+    :return: dictionary of module name:(self us, cumulative us), in
+     import order
+    """
+    p = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import graphyte"],
+        cwd=GRAPHYTE_DIR, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    if p.returncode:
+        sys.exit("import graphyte failed:\n" + p.stderr)
+    times = dict()
+    for line in p.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m:
+            times[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+    return times
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_RUNS
+    best = None
+    for _ in range(runs):
+        times = import_times()
+        if best is None or times['graphyte'][1] < best['graphyte'][1]:
+            best = times
+    total = best['graphyte'][1] / 1000
+    print("import graphyte: {:.1f} ms (best of {}, budget {:.0f} ms)".format(
+        total, runs, budget))
+    print("slowest modules (self time):")
+    for name, (own, cumulative) in sorted(best.items(),
+                                          key=lambda kv: -kv[1][0])[:10]:
+        print("  {:>8.1f} ms  {}".format(own / 1000, name))
+
+    failed = False
+    heavy = sorted(set(name.split(".")[0] for name in best
+                       if name.split(".")[0] in HEAVY_MODULES))
+    if heavy:
+        print("FAIL: heavy dependencies imported at start up: "
+              + ", ".join(heavy))
+        failed = True
+    if total > budget:
+        print("FAIL: import time {:.1f} ms over budget {:.0f} ms".format(
+            total, budget))
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""bench_server.py
+
+Build service benchmark on a synthetic model, run entirely on
+localhost.
+
+Generates a model with synth_model.py, copies it as the input files of
+a number of jobs and builds all of them offline, with the java
+(PlantUML) and pyang stand-ins first in PATH:
+
+- graphyte.py -i: one new interpreter per job, as the archive mode is
+  run from scripts,
+- graphyte_server.py: the jobs are submitted to the build service
+  through its HTTP API and polled until they are all built.
+
+Reports the time to build all jobs and per job for both.
+
+Usage: python3 benchmarks/bench_server.py [options], -h for help
+
+"""
+
+# imports
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.request import Request, urlopen
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+GRAPHYTE_DIR = os.path.abspath(os.path.join(BENCH_DIR, "..", "graphyte"))
+sys.path.insert(0, BENCH_DIR)
+from synth_model import DEFAULTS, FLAVORS, generate_model, \
+    write_stubs  # noqa: E402
+
+# info
+__author__ = "Jorge Somavilla"
+
+DEFAULT_JOBS = 8
+DEFAULT_WORKERS = 2
+POLL_INTERVAL = 0.05
+START_TIMEOUT = 30
+
+
+def free_port():
+    """Finds a free TCP port on localhost.
+
+    :return: port number
+    """
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def request(url, data=None):
+    """Sends a request to the build service.
+
+    :param url: request URL
+    :param data: optional. JSON body, sent with POST
+    :return: decoded JSON response
+    """
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    with urlopen(Request(url, body)) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+def make_jobs(base_dir, model_dir, num_jobs):
+    """Copies the model as the input files of every job.
+
+    :param base_dir: archive base directory
+    :param model_dir: model input files directory
+    :param num_jobs: number of jobs
+    :return: list of job identifiers
+    """
+    identifiers = []
+    for i in range(num_jobs):
+        identifier = "job{}".format(i)
+        shutil.copytree(model_dir, os.path.join(
+            base_dir, "archive", identifier, "in"))
+        identifiers.append(identifier)
+    return identifiers
+
+
+def bench_cli(base_dir, identifiers, env, options):
+    """Builds every job with its own graphyte.py process.
+
+    :param base_dir: archive base directory
+    :param identifiers: job identifiers
+    :param env: environment, with the tool stand-ins in PATH
+    :param options: additional graphyte.py arguments
+    :return: total time in seconds
+    """
+    t0 = time.perf_counter()
+    for identifier in identifiers:
+        p = subprocess.run(
+            [sys.executable, "graphyte.py", "-d", base_dir, "-i", identifier]
+            + options, cwd=GRAPHYTE_DIR, env=env, stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        if p.returncode:
+            sys.exit("graphyte.py failed:\n" + p.stderr)
+    return time.perf_counter() - t0
+
+
+def bench_server(base_dir, identifiers, env, workers, options, rounds):
+    """Builds every job with the build service.
+
+    :param base_dir: archive base directory
+    :param identifiers: job identifiers
+    :param env: environment, with the tool stand-ins in PATH
+    :param workers: number of service workers
+    :param options: additional graphyte_server.py arguments
+    :param rounds: times all jobs are submitted, the service is warm
+     after the first one
+    :return: list of total times in seconds, one per round
+    """
+    port = free_port()
+    url = "http://127.0.0.1:{}".format(port)
+    server = subprocess.Popen(
+        [sys.executable, "graphyte_server.py", "-d", base_dir, "-p", str(port),
+         "-w", str(workers)] + options, cwd=GRAPHYTE_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + START_TIMEOUT
+        while True:
+            try:
+                request(url + "/status")
+                break
+            except OSError:
+                if server.poll() is not None or time.time() > deadline:
+                    sys.exit("graphyte_server.py did not start")
+                time.sleep(POLL_INTERVAL)
+        times = []
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            for identifier in identifiers:
+                request(url + "/jobs", {'id': identifier})
+            while True:
+                jobs = request(url + "/jobs")['jobs']
+                if all(job['state'] not in ("queued", "running")
+                       for job in jobs):
+                    break
+                time.sleep(POLL_INTERVAL)
+            times.append(time.perf_counter() - t0)
+            failed = [job['id'] for job in jobs if job['state'] != "done"]
+            if failed:
+                sys.exit("jobs failed: " + ", ".join(failed))
+        return times
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build copies of a synthetic graphyte model as archive "
+                    "jobs, with graphyte.py and with the build service.")
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS,
+                        help='Number of jobs.')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Build service workers.')
+    parser.add_argument('--rounds', type=int, default=2,
+                        help='Times the jobs are submitted to the service.')
+    parser.add_argument('--modules', type=int, default=DEFAULTS['modules'])
+    parser.add_argument('--templates', type=int, default=DEFAULTS['templates'],
+                        help='Templates per module.')
+    parser.add_argument('--param-rows', type=int, dest='param_rows',
+                        default=DEFAULTS['param_rows'],
+                        help='Rows of the parameter worksheet, 0 for none.')
+    parser.add_argument('--svg-shapes', type=int, dest='svg_shapes',
+                        default=DEFAULTS['svg_shapes'],
+                        help='Shapes per diagram.')
+    parser.add_argument('--flavor', choices=FLAVORS,
+                        default=DEFAULTS['flavor'], help='Diagram flavor.')
+    parser.add_argument('--cache', action='store_true',
+                        help='Use a render cache in both.')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the generated jobs.')
+    args = parser.parse_args()
+
+    model_params = dict(DEFAULTS, modules=args.modules,
+                        templates=args.templates, param_rows=args.param_rows,
+                        svg_shapes=args.svg_shapes, flavor=args.flavor)
+    tmp_dir = tempfile.mkdtemp(prefix="graphyte-bench-")
+    model_dir = os.path.join(tmp_dir, "model")
+    generate_model(model_dir, **model_params)
+    bin_dir = write_stubs(os.path.join(tmp_dir, "bin"))
+    env = os.environ.copy()
+    env["PATH"] = bin_dir + os.pathsep + env.get("PATH", "")
+    cache_options = ['--no-cache']
+    if args.cache:
+        cache_options = ['--cache-dir', os.path.join(tmp_dir, "cache")]
+
+    print("{} jobs, {} workers, {}".format(args.jobs, args.workers, ", ".join(
+        "{} {}".format(k, v) for k, v in sorted(model_params.items()))))
+    try:
+        cli_dir = os.path.join(tmp_dir, "cli")
+        cli_time = bench_cli(cli_dir, make_jobs(cli_dir, model_dir, args.jobs),
+                             env, cache_options)
+        server_dir = os.path.join(tmp_dir, "server")
+        server_times = bench_server(
+            server_dir, make_jobs(server_dir, model_dir, args.jobs), env,
+            args.workers, cache_options, args.rounds)
+    finally:
+        if args.keep:
+            print("jobs kept in " + tmp_dir)
+        else:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print("{:<24} {:>10} {:>10}".format("", "total ms", "per job ms"))
+    rows = [("graphyte.py -i", cli_time)]
+    rows += [("service, round {}".format(i + 1), t)
+             for i, t in enumerate(server_times)]
+    for name, t in rows:
+        print("{:<24} {:>10.1f} {:>10.1f}".format(
+            name, t * 1000, t * 1000 / args.jobs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""bench_svg_links.py
+
+Benchmark of SVG processing on synthetic diagrams with many hyperlinks.
+
+Generates diagrams with an increasing number of linked shapes, where
+every anchor spreads over several lines and the link is found some
+lines after the opening <a tag, and times both the streaming SVG
+processor and the line by line fallback. Time per link should stay
+roughly flat as the number of links grows.
+
+Usage: python3 benchmarks/bench_svg_links.py [max_links]
+
+"""
+
+# imports
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "graphyte", "utils"))
+import html_utils  # noqa: E402
+
+# info
+__author__ = "Jorge Somavilla"
+
+LINK_KINDS = ("file", "mod", "lit")
+
+
+class BenchModule(object):
+    """Minimal graphyte module, holding the attributes used by the
+    SVG processors.
+
+    """
+    def __init__(self, svg_path):
+        self.svg_path = svg_path
+        self.in_diagram_path = svg_path
+        self.svg_links = []
+        self.menu_items = "Routing, Switching"
+        self.model_no_sp = "Bench_Model"
+        self.version = "1.0"
+
+    def diagram_is_uml(self):
+        return False
+
+    def push_link(self, link):
+        self.svg_links.append(link)
+
+
+def make_svg(path, links):
+    """Writes a synthetic SVG diagram.
+
+    :param path: output path
+    :param links: number of hyperlinked shapes
+    :return: None
+    """
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" '
+                'xmlns:xlink="http://www.w3.org/1999/xlink" '
+                'width="2000px" height="2000px">\n<g>\n')
+        for i in range(links):
+            kind = LINK_KINDS[i % len(LINK_KINDS)]
+            if kind == "mod":
+                href = "mod:Routing.svg"
+            elif kind == "lit":
+                href = "lit:http://example.com/" + str(i)
+            else:
+                href = "templates/t" + str(i) + ".txt"
+            f.write('<a\n   id="a' + str(i) + '"\n   xlink:type="simple"\n'
+                    '   xlink:href="' + href + '">\n'
+                    '<rect x="' + str(i) + '" y="0" width="10" height="10"/>\n'
+                    '<text x="' + str(i) + '" y="5">shape ' + str(i) + '</text>\n'
+                    '</a>\n')
+        f.write('</g>\n</svg>\n')
+
+
+def timed(func, gm, repeat=3):
+    """Best of several runs.
+
+    :param func: SVG processor
+    :param gm: benchmark module
+    :param repeat: number of runs
+    :return: seconds
+    """
+    best = None
+    for _ in range(repeat):
+        gm.svg_links = []
+        t0 = time.perf_counter()
+        func(gm)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    max_links = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    sizes = [n for n in (1250, 2500, 5000, 10000, 20000) if n <= max_links]
+    processors = (("streaming", html_utils.process_svg),
+                  ("line by line", html_utils.process_svg_lines))
+    html_utils.logger.disabled = True
+    tmp_dir = tempfile.mkdtemp(prefix="graphyte-bench-")
+    print("{:>8} {:>14} {:>12} {:>14}".format(
+        "links", "processor", "seconds", "us per link"))
+    per_link = dict()
+    for n in sizes:
+        path = os.path.join(tmp_dir, "links_" + str(n) + ".svg")
+        make_svg(path, n)
+        gm = BenchModule(path)
+        for name, func in processors:
+            seconds = timed(func, gm)
+            per_link.setdefault(name, []).append(seconds / n)
+            print("{:>8} {:>14} {:>12.4f} {:>14.2f}".format(
+                n, name, seconds, seconds / n * 1e6))
+        os.remove(path)
+    os.rmdir(tmp_dir)
+    # cost per link of the largest diagram relative to the smallest one,
+    # close to 1 for linear scaling, proportional to size for quadratic
+    for name, values in per_link.items():
+        print("{}: per link cost ratio {}/{} links = {:.2f}".format(
+            name, sizes[-1], sizes[0], values[-1] / values[0]))
+
+
+if __name__ == '__main__':
+    main()
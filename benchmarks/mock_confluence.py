@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""mock_confluence.py
+
+Local mock of the Confluence REST API used by graphyte.
+
+Keeps pages and attachments in memory and counts the requests and
+bytes received, so Confluence publishing can be measured without a
+Confluence instance. A delay can be added to every request to
+simulate network round trips, and one request out of every N can be
+answered with 503 Service Unavailable to exercise retries.
+
+Implements the calls made by conflux.Conflux:
+
+GET  /                                       (test_connection)
+GET  /display/<space>/<title>                (get_page_id, parent page)
+GET  /rest/api/content/<id>                  (expand=space,body.storage)
+GET  /rest/api/content/<id>/history
+POST /rest/api/content
+PUT  /rest/api/content/<id>
+GET  /rest/api/content/<id>/child/page         (expand=version)
+GET  /rest/api/content/<id>/child/attachment
+POST /rest/api/content/<id>/child/attachment[/<att id>/data]
+GET  /download/attachments/<id>/<name>         (Range: bytes=<start>-)
+
+Usage: python3 benchmarks/mock_confluence.py [port] [latency] [fail every]
+
+"""
+
+# imports
+import json
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs, unquote
+
+# info
+__author__ = "Jorge Somavilla"
+
+PARENT_PAGE_ID = "1000"
+SPACE_KEY = "GRAPHYTE"
+
+
+class MockConfluence(object):
+    """In-memory Confluence content and request statistics.
+
+    Attributes:
+        pages (dict): Pages by id, with title, parent, body and version.
+        attachments (dict): Attachments by page id, then file name, with
+        id and data.
+        requests (Counter): Requests received, by method.
+        bytes_in (int): Request body bytes received.
+        connections (int): Connections opened by clients.
+        latency (float): Seconds every request is delayed.
+        fail_every (int): Answer every Nth request with a 503 error,
+        0 to never fail.
+
+    """
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.lock = threading.Lock()
+        self.next_id = int(PARENT_PAGE_ID)
+        self.pages = {PARENT_PAGE_ID: {
+            'title': 'Parent', 'parent': None, 'body': '', 'version': 1
+        }}
+        self.attachments = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.requests = Counter()
+        self.bytes_in = 0
+        self.connections = 0
+        self.failed = 0
+
+    def new_id(self):
+        self.next_id += 1
+        return str(self.next_id)
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, confluence):
+        HTTPServer.__init__(self, address, MockHandler)
+        self.confluence = confluence
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        c = self.server.confluence
+        with c.lock:
+            c.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_data(self, data, status=200, content_type="application/json"):
+        if not isinstance(data, (bytes, memoryview)):
+            data = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        """Reads the request body and counts the request.
+
+        :return: request body, None if the request is answered with
+         an injected error
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+        c = self.server.confluence
+        with c.lock:
+            c.requests[self.command] += 1
+            c.bytes_in += length
+            fail = c.fail_every and \
+                sum(c.requests.values()) % c.fail_every == 0
+            if fail:
+                c.failed += 1
+        if c.latency:
+            time.sleep(c.latency)
+        if fail:
+            self.send_data({'message': 'injected failure'}, 503)
+            return None
+        return data
+
+    def page_json(self, page_id, expand):
+        c = self.server.confluence
+        page = c.pages[page_id]
+        data = {
+            'id': page_id, 'type': 'page', 'title': page['title'],
+            'space': {'key': SPACE_KEY},
+            'version': {'number': page['version']},
+            '_links': {'webui': '/display/' + SPACE_KEY + '/' + page_id}
+        }
+        if 'body.storage' in expand:
+            data['body'] = {'storage': {'value': page['body'],
+                                        'representation': 'storage'}}
+        return data
+
+    def attachment_json(self, page_id, name, att):
+        return {
+            'id': att['id'], 'type': 'attachment', 'title': name,
+            'extensions': {'fileSize': len(att['data'])},
+            'metadata': {'comment': att.get('comment', '')},
+            'version': {'number': att['version']},
+            '_links': {'download': '/download/attachments/' + page_id + '/'
+                       + name}
+        }
+
+    def do_GET(self):
+        if self.read_body() is None:
+            return
+        c = self.server.confluence
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        path = url.path
+        m = re.match(
+            r'^/rest/api/content/(\d+)(/history|/child/attachment|/child/page)?/?$',
+            path)
+        if m and m.group(1) in c.pages:
+            page_id = m.group(1)
+            if m.group(2) == '/history':
+                return self.send_data({'lastUpdated': {
+                    'number': c.pages[page_id]['version']}})
+            if m.group(2) == '/child/page':
+                with c.lock:
+                    ids = sorted((i for i, pg in c.pages.items()
+                                  if pg['parent'] == page_id), key=int)
+                start = int(query.get('start', ['0'])[0])
+                limit = int(query.get('limit', ['25'])[0])
+                expand = query.get('expand', [''])[0]
+                results = [self.page_json(i, expand)
+                           for i in ids[start:start + limit]]
+                links = {}
+                if start + limit < len(ids):
+                    links['next'] = '/rest/api/content/' + page_id \
+                        + '/child/page?expand=' + expand + '&start=' \
+                        + str(start + limit) + '&limit=' + str(limit)
+                return self.send_data({'results': results,
+                                       'size': len(results),
+                                       '_links': links})
+            if m.group(2) == '/child/attachment':
+                atts = c.attachments.get(page_id, {})
+                names = sorted(atts)
+                if 'filename' in query:
+                    names = [n for n in names if n == query['filename'][0]]
+                start = int(query.get('start', ['0'])[0])
+                limit = int(query.get('limit', ['50'])[0])
+                results = [self.attachment_json(page_id, n, atts[n])
+                           for n in names[start:start + limit]]
+                links = {}
+                if start + limit < len(names):
+                    links['next'] = 'rest/api/content/' + page_id \
+                        + '/child/attachment?start=' + str(start + limit) \
+                        + '&limit=' + str(limit)
+                return self.send_data({'results': results,
+                                       'size': len(results),
+                                       '_links': links})
+            return self.send_data(self.page_json(
+                page_id, query.get('expand', [''])[0]))
+        m = re.match(r'^/download/attachments/(\d+)/(.+)$', path)
+        if m:
+            att = c.attachments.get(m.group(1), {}).get(unquote(m.group(2)))
+            if att is None:
+                return self.send_data({}, 404)
+            r = re.match(r'bytes=(\d+)-$', self.headers.get("Range", ""))
+            if r:
+                start = int(r.group(1))
+                if start >= len(att['data']):
+                    return self.send_data(b"", 416)
+                return self.send_data(memoryview(att['data'])[start:], 206,
+                                      content_type="application/octet-stream")
+            return self.send_data(att['data'],
+                                  content_type="application/octet-stream")
+        if path.startswith('/display/'):
+            return self.send_data(
+                ('<html><head><meta name="ajs-page-id" content="'
+                 + PARENT_PAGE_ID + '"></head></html>').encode("utf-8"),
+                content_type="text/html")
+        if path in ('', '/'):
+            return self.send_data(b'<html><title>Mock Confluence</title></html>',
+                                  content_type="text/html")
+        return self.send_data({'message': 'not found'}, 404)
+
+    def do_POST(self):
+        data = self.read_body()
+        if data is None:
+            return
+        c = self.server.confluence
+        path = urlparse(self.path).path
+        if path.rstrip('/') == '/rest/api/content':
+            content = json.loads(data.decode("utf-8"))
+            with c.lock:
+                page_id = c.new_id()
+                c.pages[page_id] = {
+                    'title': content['title'],
+                    'parent': str(content.get('ancestors', [{}])[0]
+                                  .get('id')),
+                    'body': content.get('body', {}).get('storage', {})
+                    .get('value', ''),
+                    'version': 1
+                }
+            return self.send_data(self.page_json(page_id, ''))
+        m = re.match(r'^/rest/api/content/(\d+)/child/attachment(/\w+/data)?/?$',
+                     path)
+        if m:
+            page_id = m.group(1)
+            name, file_data, comment = parse_multipart(
+                data, self.headers.get("Content-Type", ""))
+            with c.lock:
+                atts = c.attachments.setdefault(page_id, {})
+                att = atts.get(name)
+                if att is None:
+                    att = {'id': 'att' + c.new_id(), 'version': 0}
+                    atts[name] = att
+                att['data'] = file_data
+                att['comment'] = comment
+                att['version'] += 1
+            result = self.attachment_json(page_id, name, att)
+            if m.group(2):
+                return self.send_data(result)
+            return self.send_data({'results': [result], 'size': 1})
+        return self.send_data({'message': 'not found'}, 404)
+
+    def do_PUT(self):
+        data = self.read_body()
+        if data is None:
+            return
+        c = self.server.confluence
+        m = re.match(r'^/rest/api/content/(\d+)/?$', urlparse(self.path).path)
+        if not m or m.group(1) not in c.pages:
+            return self.send_data({'message': 'not found'}, 404)
+        content = json.loads(data.decode("utf-8"))
+        page = c.pages[m.group(1)]
+        with c.lock:
+            page['title'] = content.get('title', page['title'])
+            if 'body' in content:
+                page['body'] = content['body']['storage']['value']
+            page['version'] = content['version']['number']
+        return self.send_data(self.page_json(m.group(1), ''))
+
+
+def parse_multipart(data, content_type):
+    """Extracts the uploaded file of a multipart/form-data request.
+
+    :param data: request body
+    :param content_type: Content-Type header
+    :return: file name, file data, comment
+    """
+    boundary = re.search(r'boundary=([^;]+)', content_type).group(1)
+    name, file_data, comment = "", b"", ""
+    for part in data.split(b'--' + boundary.strip('"').encode("ascii")):
+        head, _, content = part.partition(b'\r\n\r\n')
+        content = content[:-2] if content.endswith(b'\r\n') else content
+        fname = re.search(rb'filename="([^"]*)"', head)
+        if fname:
+            name = fname.group(1).decode("utf-8")
+            file_data = content
+        elif b'name="comment"' in head:
+            comment = content.decode("utf-8")
+    return name, file_data, comment
+
+
+def start_server(port=0, latency=0.0, fail_every=0):
+    """Starts a mock Confluence server in a background thread.
+
+    :param port: optional. TCP port, 0 for any free port
+    :param latency: optional. Seconds every request is delayed
+    :param fail_every: optional. Answer every Nth request with a 503
+     error, 0 to never fail
+    :return: MockServer, base URL
+    """
+    server = MockServer(("127.0.0.1", port),
+                        MockConfluence(latency, fail_every))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:" + str(server.server_address[1])
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8090
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    fail_every = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    server = MockServer(("127.0.0.1", port),
+                        MockConfluence(latency, fail_every))
+    print("Mock Confluence on http://127.0.0.1:" + str(port)
+          + ", parent page /display/" + SPACE_KEY + "/Parent")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""synth_model.py
+
+Synthetic graphyte model generator.
+
+Writes an input files directory that graphyte builds as is, with a
+valid graphyte.conf, a CHANGES file, a parameter worksheet and one
+diagram per module, whose hyperlinked shapes open the module
+templates, other modules (mod:) and external pages (lit:). The model
+is tuned by:
+
+- number of modules, templates per module, lines per template and
+  parameters per template,
+- rows of the parameter worksheet (the variable list),
+- diagram shapes (SVG size) and hyperlinked shapes per diagram,
+- diagram flavor:
+  - plain: SVG diagrams with plain shapes and text,
+  - drawio: SVG diagrams as exported by draw.io, with HTML labels in
+    foreignObject elements,
+  - plantuml: UML diagrams, rendered to SVG by PlantUML.
+
+Also writes stand-ins of the external tools run by graphyte (java
+running PlantUML, pyang), so models are built offline and the time
+measured is graphyte's own. The PlantUML stand-in renders one shape per
+class of the diagram, linked if the class has a [[link]].
+
+Usage: python3 benchmarks/synth_model.py <output dir> [modules]
+       [templates] [flavor]
+
+"""
+
+# imports
+import os
+import stat
+import sys
+
+# info
+__author__ = "Jorge Somavilla"
+
+FLAVORS = ("plain", "drawio", "plantuml")
+MODEL_NAME = "Bench Model"
+MODEL_VERSION = "1.0"
+PARAMS_NAME = "params.xlsx"
+CHANGES_NAME = "CHANGES.txt"
+# parameter types, <name> <{name}> <(name)> <[name]>
+PARAM_FORMATS = ("<{}>", "<{{{}}}>", "<({})>", "<[{}]>")
+
+DEFAULTS = {
+    'modules': 8,
+    'templates': 10,
+    'template_lines': 40,
+    'template_params': 5,
+    'param_rows': 200,
+    'svg_shapes': 200,
+    'links': 20,
+    'flavor': "plain"
+}
+
+_JAVA_STUB = '''#!{python}
+"""Offline PlantUML stand-in written by synth_model.py."""
+import os
+import re
+import sys
+
+CLASS_RE = re.compile(r'^class (\\S+)(?: \\[\\[(.+)\\]\\])?')
+
+
+def svg(src):
+    shapes = []
+    for line in src.splitlines():
+        m = CLASS_RE.match(line)
+        if m is None:
+            continue
+        shape = ('<g><rect x="{{0}}" y="{{0}}" width="80" height="40"/>'
+                 '<text x="{{0}}" y="{{0}}">{{1}}</text></g>'
+                 .format(len(shapes) * 10, m.group(1)))
+        if m.group(2):
+            shape = '<a xlink:href="{{}}">{{}}</a>'.format(m.group(2), shape)
+        shapes.append(shape)
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+            '<svg xmlns="http://www.w3.org/2000/svg" '
+            'xmlns:xlink="http://www.w3.org/1999/xlink" width="1000px" '
+            'height="1000px" style="width:1000px;height:1000px;" '
+            'preserveAspectRatio="none"><g>' + "".join(shapes)
+            + '</g></svg>')
+
+
+args = sys.argv[1:]
+if "-version" in args:
+    print("PlantUML version 1.0 (stand-in)")
+elif "-pipe" in args:
+    delim = args[args.index("-pipedelimitor") + 1] \\
+        if "-pipedelimitor" in args else None
+    buf = []
+    for line in sys.stdin:
+        buf.append(line)
+        if line.strip().startswith("@enduml"):
+            sys.stdout.write(svg("".join(buf)) + "\\n")
+            if delim:
+                sys.stdout.write(delim + "\\n")
+            sys.stdout.flush()
+            buf = []
+else:
+    out = args[args.index("-o") + 1]
+    for a in args:
+        if a.endswith(".uml") and os.path.isfile(a):
+            with open(a) as f:
+                src = f.read()
+            name = os.path.splitext(os.path.basename(a))[0] + ".svg"
+            with open(os.path.join(out, name), "w") as f:
+                f.write(svg(src))
+'''
+
+_PYANG_STUB = '''#!{python}
+"""Offline pyang stand-in written by synth_model.py."""
+import os
+import sys
+
+args = sys.argv[1:]
+if "--version" in args:
+    print("pyang 2.5.3 (stand-in)")
+    sys.exit(0)
+out = args[args.index("-o") + 1]
+src = [a for a in args if a.endswith(".yang")][0]
+name = os.path.splitext(os.path.basename(src))[0].replace("-", "_")
+with open(out, "w") as f:
+    f.write("@startuml {{0}}\\nTitle {{1}}\\nclass {{1}}\\n@enduml\\n"
+            .format(out, name))
+'''
+
+
+def write_stubs(bin_dir):
+    """Writes the java and pyang stand-ins to a directory, to be put
+    first in PATH when building.
+
+    :param bin_dir: target directory
+    :return: bin_dir
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, source in (("java", _JAVA_STUB), ("pyang", _PYANG_STUB)):
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as f:
+            f.write(source.format(python=sys.executable))
+        os.chmod(path, os.stat(path).st_mode
+                 | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return bin_dir
+
+
+def param_name(index):
+    """Returns a worksheet parameter.
+
+    :param index: parameter index
+    :return: parameter, e.g. <{p12}>
+    """
+    return PARAM_FORMATS[index % len(PARAM_FORMATS)].format("p" + str(index))
+
+
+def module_name(index):
+    """Returns the name of a module.
+
+    :param index: module index
+    :return: module name
+    """
+    return "Module_" + str(index)
+
+
+def template_name(module, index):
+    """Returns the file name of a module template. Names are unique in
+    the model, templates are linked by name.
+
+    :param module: module index
+    :param index: template index
+    :return: template file name
+    """
+    return "m{}_t{}.txt".format(module, index)
+
+
+def write_params(path, rows):
+    """Writes the parameter worksheet.
+
+    :param path: worksheet path
+    :param rows: number of parameters
+    :return: None
+    """
+    # openpyxl is only needed to generate models with parameters
+    from openpyxl import Workbook
+    book = Workbook()
+    sheet = book.active
+    sheet.append(["Parameter", "Description", "Example"])
+    for i in range(rows):
+        sheet.append([param_name(i), "Parameter number " + str(i),
+                      "value-" + str(i)])
+    book.save(path)
+
+
+def write_template(path, module, index, lines, params, param_rows):
+    """Writes a template, every line using one of the template
+    parameters.
+
+    :param path: template path
+    :param module: module index
+    :param index: template index
+    :param lines: number of lines
+    :param params: number of parameters used by the template
+    :param param_rows: number of parameters in the worksheet
+    :return: None
+    """
+    names = []
+    if param_rows:
+        first = (module * 31 + index * 7) * params
+        names = [param_name((first + k) % param_rows) for k in range(params)]
+    with open(path, "w") as f:
+        f.write("! template {} of {}\n".format(index, module_name(module)))
+        for i in range(lines):
+            line = " setting-{} value {}".format(i, i * 10)
+            if names:
+                line += " " + names[i % len(names)]
+            f.write(line + "\n")
+
+
+def link_target(module, index, modules, templates, flavor):
+    """Returns the target of a hyperlinked shape: mostly templates, one
+    link out of five to the next module and one out of seven to an
+    external page.
+
+    :param module: module index
+    :param index: link index
+    :param modules: number of modules
+    :param templates: number of templates per module
+    :param flavor: diagram flavor
+    :return: link target
+    """
+    if index % 5 == 4 and modules > 1:
+        ext = ".uml" if flavor == "plantuml" else ".svg"
+        return "mod:" + module_name((module + 1) % modules) + ext
+    if index % 7 == 6 or not templates:
+        return "lit:https://example.com/" + str(index)
+    return "templates/" + template_name(module, index % templates)
+
+
+def write_svg(path, module, shapes, links, modules, templates, drawio):
+    """Writes an SVG diagram.
+
+    :param path: diagram path
+    :param module: module index
+    :param shapes: number of shapes
+    :param links: number of hyperlinked shapes
+    :param modules: number of modules
+    :param templates: number of templates per module
+    :param drawio: whether to write the diagram as exported by draw.io
+    :return: None
+    """
+    flavor = "drawio" if drawio else "plain"
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" '
+                'xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" '
+                'width="2000px" height="2000px" viewBox="0 0 2000 2000"')
+        if drawio:
+            f.write(' content="&lt;mxfile host=&quot;app.diagrams.net&quot; '
+                    'agent=&quot;draw.io&quot;&gt;&lt;/mxfile&gt;"')
+        f.write('>\n<defs/>\n<g>\n')
+        for i in range(max(shapes, links)):
+            x, y = (i * 37) % 1900, (i * 53) % 1900
+            label = "shape " + str(i)
+            if drawio:
+                shape = (
+                    '<rect x="{0}" y="{1}" width="80" height="40" '
+                    'fill="#ffffff" stroke="#000000" pointer-events="all"/>\n'
+                    '<g transform="translate(-0.5 -0.5)"><switch>'
+                    '<foreignObject pointer-events="none" width="100%" '
+                    'height="100%" requiredFeatures="http://www.w3.org/TR/'
+                    'SVG11/feature#Extensibility"><div xmlns="http://www.w3.'
+                    'org/1999/xhtml" style="display: flex; width: 78px;">'
+                    '<div style="font-size: 12px;">{2}</div></div>'
+                    '</foreignObject><text x="{0}" y="{1}" font-size="12px">'
+                    '{2}</text></switch></g>\n'
+                ).format(x, y, label)
+            else:
+                shape = ('<rect x="{0}" y="{1}" width="80" height="40"/>\n'
+                         '<text x="{0}" y="{1}">{2}</text>\n'
+                         ).format(x, y, label)
+            if i < links:
+                href = link_target(module, i, modules, templates, flavor)
+                shape = ('<a xlink:href="{}" id="link{}">\n{}</a>\n'
+                         .format(href, i, shape))
+            f.write(shape)
+        f.write('</g>\n</svg>\n')
+
+
+def write_uml(path, module, shapes, links, modules, templates):
+    """Writes a PlantUML class diagram, one class per shape.
+
+    :param path: diagram path
+    :param module: module index
+    :param shapes: number of classes
+    :param links: number of hyperlinked classes
+    :param modules: number of modules
+    :param templates: number of templates per module
+    :return: None
+    """
+    with open(path, "w") as f:
+        f.write("@startuml\n")
+        for i in range(max(shapes, links)):
+            line = "class C" + str(i)
+            if i < links:
+                line += " [[" + link_target(
+                    module, i, modules, templates, "plantuml") + "]]"
+            f.write(line + "\n")
+        f.write("@enduml\n")
+
+
+def generate_model(model_dir, modules=DEFAULTS['modules'],
+                   templates=DEFAULTS['templates'],
+                   template_lines=DEFAULTS['template_lines'],
+                   template_params=DEFAULTS['template_params'],
+                   param_rows=DEFAULTS['param_rows'],
+                   svg_shapes=DEFAULTS['svg_shapes'],
+                   links=DEFAULTS['links'], flavor=DEFAULTS['flavor']):
+    """Writes a synthetic graphyte model.
+
+    :param model_dir: input files directory, created if needed
+    :param modules: optional. Number of modules
+    :param templates: optional. Templates per module
+    :param template_lines: optional. Lines per template
+    :param template_params: optional. Worksheet parameters used by
+     every template
+    :param param_rows: optional. Parameters in the worksheet, 0 for no
+     worksheet
+    :param svg_shapes: optional. Shapes per diagram
+    :param links: optional. Hyperlinked shapes per diagram
+    :param flavor: optional. Diagram flavor, plain, drawio or plantuml
+    :return: list of module diagram file names
+    """
+    if flavor not in FLAVORS:
+        raise ValueError("Unknown diagram flavor: " + flavor)
+    os.makedirs(os.path.join(model_dir, "templates"), exist_ok=True)
+    os.makedirs(os.path.join(model_dir, "diagrams"), exist_ok=True)
+    ext = ".uml" if flavor == "plantuml" else ".svg"
+    diagrams = [module_name(m) + ext for m in range(modules)]
+    with open(os.path.join(model_dir, "graphyte.conf"), "w") as f:
+        f.write("[main]\nmodel = {}\nversion = {}\nchanges_file = {}\n\n"
+                .format(MODEL_NAME, MODEL_VERSION, CHANGES_NAME))
+        f.write("[layout]\ndiagram_order = {}\n\n".format(",".join(diagrams)))
+        if param_rows:
+            f.write("[parameters]\nauth_params = {}\n".format(PARAMS_NAME))
+    with open(os.path.join(model_dir, CHANGES_NAME), "w") as f:
+        f.write("v{}: synthetic model, {} modules\n".format(MODEL_VERSION,
+                                                          modules))
+    if param_rows:
+        write_params(os.path.join(model_dir, PARAMS_NAME), param_rows)
+    for m in range(modules):
+        for t in range(templates):
+            write_template(
+                os.path.join(model_dir, "templates", template_name(m, t)),
+                m, t, template_lines, template_params, param_rows
+            )
+        path = os.path.join(model_dir, "diagrams", diagrams[m])
+        if flavor == "plantuml":
+            write_uml(path, m, svg_shapes, links, modules, templates)
+        else:
+            write_svg(path, m, svg_shapes, links, modules, templates,
+                      flavor == "drawio")
+    return diagrams
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit("usage: synth_model.py <output dir> [modules] [templates] "
+                 "[flavor]")
+    model_dir = sys.argv[1]
+    modules = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULTS['modules']
+    templates = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULTS['templates']
+    flavor = sys.argv[4] if len(sys.argv) > 4 else DEFAULTS['flavor']
+    generate_model(model_dir, modules=modules, templates=templates,
+                   flavor=flavor)
+    bin_dir = write_stubs(os.path.abspath(model_dir).rstrip(os.sep) + "-bin")
+    print("Model written to " + model_dir + ", build it offline with:")
+    print("  PATH=" + bin_dir + ":$PATH python3 graphyte.py -d " + model_dir)
+
+
+if __name__ == '__main__':
+    main()
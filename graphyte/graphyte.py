@@ -2,8 +2,8 @@
 """graphyte.py
 
 Builds a graphyte model consisting on one or more modules. Each module
-is implemented via a dedicated call to graphyte_gen.py build_module
-function.
+is implemented via a dedicated call to graphyte_gen.py
+build_module_spec function.
 
 Takes as input the path to the directory containing model files, and
 optionally an identifier for the model.
@@ -11,6 +11,11 @@ optionally an identifier for the model.
 Generates the complete graphyte model consisting on one or several
 interconnected HTML modules.
 
+Models can be built in-process with build_model, which takes a
+BuildConfig and returns a BuildResult, without parsing arguments,
+printing to the console or exiting. The command line is a wrapper of
+build_model.
+
 Error Codes:
     100: No configuration file \"graphyte.conf\" found.
     101: Bad graphyte.conf format.
@@ -32,6 +37,9 @@ import os
 import argparse
 import shutil
 import logging
+import logging.handlers
+import multiprocessing
+import traceback
 import zipfile
 import configparser
 import json
@@ -40,29 +48,139 @@ import sys
 utils_path = os.path.abspath("utils")
 if utils_path not in sys.path:
     sys.path.insert(0, utils_path)
-from confluence_utils import build_confluence_page
+from confluence_utils import build_confluence_page, DEFAULT_CONCURRENCY, \
+    CONFLUENCE_STATE_NAME
+from index_utils import FileIndex
+from cache_utils import RenderCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from manifest_utils import MANIFEST_NAME, tool_version, load_manifest, \
+    save_manifest, module_inputs, module_is_current
+from template_utils import get_template_store
+from html_utils import prune_viewer_assets
+from search_utils import SEARCH_DOCS_DIR, build_search_index, \
+    remove_search_index
+from param_utils import load_param_sheet
+from trace_utils import Tracer, TRACE_NAME, remove_trace
 
 try:
-    from graphyte_gen import build_module
+    from graphyte_gen import build_module_spec, ModuleSpec, ModuleResult, \
+        BuildError
 except ImportError:
     print ("Couldn't import graphyte_gen.py module.")
     exit(1)
-except:
-    pass
 import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 # info
 __author__ = "Jorge Somavilla"
 
-# mark start time
-start_time = datetime.datetime.now()
-star_time_str = start_time.strftime("(%Y-%m-%d@%H:%M:%S)")
+# log handler of module builder worker processes
+worker_log_handler = None
+
+# work directory of builds without identifier
+DEFAULT_WORK_DIR = '/tmp/graphyte/work/'
+# log of the jobs built in a graphyte server base directory
+JOBS_LOG_NAME = "jobs.log"
 
 uml_no_options = [
     "uses", "leafref", "identity", "identityref", "typedef",
     "annotation", "import", "circles", "stereotypes"
 ]
 
+
+class BuildConfig(object):
+    """Settings of a model build, as given to graphyte.py on the
+    command line.
+
+    Attributes:
+        dir (str): Directory containing input files.
+        identifier (str): Session identifier (graphyte server only).
+        Input, output and work files are kept under
+        dir/archive/identifier, and the output is zipped.
+        jobs (int): Number of modules to build in parallel.
+        incremental (bool): Only rebuild modules whose input files
+        changed.
+        plantuml_server (bool): Render UML through a long-lived
+        PlantUML process instead of one process per diagram.
+        use_cache (bool): Use the pyang/PlantUML render cache.
+        cache_dir (str): Render cache directory.
+        cache_size (int): Maximum size of the render cache in MB.
+        clear_cache (bool): Empty the render cache before building.
+        lazy_templates (bool): Write templates to separate files loaded
+        by the viewer on demand.
+        shared_viewer (bool): Write the viewer CSS and JS once per
+        model.
+        search_index (bool): Build a full-text search index of the
+        model.
+        trace (bool): Write the build trace to the output directory.
+        work_dir (str): Work directory, the default one if empty.
+        publish (bool): Publish the model to Confluence if enabled in
+        graphyte.conf. Asks for the Confluence credentials.
+
+    """
+    def __init__(
+            self, dir, identifier="", jobs=1, incremental=False,
+            plantuml_server=True, use_cache=True, cache_dir=DEFAULT_CACHE_DIR,
+            cache_size=DEFAULT_CACHE_SIZE, clear_cache=False,
+            lazy_templates=False, shared_viewer=False, search_index=False,
+            trace=False, work_dir="", publish=False
+    ):
+        self.dir = dir
+        self.identifier = identifier
+        self.jobs = jobs
+        self.incremental = incremental
+        self.plantuml_server = plantuml_server
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.clear_cache = clear_cache
+        self.lazy_templates = lazy_templates
+        self.shared_viewer = shared_viewer
+        self.search_index = search_index
+        self.trace = trace
+        self.work_dir = work_dir
+        self.publish = publish
+
+
+class BuildResult(object):
+    """Outcome of a model build.
+
+    Attributes:
+        config (BuildConfig): Settings of the build.
+        ok (bool): Whether all modules were built.
+        error (Exception): Exception stopping the build, a BuildError
+        with the graphyte error code for input errors, None if built.
+        traceback (str): Formatted traceback of error, empty for a
+        BuildError.
+        model (str): Model name.
+        version (str): Model version.
+        model_dict (dict): Model files by module, as published to
+        Confluence.
+        modules (list): ModuleResult of every module, in build order.
+        out_dir (str): Output directory.
+        zip_file (str): Zipped output, empty if not zipped.
+        elapsed (float): Seconds taken by the build.
+        timings (dict): Seconds taken by every build stage, summed over
+        modules.
+        trace (list): Trace events of the build stages, None unless
+        requested by config.trace.
+
+    """
+    def __init__(self, config):
+        self.config = config
+        self.ok = False
+        self.error = None
+        self.traceback = ""
+        self.model = ""
+        self.version = ""
+        self.model_dict = dict()
+        self.modules = []
+        self.out_dir = ""
+        self.zip_file = ""
+        self.elapsed = 0.0
+        self.timings = dict()
+        self.trace = None
+
+
 def make_zip(src_dir, dst_dir, id):
     """Compress model files into a ZIP file.
 
@@ -77,63 +195,157 @@ def make_zip(src_dir, dst_dir, id):
     zipobj = zipfile.ZipFile(zf, 'w', zipfile.ZIP_DEFLATED)
     rootlen = len(src_dir)
     for base, dirs, files in os.walk(src_dir):
+        dirs[:] = [d for d in dirs if d != SEARCH_DOCS_DIR]
         for file in files:
+            if file in (MANIFEST_NAME, TRACE_NAME):
+                continue
             fn = os.path.join(base, file)
             zipobj.write(fn, fn[rootlen:])
     return zf
 
-def main(args):
-    """Generate graphyte model, consisting on one or several modules.
 
-    Calls build_module function from graphyte_gen.py once per module.
+def append_jobs_log(basedir, identifier, model, version, num_modules):
+    """Adds the entry of a job to the jobs log of a graphyte server.
 
-    :param args: Directory containing input files. Optionally graphyte
-    transaction identifier.
-    :return:None
+    :param basedir: graphyte server base directory
+    :param identifier: identifier of the job
+    :param model: model name
+    :param version: model version
+    :param num_modules: number of modules built
+    :return: None
     """
-    ############################################
-    # Argument Parser                          #
-    ############################################
-    usage = "\nusage: graphyte.py -d|--dir input_files_directory"
+    with open(os.path.join(basedir, JOBS_LOG_NAME), "a") as f:
+        f.write("{}\n    {} {} - {} modules\n".format(
+            identifier, model, version, num_modules))
 
-    class MyParser(argparse.ArgumentParser):
-        """Argument Parser class handles inputs.
 
-        Returns the ArgumentParser object.
+def init_worker(log_queue):
+    """Initialize a module builder worker process.
 
-        Throws error if malformed arguments.
+    Worker log records are sent back to the parent process, which
+    writes them to graphyte.log.
 
-        """
-        def error(self, message):
-            """Error if malformed argument. Attach "usage" help.
+    :param log_queue: queue consumed by the parent's log listener
+    :return: None
+    """
+    global worker_log_handler
+    worker_log_handler = logging.handlers.QueueHandler(log_queue)
+    logger = logging.getLogger('graphyte')
+    logger.handlers = []
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
 
-            :param message: Error message
-            :return: None
-            """
-            logger = logging.getLogger('graphyte')
-            logger.error('error: %s\n' % message)
-            sys.stderr.write('error: %s\n' % message)
-            print (usage)
-            sys.exit(2)
 
-    parser = MyParser()
-    parser.add_argument('-d', '--dir', required=True,
-                        help='Directory containing input files.')
-    parser.add_argument('-i', '--id', required=False,
-                        help='Session identifier (for use on graphyte server only).')
-    args = parser.parse_args()
+def run_module(spec, file_index, param_sheet):
+    """Build one module in a worker process.
 
-    basedir = ""
-    if args.dir == '':
-        sys.exit(usage)
-    else:
-        basedir = args.dir.strip()
-        if not os.path.exists(basedir):
-            parser.error("Couldn't find directory: " + basedir)
+    Log records of the module are held back and sent to the parent
+    when the module is done, so each module shows up in graphyte.log
+    as one contiguous block.
+
+    :param spec: ModuleSpec of the module
+    :param file_index: FileIndex of the model input files
+    :param param_sheet: ParamSheet of the model, None if not available
+    :return: ModuleResult
+    """
+    logger = logging.getLogger('graphyte')
+    module_log = logging.handlers.MemoryHandler(
+        capacity=sys.maxsize, flushLevel=logging.CRITICAL + 1,
+        target=worker_log_handler
+    )
+    logger.addHandler(module_log)
+    logger.info("     Processing module {}\r\n".format(
+        os.path.basename(spec.diagram_path)))
+    try:
+        return build_module_spec(spec, file_index, param_sheet)
+    finally:
+        logger.removeHandler(module_log)
+        module_log.close()
+
+
+def build_modules(module_specs, file_index, param_sheet, jobs, logger,
+                  render_cache=None):
+    """Build all modules, optionally in parallel worker processes.
+
+    Results are yielded in the same order as module_specs, so the
+    caller processes them exactly as in a serial run.
+
+    :param module_specs: list of (module, ModuleSpec) tuples
+    :param file_index: FileIndex of the model input files
+    :param param_sheet: ParamSheet of the model, None if not available
+    :param jobs: number of modules to build at the same time
+    :param logger: the graphyte logger
+    :param render_cache: optional. RenderCache shared by the modules
+     built in this process
+    :return: generator of (module, ModuleResult) tuples
+    """
+    if jobs <= 1:
+        for module, spec in module_specs:
+            logger.info("     Processing module {}\r\n".format(module))
+            yield module, build_module_spec(spec, file_index, param_sheet,
+                                            render_cache)
+        return
+
+    log_queue = multiprocessing.Queue()
+    listener = logging.handlers.QueueListener(
+        log_queue, *logger.handlers, respect_handler_level=True
+    )
+    listener.start()
+    executor = ProcessPoolExecutor(
+        max_workers=jobs, initializer=init_worker, initargs=(log_queue,)
+    )
+    futures = []
+    try:
+        for module, spec in module_specs:
+            futures.append(
+                (module, spec, executor.submit(
+                    run_module, spec, file_index, param_sheet
+                ))
+            )
+        for module, spec, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                # the worker process died or the result was lost
+                logger.error("     Exception building module: {}\r\n"
+                             .format(repr(e)))
+                result = ModuleResult(spec, error=e,
+                                      traceback=traceback.format_exc())
+            yield module, result
+    finally:
+        for module, spec, future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+        listener.stop()
+
+
+def build_model(config, render_cache=None):
+    """Generate graphyte model, consisting on one or several modules.
+
+    Calls build_module_spec function from graphyte_gen.py once per
+    module. Nothing is printed to the console unless the model is
+    published to Confluence, and errors are returned in the result
+    instead of exiting.
 
-    identifier = ""
-    if args.id:
-        identifier = args.id.strip()
+    :param config: BuildConfig of the build
+    :param render_cache: optional. RenderCache to use instead of the
+     one of config, e.g. kept open by a long-running process
+    :return: BuildResult
+    """
+    result = BuildResult(config)
+    start_time = datetime.datetime.now()
+    star_time_str = start_time.strftime("(%Y-%m-%d@%H:%M:%S)")
+
+    basedir = config.dir.strip()
+    if not basedir or not os.path.exists(basedir):
+        result.error = BuildError("Couldn't find directory: " + basedir)
+        return result
+    if config.jobs < 1:
+        result.error = BuildError("Number of jobs must be at least 1: "
+                                  + str(config.jobs))
+        return result
+    identifier = config.identifier.strip()
+    jobs = config.jobs
 
     # Create relevant directories
     zip_dir = ""
@@ -146,18 +358,24 @@ def main(args):
     else:
         in_dir = basedir
         out_dir = basedir + '/www/'
-        work_dir = '/tmp/graphyte/work/'
+        work_dir = DEFAULT_WORK_DIR
         zip_dir = basedir + '/zip/'
+    if config.work_dir:
+        work_dir = config.work_dir
+    result.out_dir = out_dir
 
     # TODO: Directories sanity checks
 
     # create output directory if doesn't exist
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
-    # empty work directory if exists
-    if os.path.exists(work_dir):
+    # empty work directory if exists, unless its contents may be reused
+    # by an incremental build
+    incremental = config.incremental
+    if os.path.exists(work_dir) and not incremental:
         shutil.rmtree(work_dir)
-    os.makedirs(work_dir)
+    if not os.path.exists(work_dir):
+        os.makedirs(work_dir)
 
     # Logging
     # - CRITICAL: logging.critical(' message\r\n')
@@ -187,245 +405,294 @@ def main(args):
     if identifier:
         logger.info('     Job ID: ' + identifier + '\r\n')
 
-    def die(message):
+    # build stages trace
+    tracer = Tracer()
+    build_stage = tracer.begin("graphyte")
+
+    def die(message, code=None):
         """Stop execution and return an error code.
 
-        :param message: the error code
+        :param message: the error message
+        :param code: the error code
         :return: None
         """
-        logger.error(message)
-        elapsed = datetime.datetime.now() - start_time
-        logger.info("     Elapsed time {}s".format(elapsed))
-        if identifier:
-            make_zip(out_dir, zip_dir, identifier)
-        print (message)
-        sys.exit(1)
+        raise BuildError(message, code)
 
-    # Build graphyte_gen calls
-    #  1. Analyze input files
-    #     1.1 Process graphyte.conf file
-    #        1.1.1 Get main_title
-    #        1.1.2 Get version
-    #        1.1.3 Get param list
-    #        1.1.4 Get diagram order
-    #        1.1.5 Get diagram_ignore_list
-    #        1.1.6 Get pyang_no_uml
-    #  2. Input files sanity checks
-    #     2.1 Check number of modules
-    #     2.2 Check param sheet file
-    #  3. Build calls and execute
-    #     3.1 Build navigation menu
-    #     3.2 Loop through modules
-    #         3.2.1 build_module
-
-    # 1.
-    conf_file = ""
-    mod_dict = dict()
-    sheet = ""
-    sheet_name = ""
-    file_dict = dict()
-    repeated_fnames = []
-    model_dict = dict()
-    for base, dirs, files in os.walk(in_dir):
-        for file in files:
-            fname = os.path.splitext(file)[0]
+    try:
+        # Build graphyte_gen calls
+        #  1. Analyze input files
+        #     1.1 Process graphyte.conf file
+        #        1.1.1 Get main_title
+        #        1.1.2 Get version
+        #        1.1.3 Get param list
+        #        1.1.4 Get diagram order
+        #        1.1.5 Get diagram_ignore_list
+        #        1.1.6 Get pyang_no_uml
+        #  2. Input files sanity checks
+        #     2.1 Check number of modules
+        #     2.2 Check param sheet file
+        #  3. Build calls and execute
+        #     3.1 Build navigation menu
+        #     3.2 Loop through modules
+        #         3.2.1 build_module_spec
+
+        # 1.
+        conf_file = ""
+        mod_dict = dict()
+        sheet = ""
+        sheet_name = ""
+        file_dict = dict()
+        model_dict = result.model_dict
+        # walk input files directory once, the index is shared by all modules
+        stage = tracer.begin("file_walk")
+        file_index = FileIndex(in_dir)
+        for entry in file_index.entries:
+            file = entry.name
             fext = os.path.splitext(file)[1]
-            fpath = os.path.join(base, file)
-            if fname in file_dict:
-                repeated_fnames.append(fpath)
-            else:
-                file_dict[file] = fpath
+            fpath = entry.path
+            file_dict[file] = fpath
             if file == 'graphyte.conf':
                 logger.info(
                     "     Processing configuration file graphyte.conf.\r\n"
                 )
-                conf_file = os.path.join(base, file)
+                conf_file = fpath
             elif fext == '.svg' or fext == '.uml' or fext == '.yang':
                 mod_dict[file] = fpath
 
-    # 1.1
-    if not conf_file:
-        die(
-            "    Error 100: No configuration file \"graphyte.conf\" found, aborting execution.\r\n"
-        )
+        tracer.end(stage)
 
-    conf_parser = configparser.RawConfigParser()
-    try:
-        conf_parser.read(conf_file)
-    except Exception as e:
-        die("    Error 101: Bad graphyte.conf format.")
+        # 1.1
+        stage = tracer.begin("config_parse")
+        if not conf_file:
+            die(
+                "    Error 100: No configuration file \"graphyte.conf\" found, aborting execution.\r\n", 100
+            )
 
-    # 1.1.1
-    model = ""
-    try:
-        model = conf_parser.get('main', 'model')
-        logger.info("         model:          {}\r\n".format(model))
-    except:
-        die(
-            "    Error 102: No \"model\" entry found on graphyte.conf file, aborting execution.\r\n"
-        )
-
-    # 1.1.2
-    version = ""
-    try:
-        version = conf_parser.get('main', 'version')
-        logger.info("         version:        {}\r\n".format(version))
-    except:
-        die(
-            "    Error 103: No \"version\" entry found on graphyte.conf file, aborting execution.\r\n"
-        )
-
-    dict_p = model + ' v' + version + ' ' + star_time_str
-    model_dict[dict_p] = {}
-
-    # 1.1.2
-    changes = ""
-    changesfile = ""
-    try:
-        changes = conf_parser.get('main', 'changes_file')
-        logger.info("         changes_file:        {}\r\n".format(changes))
-    except:
-        pass
-    if changes:
-        if changes in file_dict:
-            changesfile = file_dict[changes]
-            model_dict[dict_p]['changesfile'] = changesfile
-        else:
-            die("    Error 106: File \"{}\" not found.\r\n".format(param_ref))
+        conf_parser = configparser.RawConfigParser()
+        try:
+            conf_parser.read(conf_file)
+        except Exception as e:
+            die("    Error 101: Bad graphyte.conf format.", 101)
 
-    # 1.1.3
-    param_ref = ""
-    try:
-        param_ref = conf_parser.get('parameters', 'auth_params')
-        logger.info("         auth_params:    {}\r\n".format(param_ref))
-    except:
-        pass
-    if param_ref:
-        if param_ref in file_dict:
-            sheet_name = param_ref
-            sheet = file_dict[sheet_name]
-            model_dict[dict_p]['auth_params'] = sheet
-        else:
-            die("    Error 106: File \"{}\" not found.\r\n".format(param_ref))
+        # 1.1.1
+        model = ""
+        try:
+            model = conf_parser.get('main', 'model')
+            logger.info("         model:          {}\r\n".format(model))
+        except configparser.Error:
+            die(
+                "    Error 102: No \"model\" entry found on graphyte.conf file, aborting execution.\r\n", 102
+            )
+        result.model = model
 
-    # 1.1.4
-    diagram_order = ""
-    try:
-        diagram_order = conf_parser.get('layout', 'diagram_order')
-        logger.info("         diagram_order:  {}\r\n".format(diagram_order))
-    except:
-        pass
+        # 1.1.2
+        version = ""
+        try:
+            version = conf_parser.get('main', 'version')
+            logger.info("         version:        {}\r\n".format(version))
+        except configparser.Error:
+            die(
+                "    Error 103: No \"version\" entry found on graphyte.conf file, aborting execution.\r\n", 103
+            )
+        result.version = version
 
-    # 1.1.5
-    diagram_ignore_list = list()
-    try:
-        s = conf_parser.get('layout', 'diagram_ignore_list')
-        logger.info("         diagram_ignore_list:  {}\r\n".format(s))
-        diagram_ignore_list = s.split(",")
-    except:
-        pass
-    for d in diagram_ignore_list:
-        logger.info("         removing {} from modules\r\n".format(d))
-        mod_dict.pop(d.strip(), None)
-
-    # 1.1.6
-    uml_no = ""
-    pyang_uml_no = ""
-
-    first = True
-    try:
-        uml_no = conf_parser.get('layout', 'pyang_uml_no')
-        logger.info("         pyang_uml_no:  {}\r\n".format(uml_no))
-    except:
-        pass
-    if uml_no:
-        for u in uml_no.split(","):
-            if not u in uml_no_options:
-                die("    Error 107: pyang_uml_no option \"{}\" not valid."
-                    " Valid options are: uses, leafref, identity, identityref,"
-                    " typedef, annotation, import, circles, stereotypes\r\n".format(param_ref))
+        dict_p = model + ' v' + version + ' ' + star_time_str
+        model_dict[dict_p] = {}
+
+        # 1.1.2
+        changes = ""
+        changesfile = ""
+        try:
+            changes = conf_parser.get('main', 'changes_file')
+            logger.info("         changes_file:        {}\r\n".format(changes))
+        except configparser.Error:
+            pass
+        if changes:
+            if changes in file_dict:
+                changesfile = file_dict[changes]
+                model_dict[dict_p]['changesfile'] = changesfile
             else:
-                if first == False:
-                    pyang_uml_no = pyang_uml_no + ","
-                else:
-                    first = False
-                pyang_uml_no = pyang_uml_no + u
+                die("    Error 106: File \"{}\" not found.\r\n".format(changes), 106)
 
-    # test mode
-    test_mode = False
-    try:
-        test_mode = conf_parser.get('hidden', 'test_mode')
-    except:
-        pass
+        # 1.1.3
+        param_ref = ""
+        try:
+            param_ref = conf_parser.get('parameters', 'auth_params')
+            logger.info("         auth_params:    {}\r\n".format(param_ref))
+        except configparser.Error:
+            pass
+        if param_ref:
+            if param_ref in file_dict:
+                sheet_name = param_ref
+                sheet = file_dict[sheet_name]
+                model_dict[dict_p]['auth_params'] = sheet
+            else:
+                die("    Error 106: File \"{}\" not found.\r\n".format(param_ref), 106)
 
+        # 1.1.4
+        diagram_order = ""
+        try:
+            diagram_order = conf_parser.get('layout', 'diagram_order')
+            logger.info("         diagram_order:  {}\r\n".format(diagram_order))
+        except configparser.Error:
+            pass
 
-    # Confluence Options
-    confluence_enabled = False
-    confluence_parent = ''
-    confluence_url = ''
-    confluence_script = ''
-    try:
-        confluence_enabled = conf_parser.get('confluence', 'enabled')
-        if confluence_enabled == "True":
-            confluence_enabled = True
-        else:
-            confluence_enabled = False
-    except:
-        pass
-    logger.info("         confluence enabled:          {}\r\n".format(str(confluence_enabled)))
-    if confluence_enabled:
+        # 1.1.5
+        diagram_ignore_list = list()
         try:
-            confluence_url = conf_parser.get('confluence', 'conf_base_url')
-        except ValueError:
-            die("    Error 110: Missing confluence base url conf_base_url is required.\r\n")
-        logger.info("         confluence conf_base_url:          {}\r\n".format(confluence_url))
+            s = conf_parser.get('layout', 'diagram_ignore_list')
+            logger.info("         diagram_ignore_list:  {}\r\n".format(s))
+            diagram_ignore_list = s.split(",")
+        except configparser.Error:
+            pass
+        for d in diagram_ignore_list:
+            logger.info("         removing {} from modules\r\n".format(d))
+            mod_dict.pop(d.strip(), None)
+
+        # 1.1.6
+        uml_no = ""
+        pyang_uml_no = ""
+
+        first = True
         try:
-            confluence_parent = conf_parser.get('confluence', 'parent_page_url')
-        except ValueError:
-            die("    Error 111: Missing confluence parent_page_url is required.\r\n")
-        logger.info("         confluence parent_page_url:          {}\r\n".format(confluence_parent))
+            uml_no = conf_parser.get('layout', 'pyang_uml_no')
+            logger.info("         pyang_uml_no:  {}\r\n".format(uml_no))
+        except configparser.Error:
+            pass
+        if uml_no:
+            for u in uml_no.split(","):
+                if not u in uml_no_options:
+                    die("    Error 107: pyang_uml_no option \"{}\" not valid."
+                        " Valid options are: uses, leafref, identity, identityref,"
+                        " typedef, annotation, import, circles, stereotypes\r\n".format(u), 107)
+                else:
+                    if first == False:
+                        pyang_uml_no = pyang_uml_no + ","
+                    else:
+                        first = False
+                    pyang_uml_no = pyang_uml_no + u
+
+        # test mode
+        test_mode = False
         try:
-            confluence_script = conf_parser.get('confluence', 'post_script')
-            logger.info("         confluence post_script:          {}\r\n".format(confluence_script))
-        except:
+            test_mode = conf_parser.get('hidden', 'test_mode')
+        except configparser.Error:
             pass
 
 
-    # 2.
-    if len(mod_dict) == 0:
-        die(
-            "    Error 104: At least one .svg, .uml or .yang file is required, aborting execution.\r\n"
-        )
-    if param_ref and not param_ref == sheet_name:
-        logger.warning(
-            ("  201: param_ref = \"{}\" not found among uploaded files, skipping parameter validation.\r\n")
-            .format(param_ref)
-        )
-    sheet_option = []
-    if sheet:
-        sheet_option.append('-s')
-        sheet_option.append(sheet)
-    changes_option = []
-    if changesfile:
-        changes_option.append('-c')
-        changes_option.append(changesfile)
-
-    # todo: if any elements in repeated_fnames[] list,
-    # issue warning to logfile, continue
-
-
-    # 3.
-    # 3.1
-    nav_menu = ""
-    count = 0
-    error_items = []
-    if diagram_order:
-        diagram_order_list = [x.strip() for x in diagram_order.split(',') if x != '']
-        for d in diagram_order_list:
-            if d in mod_dict:
-                model_dict[dict_p][d] = {'modpath':mod_dict[d]}
+        # Confluence Options
+        confluence_enabled = False
+        confluence_parent = ''
+        confluence_url = ''
+        confluence_script = ''
+        confluence_concurrency = DEFAULT_CONCURRENCY
+        confluence_sync = False
+        try:
+            confluence_enabled = conf_parser.get('confluence', 'enabled')
+            if confluence_enabled == "True":
+                confluence_enabled = True
+            else:
+                confluence_enabled = False
+        except configparser.Error:
+            pass
+        logger.info("         confluence enabled:          {}\r\n".format(str(confluence_enabled)))
+        if confluence_enabled:
+            try:
+                confluence_url = conf_parser.get('confluence', 'conf_base_url')
+            except configparser.Error:
+                die("    Error 110: Missing confluence base url conf_base_url is required.\r\n", 110)
+            logger.info("         confluence conf_base_url:          {}\r\n".format(confluence_url))
+            try:
+                confluence_parent = conf_parser.get('confluence', 'parent_page_url')
+            except configparser.Error:
+                die("    Error 111: Missing confluence parent_page_url is required.\r\n", 111)
+            logger.info("         confluence parent_page_url:          {}\r\n".format(confluence_parent))
+            try:
+                confluence_script = conf_parser.get('confluence', 'post_script')
+                logger.info("         confluence post_script:          {}\r\n".format(confluence_script))
+            except configparser.Error:
+                pass
+            try:
+                confluence_concurrency = conf_parser.getint('confluence', 'concurrency')
+            except (configparser.Error, ValueError):
+                pass
+            confluence_concurrency = max(1, confluence_concurrency)
+            logger.info("         confluence concurrency:          {}\r\n".format(confluence_concurrency))
+            try:
+                confluence_sync = conf_parser.get('confluence', 'sync') == "True"
+            except configparser.Error:
+                pass
+            logger.info("         confluence sync:          {}\r\n".format(str(confluence_sync)))
+
+        tracer.end(stage)
+
+
+        # 2.
+        if len(mod_dict) == 0:
+            die(
+                "    Error 104: At least one .svg, .uml or .yang file is required, aborting execution.\r\n", 104
+            )
+        if param_ref and not param_ref == sheet_name:
+            logger.warning(
+                ("  201: param_ref = \"{}\" not found among uploaded files, skipping parameter validation.\r\n")
+                .format(param_ref)
+            )
+        if config.clear_cache:
+            logger.info("     Clearing render cache {}\r\n".format(config.cache_dir))
+            RenderCache(config.cache_dir, config.cache_size).clear()
+        if render_cache is None and config.use_cache:
+            render_cache = RenderCache(config.cache_dir, config.cache_size)
+        if not config.use_cache:
+            render_cache = None
+
+        # todo: if any elements in file_index.repeated list,
+        # issue warning to logfile, continue
+
+
+        # 3.
+        # 3.1
+        nav_menu = ""
+        count = 0
+        error_items = []
+        if diagram_order:
+            diagram_order_list = [x.strip() for x in diagram_order.split(',') if x != '']
+            for d in diagram_order_list:
+                if d in mod_dict:
+                    model_dict[dict_p][d] = {'modpath':mod_dict[d]}
+                    if not count == 0:
+                        nav_menu += ','
+                    d_name = os.path.splitext(d)[0]
+                    d_ext = os.path.splitext(d)[1]
+                    d_name_ext = d_name + d_ext
+                    if d_ext == ".yang":
+                        nav_menu += d_name_ext
+                    else:
+                        nav_menu += d_name
+                    count += 1
+                else:
+                    error_items.append(d)
+            if error_items:
+                die(
+                    "    Error 105: Bad diagram_order in graphyte.conf. The following files were not found: " + ', '
+                    .join(error_items) + "\r\n", 105
+                )
+            for g in mod_dict:
+                if g not in diagram_order_list:
+                    model_dict[dict_p][g] = {'modpath': mod_dict[g]}
+                    g_name = os.path.splitext(g)[0]
+                    g_ext = os.path.splitext(g)[1]
+                    g_name_ext = g_name + g_ext
+                    if g_ext == ".yang":
+                        nav_menu += ','
+                        nav_menu += g_name_ext
+                    else:
+                        nav_menu += ','
+                        nav_menu += g_name
+        else:
+            for d in mod_dict:
                 if not count == 0:
                     nav_menu += ','
+
                 d_name = os.path.splitext(d)[0]
                 d_ext = os.path.splitext(d)[1]
                 d_name_ext = d_name + d_ext
@@ -434,120 +701,303 @@ def main(args):
                 else:
                     nav_menu += d_name
                 count += 1
-            else:
-                error_items.append(d)
-        if error_items:
-            die(
-                "    Error 105: Bad diagram_order in graphyte.conf. The following files were not found: " + ', '
-                .join(error_items) + "\r\n"
+                model_dict[dict_p][d] = {'modpath': mod_dict[d]}
+
+
+        # 3.2
+        num_modules = 0
+        module_specs = []
+        module_settings = dict()
+        run_dir = os.path.dirname(os.path.realpath(__file__))
+        tool = tool_version(run_dir)
+        manifest = dict()
+        if incremental:
+            manifest = load_manifest(out_dir, tool)
+        new_manifest = dict()
+        for module, mod_path in mod_dict.items():
+            # 3.2.1
+            mod_ext = os.path.splitext(mod_path)[1] # module extension
+            mod_name = os.path.splitext(module)[0] # module name w/o extension
+            if mod_ext == ".yang":
+                mod_name = mod_name + mod_ext # include extension if .yang
+            spec = ModuleSpec(
+                mod_path, out_dir, model, version, mod_name, in_dir,
+                nav=nav_menu, sheet=sheet, work_dir=work_dir,
+                uml_no=pyang_uml_no if mod_ext == ".yang" else "",
+                changes_file=changesfile,
+                plantuml_server=config.plantuml_server,
+                use_cache=config.use_cache, cache_dir=config.cache_dir,
+                cache_size=config.cache_size,
+                lazy_templates=config.lazy_templates,
+                shared_viewer=config.shared_viewer,
+                search_index=config.search_index, trace=config.trace
             )
-        for g in mod_dict:
-            if g not in diagram_order_list:
-                model_dict[dict_p][g] = {'modpath': mod_dict[g]}
-                g_name = os.path.splitext(g)[0]
-                g_ext = os.path.splitext(g)[1]
-                g_name_ext = g_name + g_ext
-                if g_ext == ".yang":
-                    nav_menu += ','
-                    nav_menu += g_name_ext
-                else:
-                    nav_menu += ','
-                    nav_menu += g_name
-    else:
-        for d in mod_dict:
-            if not count == 0:
-                nav_menu += ','
-
-            d_name = os.path.splitext(d)[0]
-            d_ext = os.path.splitext(d)[1]
-            d_name_ext = d_name + d_ext
-            if d_ext == ".yang":
-                nav_menu += d_name_ext
-            else:
-                nav_menu += d_name
-            count += 1
-            model_dict[dict_p][d] = {'modpath': mod_dict[d]}
-
-
-    # 3.2
-    num_modules = 0
-    for module, mod_path in mod_dict.items():
-        # 3.2.1
-        sheet_option_cmd = ""
-        mod_ext = os.path.splitext(mod_path)[1] # module extension
-        mod_name = os.path.splitext(module)[0] # module name w/o extension
-        if len(sheet_option) > 1:
-            sheet_option_cmd = sheet_option[0] + " \"" + sheet_option[1] + "\""
-        else:
-            sheet_option_cmd = ""
-        if len(changes_option) > 1:
-            changes_option_cmd = changes_option[0] + " \"" + changes_option[1] + "\""
-        else:
-            changes_option_cmd = ""
-        uml_no_option_cmd = ""
-        pyang_uml_no_option = []
-        if mod_ext == ".yang":
-            uml_no_option_cmd = "--uml-no " + pyang_uml_no
-            pyang_uml_no_option.append('-u')
-            pyang_uml_no_option.append(pyang_uml_no)
-            mod_name = mod_name + mod_ext # include extension if .yang
-        logger.info("     Processing module {}\r\n".format(module))
-        command = "\n\n------------------------------------------------------------------------------\n\n" \
-                  "python3 graphyte_gen.py -i \"{}\" -o \"{}\" -M \"{}\" -V \"{}\" -m \"{}\" -d \"{}\" -n \"{}\" -w \"{}\" {} {}"\
-            .format(mod_path, out_dir, model, version, mod_name, in_dir, nav_menu, work_dir, sheet_option_cmd, uml_no_option_cmd, changes_option_cmd,)
-        result = ""
-        if test_mode:
-            logger.info("     {}\r\n".format(command))
+            if incremental:
+                settings = {
+                    'model': model, 'version': version, 'module': mod_name,
+                    'out_dir': out_dir, 'work_dir': work_dir, 'nav': nav_menu,
+                    'sheet': sheet, 'changes': changesfile, 'uml_no': pyang_uml_no
+                    if mod_ext == ".yang" else "", 'lazy': config.lazy_templates,
+                    'shared_viewer': config.shared_viewer,
+                    'search': config.search_index
+                }
+                module_settings[module] = settings
+                entry = manifest.get(module, {})
+                inputs = module_inputs(
+                    mod_path, entry.get('files', {}).get('svglinks', []),
+                    file_index, settings
+                )
+                if module_is_current(entry, inputs):
+                    logger.info("     Reusing module {}\r\n".format(module))
+                    model_dict[dict_p][module].update(entry['files'])
+                    new_manifest[module] = entry
+                    result.modules.append(ModuleResult(
+                        spec, ok=True, files=entry['files'], reused=True))
+                    num_modules += 1
+                    continue
+            if test_mode:
+                logger.info("     {}\r\n".format(spec.command()))
+            module_specs.append((module, spec))
+
+        # parse the parameter worksheet once, all modules share it
+        param_sheet = None
+        if sheet and module_specs:
+            try:
+                with tracer.stage("load_param_sheet"):
+                    param_sheet = load_param_sheet(sheet, render_cache)
+            except Exception as e:
+                logger.warning("     Could not parse {}: {}\r\n".format(sheet, repr(e)))
+
+        stage = tracer.begin("build_modules", jobs=jobs)
+        builds = build_modules(module_specs, file_index, param_sheet, jobs,
+                               logger, render_cache)
         try:
-            print(command)
-            result,mod_templates = build_module(
-                ['-i', mod_path, '-o', out_dir, '-M', model, '-V', version,
-                 '-m', mod_name, '-d', in_dir, '-n', nav_menu, '-w',
-                 work_dir]+sheet_option+pyang_uml_no_option+changes_option
-            )
-        except:
-            pass
-        if result:
-            model_dict[dict_p][module].update(mod_templates)
-            logger.info("     Completed module {}\r\n".format(module))
+            for module, module_result in builds:
+                mod_ext = os.path.splitext(module)[1] # module extension
+                mod_name = os.path.splitext(module)[0] # module name w/o extension
+                result.modules.append(module_result)
+                # stages traced by the module builder
+                tracer.add_events(module_result.trace)
+                if module_result.ok:
+                    mod_templates = module_result.files
+                    model_dict[dict_p][module].update(mod_templates)
+                    logger.info("     Completed module {}\r\n".format(module))
+                    if incremental:
+                        new_manifest[module] = {
+                            'inputs': module_inputs(
+                                mod_dict[module], mod_templates['svglinks'],
+                                file_index, module_settings[module]
+                            ),
+                            'files': mod_templates
+                        }
+                else:
+                    logger.info("     Aborting module {}\r\n".format(module))
+                    if mod_ext == ".yang":
+                        die(
+                            "    Error 108: Bad YANG " + module + ", please review. Maybe you would like to" \
+                            " add \"" + module + "\" to \"diagram_ignore_list\" list in graphyte.conf\r\n", 108
+                        )
+                    else:
+                        die(
+                            "    Error 109: Module " + mod_name + " failed. Verify file " + module + ".\r\n", 109
+                        )
+                num_modules += 1
+        finally:
+            builds.close()
+            if incremental:
+                save_manifest(out_dir, tool, new_manifest)
+        tracer.end(stage)
+
+        # remove template chunks no longer linked from any module
+        used_chunks = []
+        for module in mod_dict:
+            used_chunks += model_dict[dict_p][module].get('chunks', [])
+        get_template_store(out_dir).prune(used_chunks)
+        # remove shared viewer files no longer linked from any module
+        used_assets = []
+        for module in mod_dict:
+            used_assets += model_dict[dict_p][module].get('assets', [])
+        prune_viewer_assets(out_dir, used_assets)
+
+        # merge the search terms of all modules into the model search index
+        if config.search_index:
+            with tracer.stage("build_search_index"):
+                build_search_index(out_dir, [
+                    model_dict[dict_p][module]['searchdocs'] for module in mod_dict
+                    if 'searchdocs' in model_dict[dict_p][module]
+                ])
         else:
-            logger.info("     Aborting module {}\r\n".format(module))
-            if mod_ext == ".yang":
-                die(
-                    "    Error 108: Bad YANG " + module + ", please review. Maybe you would like to" \
-                    " add \"" + module + "\" to \"diagram_ignore_list\" list in graphyte.conf\r\n"
-                )
-            else:
-                die(
-                    "    Error 109: Module " + mod_name + " failed. Verify file " + module + ".\r\n"
-                )
-        num_modules += 1
+            remove_search_index(out_dir)
 
 
-    # Create jobs entry in server.
-    if identifier:
-        command2 = "echo \"{}\n    {} {} - {} modules\" >> {}/jobs.log"\
-            .format(identifier, model, version, num_modules, basedir)
-        os.system(command2)
+        # Create jobs entry in server.
+        if identifier:
+            append_jobs_log(basedir, identifier, model, version, num_modules)
 
-    # zip files. If Confluence enabled, call confluence builder module.
-    if identifier:
-        logger.info("     Generating .zip\r\n")
-        elapsed = datetime.datetime.now() - start_time
-        logger.info("     Elapsed time {}s".format(elapsed))
-        make_zip(out_dir, zip_dir, identifier)
-    else:
-        if confluence_enabled:
+        # zip files. If Confluence enabled, call confluence builder module.
+        if identifier:
             logger.info("     Generating .zip\r\n")
             elapsed = datetime.datetime.now() - start_time
-            zf = make_zip(out_dir, zip_dir, model + ' ' + version)
-            model_dict[dict_p]['zipfile'] = zf
-            logger.info("     Creating entry in Confluence\r\n")
-            build_confluence_page(model_dict, confluence_url, confluence_parent, confluence_script)
             logger.info("     Elapsed time {}s".format(elapsed))
+            with tracer.stage("make_zip"):
+                result.zip_file = make_zip(out_dir, zip_dir, identifier)
         else:
-            elapsed = datetime.datetime.now() - start_time
-            logger.info("     Elapsed time {}s".format(elapsed))
+            if confluence_enabled and config.publish:
+                logger.info("     Generating .zip\r\n")
+                elapsed = datetime.datetime.now() - start_time
+                with tracer.stage("make_zip"):
+                    zf = make_zip(out_dir, zip_dir, model + ' ' + version)
+                result.zip_file = zf
+                model_dict[dict_p]['zipfile'] = zf
+                logger.info("     Creating entry in Confluence\r\n")
+                with tracer.stage("build_confluence_page"):
+                    build_confluence_page(model_dict, confluence_url, confluence_parent, confluence_script,
+                                          confluence_concurrency, confluence_sync,
+                                          os.path.join(zip_dir, CONFLUENCE_STATE_NAME),
+                                          tracer)
+                logger.info("     Elapsed time {}s".format(elapsed))
+            else:
+                elapsed = datetime.datetime.now() - start_time
+                logger.info("     Elapsed time {}s".format(elapsed))
+        result.ok = True
+    except BuildError as e:
+        logger.error(e.message)
+        elapsed = datetime.datetime.now() - start_time
+        logger.info("     Elapsed time {}s".format(elapsed))
+        if identifier:
+            result.zip_file = make_zip(out_dir, zip_dir, identifier)
+        result.error = e
+    except Exception as e:
+        logger.error("     Exception building model: {}\r\n".format(repr(e)))
+        result.error = e
+        result.traceback = traceback.format_exc()
+    finally:
+        tracer.end(build_stage)
+        result.elapsed = tracer.durations()['graphyte']
+        result.timings = tracer.durations()
+        # stages of modules built without trace events
+        for module_result in result.modules:
+            if module_result.trace is None:
+                for name, seconds in module_result.timings.items():
+                    result.timings[name] = \
+                        result.timings.get(name, 0.0) + seconds
+        if config.trace:
+            result.trace = tracer.events
+            tracer.write(os.path.join(out_dir, TRACE_NAME),
+                         model=result.model, version=result.version,
+                         jobs=jobs, incremental=incremental)
+        else:
+            # a trace left by a previous build would not match this one
+            remove_trace(out_dir)
+        logger.removeHandler(fh)
+        fh.close()
+    return result
+
+
+def main(args):
+    """Generate graphyte model, consisting on one or several modules.
+
+    Command line wrapper of build_model.
+
+    :param args: Directory containing input files. Optionally graphyte
+    transaction identifier.
+    :return:None
+    """
+    ############################################
+    # Argument Parser                          #
+    ############################################
+    usage = "\nusage: graphyte.py -d|--dir input_files_directory"
+
+    class MyParser(argparse.ArgumentParser):
+        """Argument Parser class handles inputs.
+
+        Returns the ArgumentParser object.
+
+        Throws error if malformed arguments.
+
+        """
+        def error(self, message):
+            """Error if malformed argument. Attach "usage" help.
+
+            :param message: Error message
+            :return: None
+            """
+            logger = logging.getLogger('graphyte')
+            logger.error('error: %s\n' % message)
+            sys.stderr.write('error: %s\n' % message)
+            print (usage)
+            sys.exit(2)
+
+    parser = MyParser()
+    parser.add_argument('-d', '--dir', required=True,
+                        help='Directory containing input files.')
+    parser.add_argument('-i', '--id', required=False,
+                        help='Session identifier (for use on graphyte server only).')
+    parser.add_argument('-j', '--jobs', required=False, type=int, default=1,
+                        help='Number of modules to build in parallel.')
+    parser.add_argument('-r', '--incremental', required=False,
+                        action='store_true',
+                        help='Only rebuild modules whose input files changed.')
+    parser.add_argument('--plantuml-per-file', required=False,
+                        action='store_true', dest='plantuml_per_file',
+                        help='Start one PlantUML process per diagram instead '
+                             'of reusing a long-lived one.')
+    parser.add_argument('--cache-dir', required=False, dest='cache_dir',
+                        default=DEFAULT_CACHE_DIR,
+                        help='Directory of the pyang/PlantUML render cache.')
+    parser.add_argument('--cache-size', required=False, dest='cache_size',
+                        type=int, default=DEFAULT_CACHE_SIZE,
+                        help='Maximum size of the render cache in MB.')
+    parser.add_argument('--no-cache', required=False, action='store_true',
+                        dest='no_cache', help='Do not use the render cache.')
+    parser.add_argument('--clear-cache', required=False, action='store_true',
+                        dest='clear_cache',
+                        help='Empty the render cache before building.')
+    parser.add_argument('--lazy-templates', required=False,
+                        action='store_true', dest='lazy_templates',
+                        help='Write templates to separate files loaded by '
+                             'the viewer on demand, instead of embedding '
+                             'them in every module.')
+    parser.add_argument('--shared-viewer', required=False,
+                        action='store_true', dest='shared_viewer',
+                        help='Write the viewer CSS and JS once per model, '
+                             'to files linked by every module, instead of '
+                             'embedding them in every module.')
+    parser.add_argument('--search-index', required=False,
+                        action='store_true', dest='search_index',
+                        help='Build a full-text search index of the model '
+                             'and add a search box to every module.')
+    parser.add_argument('--trace', required=False, action='store_true',
+                        help='Write the time, CPU, I/O and memory of every '
+                             'build stage to ' + TRACE_NAME + '.')
+    args = parser.parse_args(args)
+
+    if args.dir == '':
+        sys.exit(usage)
+    if not os.path.exists(args.dir.strip()):
+        parser.error("Couldn't find directory: " + args.dir.strip())
+    if args.jobs < 1:
+        parser.error("Number of jobs must be at least 1: " + str(args.jobs))
+
+    result = build_model(BuildConfig(
+        args.dir, identifier=args.id or "", jobs=args.jobs,
+        incremental=args.incremental,
+        plantuml_server=not args.plantuml_per_file,
+        use_cache=not args.no_cache, cache_dir=args.cache_dir,
+        cache_size=args.cache_size, clear_cache=args.clear_cache,
+        lazy_templates=args.lazy_templates,
+        shared_viewer=args.shared_viewer, search_index=args.search_index,
+        trace=args.trace, publish=True
+    ))
+    for module_result in result.modules:
+        if not module_result.reused:
+            print("\n\n------------------------------------------------------------------------------\n\n"
+                  + module_result.spec.command())
+    if not result.ok:
+        if result.traceback:
+            raise result.error
+        print (result.error.message)
+        sys.exit(1)
 
     exit(0)
 
@@ -10,6 +10,10 @@ within the model in order to build a navigation menu.
 Generates a standalone HTML module with embedded SVG diagram and
 textfiles accessible via an interactive viewer.
 
+Modules can be built in-process with build_module_spec, which takes a
+ModuleSpec and returns a ModuleResult, without parsing arguments or
+printing to the console. build_module is its command line wrapper.
+
 """
 
 # imports
@@ -18,13 +22,19 @@ import sys
 import shutil
 import argparse
 import re
+import shlex
 import logging
+import traceback
 utils_path = os.path.abspath("utils")
 if utils_path not in sys.path:
     sys.path.insert(0, utils_path)
-from template_utils import add_templates_to_script
+from template_utils import add_templates_to_script, get_template_store
+from search_utils import write_search_docs
 from param_utils import process_param_sheet, add_params_to_script
 from html_utils import uml_2_svg, yang_2_uml, build_menu, build_html, process_svg
+from index_utils import FileIndex
+from cache_utils import RenderCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from trace_utils import Tracer, TRACE_NAME
 import pprint
 
 # info
@@ -50,12 +60,32 @@ class GraphyteModule(object):
         file_dir (str): Input files directory.
         in_xls_path (str): Path to input variable list.
         menu_items (str): User specified navigation menu items.
+        file_index (FileIndex): Index of files in the input files directory.
+        plantuml_server (bool): Render UML through the long-lived PlantUML
+        process instead of one PlantUML process per diagram.
+        render_cache (RenderCache): Cache of pyang and PlantUML outputs,
+        None if disabled.
+        lazy_templates (bool): Write templates to separate JS chunks,
+        loaded by the viewer on demand, instead of embedding them in
+        the HTML module.
+        template_store (TemplateStore): Templates processed for the
+        model, shared by all modules.
+        param_sheet (ParamSheet): Authorized parameters worksheet parsed
+        for the model, None to parse it for this module.
+        shared_viewer (bool): Link the viewer CSS and JS files shared by
+        all modules instead of embedding them in the HTML module.
+        search_index (bool): Collect the search terms of the module for
+        the model search index, and add the search box to the viewer.
+        search_docs (list): Search terms of the linked templates, as
+        (template file name, terms) tuples.
 
     """
     def __init__(
             self, model, module, version, title, out_dir, in_diagram_path,
             work_dir, run_dir, file_dir, in_xls_path, menu_items, uml_no,
-            changes_file
+            changes_file, file_index=None, plantuml_server=True,
+            render_cache=None, lazy_templates=False, param_sheet=None,
+            shared_viewer=False, search_index=False
     ):
         """Initializes graphyte module instance. Builds attributes
         not specified by user.
@@ -76,6 +106,7 @@ class GraphyteModule(object):
             out_dir + "/", self.model_no_sp + "_" + self.module_no_sp
             + "_v" + self.version + ".html"
         )
+        self.out_dir = out_dir
         self.in_diagram_path = in_diagram_path
         self.in_diagram_name = os.path.basename(in_diagram_path)
         self.out_html_name_no_ext = os.path.basename(
@@ -94,6 +125,10 @@ class GraphyteModule(object):
         self.run_dir = run_dir
         self.in_xls_path = in_xls_path
         self.file_dir = file_dir
+        # walk input files directory unless the model index was provided
+        if file_index is None:
+            file_index = FileIndex(file_dir)
+        self.file_index = file_index
         self.menu_items = menu_items
         self.svg_links = []
         self.svg_path = ""
@@ -101,8 +136,18 @@ class GraphyteModule(object):
         self.decision_param_list = []
         self.invalid_param_found_alert = ""
         self.allowed_parameters = []
+        self.param_validator = None
+        self.sheet_hash = None
         self.menu_tags = ""
         self.pyang_uml_no = uml_no
+        self.plantuml_server = plantuml_server
+        self.render_cache = render_cache
+        self.lazy_templates = lazy_templates
+        self.template_store = get_template_store(out_dir)
+        self.param_sheet = param_sheet
+        self.shared_viewer = shared_viewer
+        self.search_index = search_index
+        self.search_docs = []
         if changes_file:
             self.changes_file = changes_file
             self.changes_fname = os.path.basename(changes_file)
@@ -165,15 +210,155 @@ class GraphyteModule(object):
         return str(9*len(max(menu_items, key=len)))
 
 
-def build_module(args):
-    """Process user inputs and build graphyte module.
+class BuildError(Exception):
+    """Error stopping a build, with the graphyte error code if any.
+
+    Attributes:
+        message (str): Error description.
+        code (int): graphyte error code, None if not applicable.
 
-    :param args: Input arguments list.
-    :return: None
     """
-    run_dir = os.path.dirname(os.path.realpath(__file__))
+    def __init__(self, message, code=None):
+        Exception.__init__(self, message)
+        self.message = message
+        self.code = code
+
+
+class ModuleSpec(object):
+    """Settings of the build of one module, as given to graphyte_gen.py
+    on the command line.
+
+    Attributes:
+        diagram_path (str): Path to input SVG, UML or YANG diagram.
+        out_dir (str): Output directory.
+        model (str): Name of global graphyte model.
+        version (str): Model version.
+        module (str): Name of the module.
+        files_dir (str): Input files directory.
+        title (str): Web page title, built from model, version and
+        module if empty.
+        nav (str): Comma separated navigation menu items.
+        sheet (str): Path to authorized parameters worksheet, empty if
+        none.
+        work_dir (str): Directory for temp runtime files, a work
+        directory in out_dir if empty.
+        uml_no (str): pyang --uml-no option, YANG diagrams only.
+        changes_file (str): Path to changes file, empty if none.
+        plantuml_server (bool): Render UML through the long-lived
+        PlantUML process instead of one process per diagram.
+        use_cache (bool): Use the pyang/PlantUML render cache.
+        cache_dir (str): Render cache directory.
+        cache_size (int): Maximum size of the render cache in MB.
+        lazy_templates (bool): Write templates to JS chunks loaded by
+        the viewer on demand.
+        shared_viewer (bool): Link viewer CSS/JS files shared by all
+        modules.
+        search_index (bool): Collect the module search terms and add the
+        search box.
+        trace (bool): Return the trace events of the build stages.
+
+    """
+    def __init__(
+            self, diagram_path, out_dir, model, version, module, files_dir,
+            title="", nav="", sheet="", work_dir="", uml_no="",
+            changes_file="", plantuml_server=True, use_cache=True,
+            cache_dir=DEFAULT_CACHE_DIR, cache_size=DEFAULT_CACHE_SIZE,
+            lazy_templates=False, shared_viewer=False, search_index=False,
+            trace=False
+    ):
+        self.diagram_path = diagram_path
+        self.out_dir = out_dir
+        self.model = model
+        self.version = version
+        self.module = module
+        self.files_dir = files_dir
+        self.title = title
+        self.nav = nav
+        self.sheet = sheet
+        self.work_dir = work_dir
+        self.uml_no = uml_no
+        self.changes_file = changes_file
+        self.plantuml_server = plantuml_server
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.lazy_templates = lazy_templates
+        self.shared_viewer = shared_viewer
+        self.search_index = search_index
+        self.trace = trace
+
+    def command(self):
+        """Returns the graphyte_gen.py command line building the module.
+
+        :return: command line string
+        """
+        return "python3 graphyte_gen.py " + " ".join(
+            shlex.quote(a) for a in self.to_args())
+
+    def to_args(self):
+        """Returns the graphyte_gen.py arguments building the module.
+
+        :return: arguments list
+        """
+        args = ['-i', self.diagram_path, '-o', self.out_dir,
+                '-M', self.model, '-V', self.version, '-m', self.module,
+                '-d', self.files_dir]
+        for option, value in (('-t', self.title), ('-n', self.nav),
+                              ('-w', self.work_dir), ('-s', self.sheet),
+                              ('-u', self.uml_no),
+                              ('-c', self.changes_file)):
+            if value:
+                args += [option, value]
+        if not self.plantuml_server:
+            args.append('--plantuml-per-file')
+        if self.use_cache:
+            args += ['--cache-dir', self.cache_dir,
+                     '--cache-size', str(self.cache_size)]
+        else:
+            args.append('--no-cache')
+        for option, value in (('--lazy-templates', self.lazy_templates),
+                              ('--shared-viewer', self.shared_viewer),
+                              ('--search-index', self.search_index),
+                              ('--trace', self.trace)):
+            if value:
+                args.append(option)
+        return args
+
+
+class ModuleResult(object):
+    """Outcome of the build of one module.
 
-    usage = """
+    Attributes:
+        spec (ModuleSpec): Settings of the build.
+        ok (bool): Whether the module was built.
+        files (dict): Files used and written by the module, as stored
+        in the model dictionary.
+        reused (bool): Whether the module output of a previous build
+        was reused instead of building it.
+        elapsed (float): Seconds taken by the build.
+        timings (dict): Seconds taken by every build stage.
+        trace (list): Trace events of the build stages, None unless
+        requested by spec.trace.
+        error (Exception): Exception stopping the build, None if built
+        or reused.
+        traceback (str): Formatted traceback of error, empty for a
+        BuildError.
+
+    """
+    def __init__(self, spec, ok=False, files=None, reused=False, elapsed=0.0,
+                 timings=None, trace=None, error=None, traceback=""):
+        self.spec = spec
+        self.ok = ok
+        self.files = files or dict()
+        self.reused = reused
+        self.elapsed = elapsed
+        self.timings = timings or dict()
+        self.trace = trace
+        self.error = error
+        self.traceback = traceback
+
+
+USAGE = """
      Name:
      ----
        graphyte_gen.py - script to generate interactive HTML module from \
@@ -193,7 +378,15 @@ SVG/UML and text files.
 [-s "parameters worksheet"] \
 [-n "navigation items"] \
 [-t "web page title"] \
-[-c "changes file"]
+[-c "changes file"] \
+[--plantuml-per-file] \
+[--cache-dir "render cache dir"] \
+[--cache-size "render cache MB"] \
+[--no-cache] \
+[--lazy-templates] \
+[--shared-viewer] \
+[--search-index] \
+[--trace]
 
      Options:
      -------
@@ -217,28 +410,38 @@ menu items.
        -t|--title     "web page title":         Optional. Will show in the \
 output web page.
        -c|--changes   "changes file":           Optional. Changes file.
+       --plantuml-per-file:                     Optional. Start one PlantUML \
+process per diagram instead of reusing a long-lived one.
+       --cache-dir    "render cache dir":       Optional. Directory of the \
+pyang/PlantUML render cache.
+       --cache-size   "render cache MB":        Optional. Maximum size of the \
+render cache in MB.
+       --no-cache:                              Optional. Do not use the \
+render cache.
+       --lazy-templates:                        Optional. Write templates \
+to JS chunks shared by all modules, loaded by the viewer on demand.
+       --shared-viewer:                         Optional. Link viewer \
+CSS/JS files shared by all modules instead of embedding them.
+       --search-index:                          Optional. Collect the \
+module search terms and add the model search box.
+       --trace:                                 Optional. Record the time, \
+CPU, I/O and memory of every build stage.
 
-    """
+"""
 
-    in_diagram_path = ""
-    out_dir = ""
-    out_html_path = ""
-    title = ""
-    file_dir = ""
-    menu_items = ""
-    version = ""
-    model = ""
-    module = ""
-    in_xls_path = ""
-    work_dir = ""
-    log_file = ""
-    uml_no = ""
-    changes_file = ""
 
+def parse_module_args(args):
+    """Parses graphyte_gen.py arguments.
+
+    Exits with the usage message if the arguments are not valid.
+
+    :param args: Input arguments list.
+    :return: ModuleSpec
+    """
     class MyParser(argparse.ArgumentParser):
         def error(self, message):
             sys.stderr.write('error: %s\n' % message)
-            print (usage)
+            print (USAGE)
             sys.exit(2)
 
     parser = MyParser()
@@ -272,135 +475,175 @@ output web page.
                         help='pyang --uml-no option.')
     parser.add_argument('-c', '--changes', required=False, dest="changes",
                         help='changes file.')
+    parser.add_argument('--plantuml-per-file', required=False,
+                        action='store_true', dest="plantuml_per_file",
+                        help='Start one PlantUML process per diagram.')
+    parser.add_argument('--cache-dir', required=False, dest="cache_dir",
+                        help='Directory of the pyang/PlantUML render cache.')
+    parser.add_argument('--cache-size', required=False, dest="cache_size",
+                        type=int, help='Maximum size of the render cache in MB.')
+    parser.add_argument('--no-cache', required=False, action='store_true',
+                        dest="no_cache", help='Do not use the render cache.')
+    parser.add_argument('--lazy-templates', required=False,
+                        action='store_true', dest="lazy_templates",
+                        help='Write templates to JS chunks loaded on demand.')
+    parser.add_argument('--shared-viewer', required=False,
+                        action='store_true', dest="shared_viewer",
+                        help='Link viewer CSS/JS files shared by all modules.')
+    parser.add_argument('--search-index', required=False,
+                        action='store_true', dest="search_index",
+                        help='Collect search terms and add the search box.')
+    parser.add_argument('--trace', required=False, action='store_true',
+                        dest="trace",
+                        help='Record the stages of the build in a trace.')
     args = parser.parse_args(args)
 
-
-
-    # input diagram
-    if args.input == '':
-        sys.exit(usage)
-    else:
-        in_diagram_path = args.input.strip()
-    # output directory
-    if args.output == '':
-        sys.exit(usage)
-    else:
-        out_dir = args.output.strip()
-    # model
-    if args.model == "":
-        sys.exit(usage)
-    else:
-        model = args.model.strip()
-    # version
-    if args.version == '':
-        sys.exit(usage)
-    else:
-        version = args.version.strip()
-    # module
-    if args.module == '':
-        sys.exit(usage)
-    else:
-        module = args.module.strip()
-    # title
-    if args.title:
-        title = args.title.strip()
-    # files directory
-    if args.filesdir == '':
-        sys.exit(usage)
-    else:
-        file_dir = args.filesdir.strip()
-    # navigation menu
-    if args.nav:
-        menu_items = args.nav
-    # parameter worksheet
-    if args.sheet:
-        in_xls_path = args.sheet.strip()
-    # work directory
-    if args.workdir:
-        work_dir = args.workdir.strip()
-    # log file
-    if args.logfile:
-        log_file = args.logfile.strip()
-    else:
-        log_file = out_dir + "/graphyte.log"
+    # required values must not be empty
+    for value in (args.input, args.output, args.model, args.version,
+                  args.module, args.filesdir):
+        if value.strip() == '':
+            sys.exit(USAGE)
+    in_diagram_path = args.input.strip()
     # pyang uml-no options
+    uml_no = ""
     if args.umlno:
         if not os.path.splitext(in_diagram_path)[1] == ".yang":
             # --uml-no option only valid for .yang diagram
-            sys.exit(usage)
-        else:
-            uml_no = re.sub(r'\s+', '', args.umlno)
-    else:
-        pass
-    # changes file
-    if args.changes:
-        changes_file = re.sub(r'\s+', '', args.changes)
-    else:
-        pass
+            sys.exit(USAGE)
+        uml_no = re.sub(r'\s+', '', args.umlno)
+
+    return ModuleSpec(
+        in_diagram_path, args.output.strip(), args.model.strip(),
+        args.version.strip(), args.module.strip(), args.filesdir.strip(),
+        title=args.title.strip() if args.title else "",
+        nav=args.nav or "",
+        sheet=args.sheet.strip() if args.sheet else "",
+        work_dir=args.workdir.strip() if args.workdir else "",
+        uml_no=uml_no,
+        changes_file=re.sub(r'\s+', '', args.changes) if args.changes else "",
+        plantuml_server=not args.plantuml_per_file,
+        use_cache=not args.no_cache,
+        cache_dir=args.cache_dir or DEFAULT_CACHE_DIR,
+        cache_size=args.cache_size or DEFAULT_CACHE_SIZE,
+        lazy_templates=args.lazy_templates,
+        shared_viewer=args.shared_viewer,
+        search_index=args.search_index,
+        trace=args.trace
+    )
 
-    print ("\nRunning <{graphyte}> with arguments:\n\
-              -i , Diagram file:      " + in_diagram_path + "\n\
-              -o , Output directory:  " + out_dir + "\n\
-              -M , Model name:        " + model + "\n\
-              -V , Model version:     " + version + "\n\
-              -m , Module name:       " + module + "\n\
-              -t , Title:             " + title + "\n\
-              -d , Files Dir:         " + file_dir + "\n\
-              -s , Parameter sheet:   " + in_xls_path + "\n\
-              -w , Work Dir:          " + work_dir + "\n\
-              -l , Log file:          " + log_file + "\n\
-              -n , Menu items:        " + menu_items + "\n\
-              -u , pyang uml-no:      " + uml_no)
 
+def build_module_spec(spec, file_index=None, param_sheet=None,
+                      render_cache=None):
+    """Builds a graphyte module, without printing to the console.
+
+    Exceptions are not raised but returned in the result, so that a
+    failing module does not stop the caller.
+
+    :param spec: ModuleSpec of the module
+    :param file_index: optional. FileIndex of the input files directory,
+     shared by all modules of the model. Built from spec.files_dir if
+     not provided.
+    :param param_sheet: optional. ParamSheet parsed from spec.sheet,
+     shared by all modules of the model. Parsed from spec.sheet if not
+     provided.
+    :param render_cache: optional. RenderCache shared by all modules,
+     opened from spec.cache_dir if not provided and spec.use_cache.
+    :return: ModuleResult
+    """
+    tracer = Tracer(module=spec.module)
+    module_stage = tracer.begin("build_module")
+    result = ModuleResult(spec)
+    try:
+        result.files = _build(spec, file_index, param_sheet, render_cache,
+                              tracer)
+        result.ok = True
+    except BuildError as e:
+        logger.error('         ' + e.message + '\r\n')
+        result.error = e
+    except Exception as e:
+        logger.error("     Exception building module: {}\r\n".format(repr(e)))
+        result.error = e
+        result.traceback = traceback.format_exc()
+    tracer.end(module_stage)
+    result.elapsed = tracer.durations()['build_module']
+    result.timings = tracer.durations()
+    if spec.trace:
+        result.trace = tracer.events
+    return result
+
+
+def _build(spec, file_index, param_sheet, render_cache, tracer):
+    """Builds a graphyte module.
+
+    :param spec: ModuleSpec of the module
+    :param file_index: FileIndex of the input files directory, None to
+     build it
+    :param param_sheet: ParamSheet of the model, None to parse it
+    :param render_cache: RenderCache, None to open it from spec
+    :param tracer: Tracer recording the build stages
+    :return: dictionary of files used and written by the module
+    """
+    run_dir = os.path.dirname(os.path.realpath(__file__))
+
+    # render cache
+    if render_cache is None and spec.use_cache:
+        render_cache = RenderCache(spec.cache_dir, spec.cache_size)
+    if not spec.use_cache:
+        render_cache = None
 
     # Initialize graphyte module object
     gm = GraphyteModule(
-        model, module, version, title, out_dir, in_diagram_path, work_dir,
-        run_dir, file_dir, in_xls_path, menu_items, uml_no, changes_file
+        spec.model, spec.module, spec.version, spec.title, spec.out_dir,
+        spec.diagram_path, spec.work_dir, run_dir, spec.files_dir,
+        spec.sheet, spec.nav, spec.uml_no, spec.changes_file, file_index,
+        spec.plantuml_server, render_cache, spec.lazy_templates,
+        param_sheet, spec.shared_viewer, spec.search_index
     )
 
     # Sanity checks for dirs
-    if not gm.dirs_are_fine:
-        sys.exit(usage)
+    if not gm.dirs_are_fine():
+        raise BuildError("Input diagram or directories not found: "
+                         + spec.diagram_path)
 
     # target string to be added to the html
     xls_to_script = ""
 
-    # list of allowed parameters (extracted from input xls)
-    # allowed_parameters = []
-
     # process authorized parameter list
-    if in_xls_path:
-        xls_to_script = process_param_sheet(gm)
+    if spec.sheet:
+        with tracer.stage("process_param_sheet"):
+            xls_to_script = process_param_sheet(gm)
 
     # if diagram is yang, convert to uml
     if gm.diagram_is_yang():
         logger.info('         Processing YANG file...' + '\r\n')
-        success = yang_2_uml(gm)
-        if success:
-            logger.info('         ...ok' + '\r\n')
-        else:
+        with tracer.stage("yang_2_uml"):
+            success = yang_2_uml(gm)
+        if not success:
             logger.info('         ...failed' + '\r\n')
-            print ("\n...aborted.")
-            return False
+            raise BuildError("Failed to convert YANG to UML: "
+                             + spec.diagram_path)
+        logger.info('         ...ok' + '\r\n')
 
     # if diagram is uml, convert to svg
     module_diagram = dict()
     if gm.diagram_is_uml():
-        module_diagram = uml_2_svg(gm)
+        with tracer.stage("uml_2_svg"):
+            module_diagram = uml_2_svg(gm)
     else:
         # diagram was already SVG
         gm.svg_path = gm.in_diagram_path
 
     # process svg diagram
-    processed_svg = process_svg(gm)
+    with tracer.stage("process_svg"):
+        processed_svg = process_svg(gm)
 
     # if work_dir was not user specified, clean up work_dir after svg creation
     if gm.diagram_is_uml() and not gm.input_work_dir:
-        shutil.rmtree(os.path.join(out_dir, "work"))
+        shutil.rmtree(os.path.join(spec.out_dir, "work"))
 
     # process templates and detect parameters
-    file_script,module_templates = add_templates_to_script(gm)
+    with tracer.stage("add_templates_to_script"):
+        file_script,module_templates = add_templates_to_script(gm)
 
     # add detected parameters
     file_script = add_params_to_script(gm, file_script)
@@ -409,21 +652,72 @@ output web page.
     build_menu(gm)
 
     # create html file
-    build_html(gm, processed_svg, file_script, xls_to_script)
+    with tracer.stage("build_html"):
+        viewer_assets = build_html(gm, processed_svg, file_script, xls_to_script)
+    processed_svg.close()
 
     # merge return dictionary with all used files
     module_files = {**module_diagram,**module_templates}
+    module_files['htmlpath'] = gm.out_html_path
+    module_files['svglinks'] = list(gm.svg_links)
+    if viewer_assets:
+        module_files['assets'] = viewer_assets
+    if gm.search_index:
+        with tracer.stage("write_search_docs"):
+            module_files['searchdocs'] = write_search_docs(gm)
+    return module_files
 
-    print ("\n...done.")
-    return True,module_files
 
-    # remove comment below to display module on browser after creation
-    # webbrowser.open(out_html_path, new=0, autoraise=True)
+def build_module(args, file_index=None, param_sheet=None):
+    """Process user inputs and build graphyte module.
+
+    Command line wrapper of build_module_spec.
+
+    :param args: Input arguments list.
+    :param file_index: optional. FileIndex of the input files directory,
+     shared by all modules of the model. Built from -d if not provided.
+    :param param_sheet: optional. ParamSheet parsed from -s, shared by
+     all modules of the model. Parsed from -s if not provided.
+    :return: (True, dictionary of module files) if built, False
+     otherwise. The trace events are added to the dictionary with
+     --trace.
+    """
+    spec = parse_module_args(args)
 
-    exit(0)
+    print ("\nRunning <{graphyte}> with arguments:\n\
+              -i , Diagram file:      " + spec.diagram_path + "\n\
+              -o , Output directory:  " + spec.out_dir + "\n\
+              -M , Model name:        " + spec.model + "\n\
+              -V , Model version:     " + spec.version + "\n\
+              -m , Module name:       " + spec.module + "\n\
+              -t , Title:             " + spec.title + "\n\
+              -d , Files Dir:         " + spec.files_dir + "\n\
+              -s , Parameter sheet:   " + spec.sheet + "\n\
+              -w , Work Dir:          " + spec.work_dir + "\n\
+              -n , Menu items:        " + spec.nav + "\n\
+              -u , pyang uml-no:      " + spec.uml_no)
+
+    result = build_module_spec(spec, file_index, param_sheet)
+    if result.error is not None and not isinstance(result.error, BuildError):
+        raise result.error
+    if not result.ok:
+        print ("\n...aborted.")
+        return False
+    module_files = dict(result.files)
+    if spec.trace:
+        module_files['trace'] = result.trace
+
+    print ("\n...done.")
+    return True,module_files
 
 
 if __name__ == "__main__":
     # run when not called via 'import'
     import sys
-    build_module(sys.argv[1:])
+    result = build_module(sys.argv[1:])
+    if result and 'trace' in result[1]:
+        tracer = Tracer()
+        tracer.add_events(result[1]['trace'])
+        tracer.write(os.path.join(
+            os.path.dirname(result[1]['htmlpath']), TRACE_NAME
+        ))
@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+"""graphyte_server.py
+
+Long-running graphyte build service.
+
+Builds models submitted as jobs through a local HTTP API, the way
+graphyte.py -i <identifier> builds one job: input files are read from
+basedir/archive/<id>/in/, the output is written to
+basedir/archive/<id>/out/ and zipped to basedir/archive/<id>/zip/, and
+every job is added to basedir/jobs.log.
+
+Jobs are built by a bounded pool of worker processes which stay alive
+between jobs: graphyte is imported once per worker, the PlantUML
+renderer of a worker is reused by all its jobs, and pyang, PlantUML
+and parameter worksheet results are shared by all jobs through the
+render cache.
+
+Jobs are kept in basedir/jobs, one JSON file per job, and survive
+restarts: jobs queued or running when the service stopped are built
+when it starts again.
+
+API (JSON requests and responses):
+
+POST   /jobs        {"id": "<id>", "options": {...}}   queue a job
+GET    /jobs                                         list all jobs
+GET    /jobs/<id>                                    job state and result
+DELETE /jobs/<id>                                    cancel a queued job
+GET    /status                                       service status
+
+Options are the BuildConfig settings incremental, lazy_templates,
+shared_viewer, search_index, trace and plantuml_server.
+
+Usage: python3 graphyte_server.py -d <basedir> [-p port] [-w workers]
+
+"""
+
+# imports
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+utils_path = os.path.abspath("utils")
+if utils_path not in sys.path:
+    sys.path.insert(0, utils_path)
+from cache_utils import RenderCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE
+from output_utils import write_file
+from param_utils import clear_param_sheets
+from template_utils import clear_template_stores
+from graphyte import BuildConfig, build_model
+from graphyte_gen import BuildError
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+DEFAULT_PORT = 8089
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_QUEUE = 100
+# largest request body read, in bytes
+MAX_REQUEST_SIZE = 1 << 20
+JOBS_DIR = "jobs"
+JOB_FORMAT = 1
+# job identifiers are used as directory names
+JOB_ID_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]{0,127}$')
+# BuildConfig settings accepted as job options
+JOB_OPTIONS = ('incremental', 'lazy_templates', 'shared_viewer',
+               'search_index', 'trace', 'plantuml_server')
+
+# job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# render cache of a worker process, shared by all its jobs
+_worker_cache = None
+
+
+class JobError(Exception):
+    """Request that cannot be served, with its HTTP status.
+
+    Attributes:
+        message (str): Error description.
+        status (int): HTTP status code.
+
+    """
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.message = message
+        self.status = status
+
+
+def now():
+    return datetime.datetime.now().isoformat(timespec='seconds')
+
+
+def init_job_worker(use_cache, cache_dir, cache_size):
+    """Initialize a job worker process.
+
+    :param use_cache: whether to use the render cache
+    :param cache_dir: render cache directory
+    :param cache_size: maximum size of the render cache in MB
+    :return: None
+    """
+    global _worker_cache
+    if use_cache:
+        _worker_cache = RenderCache(cache_dir, cache_size)
+    logger.setLevel(logging.DEBUG)
+
+
+def job_result(result):
+    """Summarizes a build for the job status.
+
+    :param result: BuildResult
+    :return: JSON serializable dictionary
+    """
+    error = ""
+    if result.error is not None:
+        error = result.error.message.strip() \
+            if isinstance(result.error, BuildError) else repr(result.error)
+    return {
+        'ok': result.ok,
+        'error': error,
+        'code': getattr(result.error, 'code', None),
+        'traceback': result.traceback,
+        'model': result.model,
+        'version': result.version,
+        'zip_file': result.zip_file,
+        'elapsed': round(result.elapsed, 3),
+        'timings': dict((k, round(v, 3)) for k, v in result.timings.items()),
+        'modules': [{
+            'module': m.spec.module,
+            'ok': m.ok,
+            'reused': m.reused,
+            'elapsed': round(m.elapsed, 3),
+            'error': repr(m.error) if m.error is not None else ""
+        } for m in result.modules]
+    }
+
+
+def run_job(basedir, identifier, options, use_cache, cache_dir, cache_size):
+    """Builds a job in a worker process.
+
+    :param basedir: service base directory
+    :param identifier: job identifier
+    :param options: dictionary of BuildConfig settings
+    :param use_cache: whether to use the render cache
+    :param cache_dir: render cache directory
+    :param cache_size: maximum size of the render cache in MB
+    :return: job result dictionary
+    """
+    config = BuildConfig(
+        basedir, identifier=identifier, use_cache=use_cache,
+        cache_dir=cache_dir, cache_size=cache_size, **options
+    )
+    try:
+        return job_result(build_model(config, _worker_cache))
+    finally:
+        # per job entries, never used again by this worker
+        clear_param_sheets()
+        clear_template_stores()
+
+
+class JobQueue(object):
+    """Persistent queue of build jobs, built by a pool of worker
+    processes.
+
+    Attributes:
+        basedir (str): Service base directory.
+        jobs_dir (str): Directory where jobs are kept.
+        workers (int): Number of jobs built at the same time.
+        max_queue (int): Maximum number of queued jobs.
+        use_cache (bool): Use the render cache.
+        cache_dir (str): Render cache directory.
+        cache_size (int): Maximum size of the render cache in MB.
+        jobs (dict): Jobs by identifier.
+
+    """
+    def __init__(self, basedir, workers=DEFAULT_WORKERS,
+                 max_queue=DEFAULT_MAX_QUEUE, use_cache=True,
+                 cache_dir=DEFAULT_CACHE_DIR, cache_size=DEFAULT_CACHE_SIZE):
+        self.basedir = basedir
+        self.jobs_dir = os.path.join(basedir, JOBS_DIR)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.jobs = dict()
+        self.started = now()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._running = 0
+        self._stopping = False
+        self._executor = None
+        self._dispatcher = None
+        self.load()
+
+    def load(self):
+        """Reads the jobs kept by previous runs. Jobs that were running
+        are queued again.
+
+        :return: None
+        """
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.jobs_dir, name)) as f:
+                    job = json.load(f)
+            except (IOError, OSError, ValueError):
+                logger.warning("     Ignoring unreadable job file {}\r\n"
+                               .format(name))
+                continue
+            if job.get('format') != JOB_FORMAT:
+                continue
+            if job['state'] == RUNNING:
+                logger.info("     Job {} was interrupted, queued again\r\n"
+                            .format(job['id']))
+                job['state'] = QUEUED
+                job['started'] = None
+                self._save(job)
+            self.jobs[job['id']] = job
+            self._seq = max(self._seq, job['seq'])
+
+    def _save(self, job):
+        """Writes a job to its file.
+
+        :param job: job dictionary
+        :return: None
+        """
+        write_file(os.path.join(self.jobs_dir, job['id'] + ".json"),
+                   json.dumps(job, indent=1, sort_keys=True))
+
+    def submit(self, identifier, options=None):
+        """Queues a job. A job done, failed or cancelled before is
+        built again.
+
+        :param identifier: job identifier, its input files are read
+         from basedir/archive/<identifier>/in/
+        :param options: optional. Dictionary of BuildConfig settings
+        :return: job dictionary
+        """
+        options = options or dict()
+        if not isinstance(identifier, str) or not JOB_ID_RE.match(identifier):
+            raise JobError("Invalid job id: " + repr(identifier))
+        if not isinstance(options, dict):
+            raise JobError("Job options must be an object")
+        unknown = sorted(set(options) - set(JOB_OPTIONS))
+        if unknown:
+            raise JobError("Unknown job options: " + ", ".join(unknown))
+        if not all(isinstance(v, bool) for v in options.values()):
+            raise JobError("Job options must be true or false")
+        in_dir = os.path.join(self.basedir, "archive", identifier, "in")
+        if not os.path.isdir(in_dir):
+            raise JobError("Input files not found: " + in_dir)
+        with self._cond:
+            if self._stopping:
+                raise JobError("Service is stopping", 503)
+            job = self.jobs.get(identifier)
+            if job and job['state'] in (QUEUED, RUNNING):
+                raise JobError("Job {} is {}".format(identifier, job['state']),
+                               409)
+            if self.count(QUEUED) >= self.max_queue:
+                raise JobError("Job queue is full", 503)
+            self._seq += 1
+            job = {
+                'format': JOB_FORMAT,
+                'id': identifier,
+                'seq': self._seq,
+                'state': QUEUED,
+                'options': options,
+                'submitted': now(),
+                'started': None,
+                'finished': None,
+                'result': None
+            }
+            self.jobs[identifier] = job
+            self._save(job)
+            self._cond.notify_all()
+            logger.info("     Job {} queued\r\n".format(identifier))
+            return dict(job)
+
+    def cancel(self, identifier):
+        """Cancels a queued job.
+
+        :param identifier: job identifier
+        :return: job dictionary
+        """
+        with self._cond:
+            job = self.jobs.get(identifier)
+            if job is None:
+                raise JobError("Job not found: " + identifier, 404)
+            if job['state'] != QUEUED:
+                raise JobError("Job {} is {}".format(identifier, job['state']),
+                               409)
+            job['state'] = CANCELLED
+            job['finished'] = now()
+            self._save(job)
+            logger.info("     Job {} cancelled\r\n".format(identifier))
+            return dict(job)
+
+    def get(self, identifier):
+        """Returns a job.
+
+        :param identifier: job identifier
+        :return: job dictionary
+        """
+        with self._cond:
+            job = self.jobs.get(identifier)
+            if job is None:
+                raise JobError("Job not found: " + identifier, 404)
+            return dict(job)
+
+    def list(self):
+        """Returns all jobs, in submission order, without their
+        results.
+
+        :return: list of job dictionaries
+        """
+        with self._cond:
+            return [dict((k, v) for k, v in job.items() if k != 'result')
+                    for job in sorted(self.jobs.values(),
+                                      key=lambda j: j['seq'])]
+
+    def count(self, state):
+        return sum(1 for job in self.jobs.values() if job['state'] == state)
+
+    def status(self):
+        """Returns the service status.
+
+        :return: dictionary
+        """
+        with self._cond:
+            status = dict((state, self.count(state)) for state in
+                          (QUEUED, RUNNING, DONE, FAILED, CANCELLED))
+            status.update({
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'started': self.started
+            })
+            return status
+
+    def start(self):
+        """Starts the worker processes and the dispatch of queued jobs.
+
+        :return: None
+        """
+        self._executor = self._new_executor()
+        self._dispatcher = threading.Thread(target=self._dispatch)
+        self._dispatcher.daemon = True
+        self._dispatcher.start()
+
+    def stop(self):
+        """Stops dispatching jobs and waits for the running ones.
+
+        :return: None
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._dispatcher:
+            self._dispatcher.join()
+        if self._executor:
+            self._executor.shutdown(wait=True)
+
+    def _new_executor(self):
+        # workers are started afresh rather than forked from this
+        # multithreaded process
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_job_worker,
+            initargs=(self.use_cache, self.cache_dir, self.cache_size)
+        )
+
+    def _next(self):
+        queued = [job for job in self.jobs.values() if job['state'] == QUEUED]
+        return min(queued, key=lambda j: j['seq']) if queued else None
+
+    def _dispatch(self):
+        """Sends queued jobs to the workers, oldest first, no more than
+        one per worker at a time so that the others stay queued.
+
+        :return: None
+        """
+        while True:
+            with self._cond:
+                while not self._stopping and (
+                        self._running >= self.workers or self._next() is None):
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = self._next()
+                job['state'] = RUNNING
+                job['started'] = now()
+                self._save(job)
+                self._running += 1
+                executor = self._executor
+                logger.info("     Job {} started\r\n".format(job['id']))
+            try:
+                future = executor.submit(
+                    run_job, self.basedir, job['id'], job['options'],
+                    self.use_cache, self.cache_dir, self.cache_size
+                )
+            except BrokenProcessPool as e:
+                self._finished(job['id'], executor, None, e)
+                continue
+            future.add_done_callback(
+                lambda f, i=job['id'], x=executor: self._finished(i, x, f))
+
+    def _finished(self, identifier, executor, future, error=None):
+        """Records the result of a job.
+
+        :param identifier: job identifier
+        :param executor: executor the job was sent to
+        :param future: future of the job, None if not sent
+        :param error: optional. Exception raised sending the job
+        :return: None
+        """
+        result = None
+        if future is not None:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+        if result is None:
+            result = {'ok': False, 'error': repr(error), 'code': None,
+                      'modules': []}
+        with self._cond:
+            if isinstance(error, BrokenProcessPool) \
+                    and executor is self._executor and not self._stopping:
+                # a worker died, start a new pool for the next jobs
+                logger.error("     Worker process died, restarting workers\r\n")
+                self._executor = self._new_executor()
+            job = self.jobs[identifier]
+            job['state'] = DONE if result['ok'] else FAILED
+            job['finished'] = now()
+            job['result'] = result
+            self._save(job)
+            self._running -= 1
+            self._cond.notify_all()
+            logger.info("     Job {} {}\r\n".format(identifier, job['state']))
+
+
+class JobServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, queue):
+        HTTPServer.__init__(self, address, JobHandler)
+        self.queue = queue
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug("     " + (format % args) + "\r\n")
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, indent=1, sort_keys=True).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_REQUEST_SIZE:
+            # the body is not read, drop the connection after answering
+            self.close_connection = True
+            if length < 0:
+                raise JobError("Invalid Content-Length")
+            raise JobError("Request body larger than {} bytes"
+                           .format(MAX_REQUEST_SIZE), 413)
+        data = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(data.decode("utf-8"))
+        except ValueError:
+            raise JobError("Request body is not valid JSON")
+
+    def handle_request(self, method):
+        queue = self.server.queue
+        path = urlparse(self.path).path.rstrip("/")
+        m = re.match(r'^/jobs/([^/]+)$', path)
+        try:
+            if method == "GET" and path == "/status":
+                return self.send_json(queue.status())
+            if method == "GET" and path == "/jobs":
+                return self.send_json({'jobs': queue.list()})
+            if method == "POST" and path == "/jobs":
+                request = self.read_json()
+                if not isinstance(request, dict):
+                    raise JobError("Request body must be an object")
+                return self.send_json(
+                    queue.submit(request.get('id'), request.get('options')),
+                    202)
+            if m and method == "GET":
+                return self.send_json(queue.get(m.group(1)))
+            if m and method == "DELETE":
+                return self.send_json(queue.cancel(m.group(1)))
+            raise JobError("Not found: " + method + " " + path, 404)
+        except JobError as e:
+            return self.send_json({'error': e.message}, e.status)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+def start_server(basedir, port=0, workers=DEFAULT_WORKERS,
+                 max_queue=DEFAULT_MAX_QUEUE, use_cache=True,
+                 cache_dir=DEFAULT_CACHE_DIR, cache_size=DEFAULT_CACHE_SIZE):
+    """Starts the build service in a background thread, listening on
+    localhost.
+
+    :param basedir: service base directory
+    :param port: optional. TCP port, 0 for any free port
+    :param workers: optional. Number of jobs built at the same time
+    :param max_queue: optional. Maximum number of queued jobs
+    :param use_cache: optional. Use the render cache
+    :param cache_dir: optional. Render cache directory
+    :param cache_size: optional. Maximum size of the render cache in MB
+    :return: JobServer, base URL
+    """
+    queue = JobQueue(basedir, workers, max_queue, use_cache, cache_dir,
+                     cache_size)
+    server = JobServer(("127.0.0.1", port), queue)
+    queue.start()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, "http://127.0.0.1:" + str(server.server_address[1])
+
+
+def stop_server(server):
+    """Stops a build service started by start_server, once its running
+    jobs are done. Queued jobs are kept for the next start.
+
+    :param server: JobServer
+    :return: None
+    """
+    server.shutdown()
+    server.server_close()
+    server.queue.stop()
+
+
+def main(args):
+    """Runs the build service until interrupted.
+
+    :param args: command line arguments
+    :return: None
+    """
+    parser = argparse.ArgumentParser(
+        description="Long-running graphyte build service.")
+    parser.add_argument('-d', '--dir', required=True,
+                        help='Base directory, jobs are built from '
+                             'archive/<id>/in/.')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                        help='Port listened on localhost.')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Number of jobs built at the same time.')
+    parser.add_argument('--max-queue', type=int, dest='max_queue',
+                        default=DEFAULT_MAX_QUEUE,
+                        help='Maximum number of queued jobs.')
+    parser.add_argument('--cache-dir', dest='cache_dir',
+                        default=DEFAULT_CACHE_DIR,
+                        help='Directory of the pyang/PlantUML render cache.')
+    parser.add_argument('--cache-size', dest='cache_size', type=int,
+                        default=DEFAULT_CACHE_SIZE,
+                        help='Maximum size of the render cache in MB.')
+    parser.add_argument('--no-cache', action='store_true', dest='no_cache',
+                        help='Do not use the render cache.')
+    args = parser.parse_args(args)
+    if not os.path.isdir(args.dir):
+        parser.error("Couldn't find directory: " + args.dir)
+    if args.workers < 1:
+        parser.error("Number of workers must be at least 1: "
+                     + str(args.workers))
+
+    logger.setLevel(logging.DEBUG)
+    handler = logging.StreamHandler()
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    logger.addHandler(handler)
+
+    queue = JobQueue(args.dir, args.workers, args.max_queue,
+                     not args.no_cache, args.cache_dir, args.cache_size)
+    server = JobServer(("127.0.0.1", args.port), queue)
+    queue.start()
+    # stop cleanly on SIGTERM as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logger.info("     graphyte build service on http://127.0.0.1:{}, "
+                "{} workers\r\n".format(args.port, args.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("     Stopping, waiting for running jobs\r\n")
+        server.server_close()
+        queue.stop()
+
+
+if __name__ == "__main__":
+    # run when not called via 'import'
+    main(sys.argv[1:])
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""cache_utils.py
+
+Content-addressed on-disk cache for rendered diagrams.
+
+Converting YANG to UML with pyang and UML to SVG with PlantUML are the
+most expensive steps of a build, and most diagrams do not change between
+builds. Outputs are stored under a key derived from the hashes of all
+inputs of the conversion, and reused whenever the same key comes up
+again. The cache is bounded in size, least recently used entries are
+evicted first.
+
+The size of the cache is counted once, when the first output is
+stored, and kept up to date by the outputs stored and evicted. Other
+processes sharing the cache directory are only accounted for when the
+cache is counted again, which eviction does.
+
+"""
+
+# imports
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from subprocess import Popen, PIPE
+from manifest_utils import hash_file
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "graphyte", "cache")
+DEFAULT_CACHE_SIZE = 512  # MB
+# eviction shrinks the cache to this fraction of its maximum size, so
+# that a full cache is not evicted again on every store
+EVICT_TARGET = 0.9
+
+# tool versions, computed once per process
+_tool_versions = dict()
+
+
+class RenderCache(object):
+    """Size-bounded LRU cache of rendered files.
+
+    Attributes:
+        cache_dir (str): Directory where entries are stored.
+        max_bytes (int): Maximum total size of the entries.
+
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_mb=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb) * 1024 * 1024
+        self._total = None  # size of the entries, None until counted
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind, *parts):
+        """Builds a cache key.
+
+        :param kind: type of cached output, e.g. "uml" or "svg"
+        :param parts: strings identifying all inputs of the conversion
+        :return: key string
+        """
+        h = hashlib.sha256(kind.encode('utf-8'))
+        for part in parts:
+            h.update(b'\0')
+            h.update((part or "").encode('utf-8'))
+        return kind + "-" + h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[-2:], key)
+
+    def get(self, key, dst_path):
+        """Copies a cached output to its destination.
+
+        :param key: cache key
+        :param dst_path: destination path
+        :return: True if found, False otherwise
+        """
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, dst_path)
+            os.utime(path)  # mark as recently used
+        except (IOError, OSError):
+            return False
+        return True
+
+    def put(self, key, src_path):
+        """Stores an output in the cache, evicting least recently used
+        entries if the cache grows over its maximum size.
+
+        :param key: cache key
+        :param src_path: path to the output to store
+        :return: None
+        """
+        path = self._path(key)
+        with self._lock:
+            if self._total is None:
+                self._total = sum(e[1] for e in self.entries())
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            shutil.copyfile(src_path, tmp_path)
+            size = os.path.getsize(tmp_path)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except (IOError, OSError) as e:
+            logger.warning('              Could not store ' + src_path
+                           + ' in render cache: ' + str(e) + '\r\n')
+            return
+        with self._lock:
+            self._total += size - replaced
+            if self._total > self.max_bytes:
+                self.evict()
+
+    def load(self, key):
+        """Reads a cached output.
+
+        :param key: cache key
+        :return: bytes, None if not found
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except (IOError, OSError):
+            return None
+        return data
+
+    def store(self, key, data):
+        """Stores an output given as bytes in the cache.
+
+        :param key: cache key
+        :param data: bytes to store
+        :return: None
+        """
+        fd, tmp_path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            self.put(key, tmp_path)
+        finally:
+            os.remove(tmp_path)
+
+    def entries(self):
+        """Lists cache entries.
+
+        :return: list of (last use time, size, path) tuples
+        """
+        result = []
+        for base, dirs, files in os.walk(self.cache_dir):
+            for file in files:
+                path = os.path.join(base, file)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                result.append((st.st_mtime, st.st_size, path))
+        return result
+
+    def evict(self):
+        """Counts the cache entries and, if the cache is over its
+        maximum size, removes least recently used entries until it
+        shrinks to EVICT_TARGET of it.
+
+        :return: None
+        """
+        entries = self.entries()
+        total = sum(e[1] for e in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TARGET
+            for mtime, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                total -= size
+        self._total = total
+
+    def clear(self):
+        """Removes all cache entries.
+
+        :return: None
+        """
+        if os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self._total = None
+
+
+def pyang_version(run_dir):
+    """Returns the version of the installed pyang.
+
+    :param run_dir: execution directory
+    :return: version string, empty if pyang is not available
+    """
+    if 'pyang' not in _tool_versions:
+        try:
+            p1 = Popen(["pyang", "--version"], cwd=run_dir, stdout=PIPE,
+                       stderr=PIPE, universal_newlines=True)
+            out, err = p1.communicate()
+            _tool_versions['pyang'] = out.strip()
+        except OSError:
+            _tool_versions['pyang'] = ""
+    return _tool_versions['pyang']
+
+
+def plantuml_version(run_dir):
+    """Returns the hash of the bundled plantuml.jar.
+
+    :param run_dir: execution directory
+    :return: hex digest string, empty if not found
+    """
+    if 'plantuml' not in _tool_versions:
+        jar = os.path.join(run_dir, "utils", "plantuml.jar")
+        _tool_versions['plantuml'] = hash_file(jar) or ""
+    return _tool_versions['plantuml']
@@ -1,10 +1,13 @@
 # imports
 import logging
 import getpass
-from conflux import Conflux
+from manifest_utils import hash_file, hash_text
+from output_utils import write_file
 import pprint
 import os
+import re
 import sys
+import json
 import datetime
 
 
@@ -16,16 +19,101 @@ logger = logging.getLogger('graphyte')
 
 pp = pprint.PrettyPrinter(indent=4)
 
-def build_confluence_page(d, c, p, s):
+# attachments uploaded and pages updated at a time
+DEFAULT_CONCURRENCY = 4
+
+# pages published by the last run, kept to sync the next one
+CONFLUENCE_STATE_NAME = ".graphyte-confluence.json"
+CONFLUENCE_STATE_FORMAT = 1
+# timestamp added to the title of new child pages
+TITLE_TIMESTAMP_RE = re.compile(r' ?\(\d{4}-\d\d-\d\d@\d\d:\d\d:\d\d\)')
+
+
+def load_sync_state(path, url):
+    """Reads the pages published by the last run to a Confluence
+    instance.
+
+    :param path: path to the sync state file
+    :param url: Confluence base URL
+    :return: dictionary of page id:dictionary with title, body hash
+     and version, empty if there is no state for url
+    """
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (IOError, OSError, ValueError):
+        return dict()
+    if state.get('format') != CONFLUENCE_STATE_FORMAT or state.get('url') != url:
+        return dict()
+    return state.get('pages', dict())
+
+
+def save_sync_state(path, url, pages):
+    """Writes the pages published to a Confluence instance.
+
+    :param path: path to the sync state file
+    :param url: Confluence base URL
+    :param pages: dictionary of page id:dictionary with title, body
+     hash and version
+    :return: None
+    """
+    state_dir = os.path.dirname(path) or "."
+    os.makedirs(state_dir, exist_ok=True)
+    write_file(path, json.dumps({
+        'format': CONFLUENCE_STATE_FORMAT,
+        'url': url,
+        'pages': pages
+    }, indent=1, sort_keys=True))
+
+
+def find_page(pages, title):
+    """Finds the page published for a title, as is or followed by the
+    timestamp added when the page was created.
+
+    :param pages: dictionary of title:page info, as returned by
+     Conflux.get_child_pages_info
+    :param title: page title without timestamp
+    :return: page title, None if not found
+    """
+    matches = sorted(
+        t for t in pages
+        if t == title or (t.startswith(title)
+                          and TITLE_TIMESTAMP_RE.fullmatch(t[len(title):]))
+    )
+    return matches[-1] if matches else None
+
+
+def build_confluence_page(d, c, p, s, concurrency=DEFAULT_CONCURRENCY,
+                          sync=False, state_path=None, tracer=None):
     """Create content structure in Confluence
     as a page tree for all Graphyte modules, under
     existing parent page. Optionally run user-provided
     post-script to perform additional actions.
+
+    The body of every page is built locally and published
+    with a single create or update. Attachments are uploaded
+    and pages updated concurrently, over a shared keep-alive
+    session.
+
+    In sync mode the page tree published by a previous run is
+    updated in place. Attachments whose hash matches the one
+    recorded in their comment are not uploaded again, and pages
+    whose body hash and version match the sync state are not
+    updated.
     :param d: model dictionary
+    :param c: Confluence base URL
     :param p: parent page URL
     :param s: post script to execute
+    :param concurrency: optional. Number of uploads or page
+     updates in progress at a time
+    :param sync: optional. Update the existing page tree in place
+    :param state_path: optional. Path to the sync state file
+    :param tracer: optional. Tracer recording every Confluence
+     request as a stage
     :return: boolean result
     """
+    # atlassian and its dependencies are only loaded when publishing
+    from conflux import Conflux, PageBody, pooled_session, HASH_COMMENT_PREFIX
 
     user_input = input("Confluence User (" + getpass.getuser() + "): ")
 
@@ -35,110 +123,233 @@ def build_confluence_page(d, c, p, s):
         url=c,
         username=usr,
         password=pwd,
-        timeout=1000)
+        timeout=1000,
+        session=pooled_session(concurrency))
+    if tracer:
+        conflux.tracer = tracer
 
-    if not conflux.test_connection():
+    if not conflux.with_retry(conflux.test_connection):
         sys.exit("Sorry, that login didn´t work (" + usr + "). Unable to reach Confluence base URL: " + c)
 
     # retrieve confluence ID of parent page
-    parent_id = conflux.get_page_id(p)
+    parent_id = conflux.with_retry(conflux.get_page_id, p)
 
     # get title for page
     title = next(iter(d))
 
-    #create new page under parent
-    print("creating main page")
-    page_id = conflux.create_empty_page_get_id(title, parent_id)
+    # pages published by the last run
+    state = load_sync_state(state_path, c) if state_path else dict()
+    # current version of the existing pages, by page id
+    versions = dict()
+
+    #create new page under parent, or find the existing one
+    page_id = None
+    children = dict()
+    if sync:
+        siblings = conflux.with_retry(conflux.get_child_pages_info, parent_id)
+        if title in siblings:
+            print("updating main page")
+            page_id = siblings[title]['id']
+            versions[page_id] = siblings[title]['version']
+            children = conflux.with_retry(conflux.get_child_pages_info, page_id)
+            for t in children:
+                versions[children[t]['id']] = children[t]['version']
+    if page_id is None:
+        print("creating main page")
+        page_id = conflux.with_retry(
+            conflux.create_empty_page_get_id, title, parent_id
+        )
+    # child pages of the model found in Confluence
+    synced = set()
+    # page bodies are built locally and published with a single
+    # update per page, once all attachments are uploaded
+    pages = []
+    uploads = []
+    body = PageBody()
     # add model files to page
     zip_file = d[title]["zipfile"]
-    print("attaching zip")
-    conflux.attach_file_get_id(zip_file, page_id, 'application/zip')
+    uploads.append((zip_file, page_id, 'application/zip'))
     href = conflux.build_attachchment_href(
         page_id,
         os.path.basename(zip_file),
         "Full interactive documentation attached."
     )
     del d[title]['zipfile']
-    conflux.append_header_to_page(page_id, "Full Model Documentation", "1")
-    conflux.append_body_to_page(page_id, href)
-    conflux.append_header_to_page(page_id, "Modules", "1")
-    conflux.append_children_macro(page_id)
+    body.append(conflux.build_header("Full Model Documentation", "1"))
+    body.append(href)
+    body.append(conflux.build_header("Modules", "1"))
+    body.append(conflux.build_children_macro())
 
     # todo: add model sources to page
 
     # add changes file
     if 'changesfile' in d[title]:
-        conflux.append_header_to_page(page_id, "CHANGES", "1")
-        body = conflux.build_template_body(d[title]['changesfile'])
-        conflux.append_body_to_page(page_id, body)
+        body.append(conflux.build_header("CHANGES", "1"))
+        body.append(conflux.build_template_body(d[title]['changesfile']))
         del d[title]['changesfile']
+    pages.append((page_id, title, body))
 
     # add variables table and upload as attachment
     if 'auth_params' in d[title]:
-        print("creating variables page")
-
         dtu = datetime.datetime.now()
         sdt = dtu.strftime("(%Y-%m-%d@%H:%M:%S)")
-        child_id = conflux.create_empty_page_get_id("Variable List" + sdt, page_id)
-
         params_workbook = d[title]['auth_params']
-        conflux.append_header_to_page(child_id, "Allowed Model Variables", "1")
-        print("  attaching xls/xlsx as file")
-        #conflux.append_header_to_page(child_id, "Allowed Model Variables File", "1")
-        conflux.attach_file_get_id(params_workbook, child_id, 'application/xls')
+        child_body = PageBody()
+        child_body.append(
+            conflux.build_header("Allowed Model Variables", "1")
+        )
         href = conflux.build_attachchment_href(
             page_id,
             os.path.basename(params_workbook),
             "Download Variable List as file.\n"
         )
-        conflux.append_body_to_page(child_id, href)
+        child_body.append(href)
 
         print("  creating variables table")
 
-        conflux.append_workbook_as_tables(child_id,params_workbook)
+        child_body.append(conflux.build_workbook_tables(params_workbook))
+        child_title = find_page(children, "Variable List")
+        if child_title:
+            print("updating variables page")
+            child_id = children[child_title]['id']
+            synced.add(child_title)
+            pages.append((child_id, child_title, child_body))
+        else:
+            print("creating variables page")
+            # variables page only links attachments of the main page,
+            # so it is created with its whole body
+            child_title = "Variable List" + sdt
+            child_id = conflux.with_retry(
+                conflux.create_page_get_id,
+                child_title, page_id, child_body
+            )
+            state[child_id] = {
+                'title': child_title,
+                'body': hash_text(str(child_body)),
+                'version': 1
+            }
+        uploads.append((params_workbook, child_id, 'application/xls'))
         if os.path.splitext(params_workbook)[1] == '.xlsx':
             ct = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         else:
             ct = "application/vnd.ms-excel"
-        conflux.attach_file_get_id(params_workbook, page_id, ct)
+        uploads.append((params_workbook, page_id, ct))
         del d[title]['auth_params']
 
-    # build child page for each remaining module
+    # create child page for each remaining module
+    module_pages = []
     for m in d[title]:
-        print("creating module page (%s)" % (m))
         m_noext = os.path.splitext(m)[0]
-        dtu = datetime.datetime.now()
-        sdt = dtu.strftime("(%Y-%m-%d@%H:%M:%S)")
-        child_id = conflux.create_empty_page_get_id(m_noext + " " + sdt, page_id)
+        child_title = find_page(children, m_noext)
+        if child_title:
+            print("updating module page (%s)" % (m))
+            child_id = children[child_title]['id']
+            synced.add(child_title)
+        else:
+            print("creating module page (%s)" % (m))
+            dtu = datetime.datetime.now()
+            sdt = dtu.strftime("(%Y-%m-%d@%H:%M:%S)")
+            child_title = m_noext + " " + sdt
+            child_id = conflux.with_retry(
+                conflux.create_empty_page_get_id, child_title, page_id
+            )
+        if 'modsvgpath' in d[title][m]:
+            svg_name = next(iter(d[title][m]['modsvgpath']))
+            svg_file = d[title][m]['modsvgpath'][svg_name]
+        else:
+            svg_file = d[title][m]['modpath']
+        uploads.append((svg_file, child_id, 'image/svg+xml'))
+        for t in d[title][m]["templates"]:
+            if os.path.splitext(t)[1] != ".csv":
+                uploads.append((d[title][m]["templates"][t], page_id,
+                                'application/binary'))
+        module_pages.append((m, child_id, child_title, svg_file))
+    for t in children:
+        if t not in synced:
+            logger.info("     Confluence page not in model, left as is: {}\r\n"
+                        .format(t))
+
+    # record the file hash in the comment of every attachment, and
+    # skip files already attached with the same hash
+    uploads = [(f, i, ct, HASH_COMMENT_PREFIX + (hash_file(f) or ""))
+               for f, i, ct in uploads]
+    attachments = dict()
+    if versions:
+        listings = conflux.run_concurrently(
+            conflux.get_attachments_info,
+            dict((i, (i,)) for i in set(u[1] for u in uploads) if i in versions),
+            concurrency
+        )
+        changed = []
+        for f, i, ct, comment in uploads:
+            att = (listings.get(i) or dict()).get(os.path.basename(f))
+            if att and att['comment'] == comment:
+                attachments[(i, os.path.basename(f))] = (att['id'], os.path.basename(f))
+            else:
+                changed.append((f, i, ct, comment))
+        uploads = changed
+
+    # upload all attachments
+    print("uploading %d attachments" % (len(uploads)))
+    results = conflux.attach_files(uploads, concurrency)
+    failed = [k[1] for k, v in results.items() if v is None]
+    if failed:
+        logger.error("     Could not upload to Confluence: {}\r\n"
+                     .format(", ".join(failed)))
+    attachments.update(results)
+
+    # build module pages
+    for m, child_id, child_title, svg_file in module_pages:
+        print("building module page (%s)" % (m))
+        child_body = PageBody()
         # add toc with title
         toc = conflux.build_scroll_ignore(
             conflux.build_toc_with_header("Table of Contents")
         )
-        conflux.append_body_to_page(child_id, toc)
-        conflux.append_header_to_page(child_id, m, "1")
-        conflux.append_header_to_page(child_id, "Diagram", "2")
+        child_body.append(toc)
+        child_body.append(conflux.build_header(m, "1"))
+        child_body.append(conflux.build_header("Diagram", "2"))
         print("  adding diagram")
-        if 'modsvgpath' in d[title][m]:
-            svg_name = next(iter(d[title][m]['modsvgpath']))
-            conflux.attach_svg_append_as_img(
-                child_id,
-                d[title][m]['modsvgpath'][svg_name]
-            )
-        else:
-            conflux.attach_svg_append_as_img(child_id, d[title][m]['modpath'])
+        att = attachments.get((child_id, os.path.basename(svg_file)))
+        child_body.append(
+            conflux.build_svg_img(child_id, svg_file, att[0] if att else "")
+        )
         if d[title][m]["templates"]:
-            conflux.append_header_to_page(child_id, "Module Templates", "2")
+            child_body.append(conflux.build_header("Module Templates", "2"))
             for t in d[title][m]["templates"]:
                 print("  adding template %s " % (t))
+                fp = d[title][m]["templates"][t]
                 if os.path.splitext(t)[1] == ".csv":
-                    fp = d[title][m]["templates"][t]
-                    conflux.append_csv_as_table(child_id, fp)
+                    child_body.append(conflux.build_csv_table(fp))
                 else:
-                    fp = d[title][m]["templates"][t]
-                    id, name = conflux.attach_file_get_id(fp, page_id)
+                    name = os.path.basename(fp)
                     href = conflux.build_attachchment_href(page_id, name, name)
-                    status = conflux.append_header_to_page(child_id, href, "3")
-                    body = conflux.build_template_body(fp)
-                    status = conflux.append_body_to_page(child_id, body)
+                    child_body.append(conflux.build_header(href, "3"))
+                    child_body.append(conflux.build_template_body(fp))
+        pages.append((child_id, child_title, child_body))
+
+    # skip pages not changed since the last run, neither locally
+    # nor in Confluence
+    hashes = dict((i, hash_text(str(b))) for i, t, b in pages)
+    if sync:
+        pages = [
+            (i, t, b) for i, t, b in pages
+            if i not in versions or i not in state
+            or state[i]['body'] != hashes[i]
+            or state[i]['version'] != versions[i]
+        ]
+
+    # publish page bodies
+    print("publishing %d pages" % (len(pages)))
+    published = conflux.publish_pages(pages, concurrency)
+    for i, t, b in pages:
+        if published[i]:
+            state[i] = {'title': t, 'body': hashes[i], 'version': published[i]}
+        else:
+            state.pop(i, None)
+    if not all(published.values()):
+        logger.error("     Could not publish all Confluence pages\r\n")
+    if state_path:
+        save_sync_state(state_path, c, state)
     print ("done.")
     return True
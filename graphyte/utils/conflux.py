@@ -8,28 +8,122 @@ Extends atlassian's Confluence.
 maintainer: Jorge Somavilla (@Cisco)
 
 requires: atlassian
-          xlrd
-          openpyxl
-          pandas
+          xlrd (xls workbooks)
+          openpyxl (workbook tables)
+          pandas (csv tables)
+
+The spreadsheet libraries are imported by the methods using them,
+so publishing pages without tables does not load them.
 
 """
 
 import json
+import hashlib
 import requests
 import urllib3
 import re
 import os
 import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from atlassian import Confluence
-import xlrd
-import openpyxl
-import pandas as pd
+from trace_utils import NULL_TRACER
 
 
 log = logging.getLogger(__name__)
 
+# HTTP status codes of transient errors, retried with backoff
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# attachment comment holding the hash of the uploaded file
+HASH_COMMENT_PREFIX = "graphyte sha256:"
+# size of the chunks written to disk while downloading
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# suffix of partially downloaded files, resumed by the next download
+PARTIAL_SUFFIX = ".part"
+
+
+def file_sha256(filepath):
+    """
+    Return SHA-256 hex digest of file, read in chunks.
+    :param filepath: path to file
+    :return: hex digest, None if the file cannot be read
+    """
+    h = hashlib.sha256()
+    try:
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                h.update(chunk)
+    except (IOError, OSError):
+        return None
+    return h.hexdigest()
+
+
+def pooled_session(pool_size):
+    """
+    Return requests session keeping up to pool_size connections
+    alive per host, to be shared by concurrent requests.
+    :param pool_size: number of connections per host
+    :return: requests Session
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PageBody(object):
+    """
+    Page body built locally, fragment by fragment, and published
+    with a single page create or update, instead of one update of
+    the whole page per fragment.
+    """
+
+    def __init__(self, body=""):
+        self.fragments = [body] if body else []
+
+    def append(self, body):
+        """
+        Append body fragment.
+        :param body: HTML body snippet
+        :return: self
+        """
+        self.fragments.append(body)
+        return self
+
+    def prepend(self, body):
+        """
+        Prepend body fragment.
+        :param body: HTML body snippet
+        :return: self
+        """
+        self.fragments.insert(0, body)
+        return self
+
+    def getvalue(self):
+        """
+        Return the page body.
+        :return: HTML body
+        """
+        return "".join(self.fragments)
+
+    def __str__(self):
+        return self.getvalue()
+
+
 class Conflux(Confluence):
 
+    # attempts after a failed request, and delay before the first one
+    # in seconds, doubled after each attempt
+    retries = 3
+    retry_backoff = 1.0
+    # records every request made through with_retry as a trace stage
+    tracer = NULL_TRACER
+
     def test_connection(self):
         """
         Return boolean True if connection worked,
@@ -42,12 +136,25 @@ class Conflux(Confluence):
         user = self.username
         pwd = self.password
         auth=(user, pwd)
-        r = requests.get(self.url, verify=False, headers=headers, auth=auth)
+        r = self._session.get(self.url, verify=False, headers=headers, auth=auth)
         if "<title>HTTP Status 401 – Unauthorized</title>" in r.text:
             return False
         else:
             return True
 
+    def get_cached_page_space(self, page_id):
+        """
+        Return space key of page, only requested to the server
+        the first time for each page.
+        :param page_id: confluence id of page
+        :return: space key
+        """
+        if not hasattr(self, '_page_spaces'):
+            self._page_spaces = dict()
+        if page_id not in self._page_spaces:
+            self._page_spaces[page_id] = self.get_page_space(page_id)
+        return self._page_spaces[page_id]
+
     def create_empty_page_get_id (self,title,parent_id):
         """
         Creates empty child page under parent page
@@ -56,39 +163,74 @@ class Conflux(Confluence):
         :param parent_id: Confluence ID of parent page
         :return: Child page ID
         """
-        space = self.get_page_space(parent_id)
+        return self.create_page_get_id(title, parent_id)
+
+    def create_page_get_id(self, title, parent_id, body=''):
+        """
+        Creates child page under parent page with its whole
+        body, and returns child page ID.
+        :param title: Child page title
+        :param parent_id: Confluence ID of parent page
+        :param body: HTML body or PageBody, optional.
+        :return: Child page ID
+        """
+        space = self.get_cached_page_space(parent_id)
         status = self.create_page(
             space=space,
             title=title,
-            body='',
+            body=str(body),
             parent_id=parent_id,
             type='page',
             representation='storage'
         )
-        if 'id' in status:
+        if status and 'id' in status:
             page_id = (status["id"])
         else:
             log.error('Could not create page and retrieve page id.')
             return
+        self._page_spaces[page_id] = space
         return page_id
 
+    def publish_page(self, page_id, title, body):
+        """
+        Replaces the whole body of existing page with a single
+        update.
+        :param page_id: confluence id of target page
+        :param title: page title
+        :param body: HTML body or PageBody
+        :return: new page version number, None if the update failed
+        """
+        status = self.update_page(
+            page_id,
+            title,
+            body=str(body),
+            representation='storage',
+            always_update=True
+        )
+        if not status or 'version' not in status:
+            log.error('Could not update page %s.' % (page_id))
+            return
+        return status['version']['number']
+
 
-    def attach_file_get_id (self,filepath,page_id,content_type='application/binary'):
+    def attach_file_get_id (self,filepath,page_id,content_type='application/binary',comment=None):
         """
         Add file as attachment. Optionally specifying
         content-type (default 'application/binary)'.
         :param filepath: Path to file to be attached
         :param page_id: confluence id of target page
+        :param comment: attachment comment, optional.
         :return: attachment ID,file name
         """
         filename = os.path.basename(filepath)
-        space = self.get_page_space(page_id)
+        space = self.get_cached_page_space(page_id)
         status = self.attach_file(
             filename=filepath,
             name=filename,
             content_type=content_type,
             page_id=page_id,
-            space=space
+            space=space,
+            comment=comment
             )
         if not status:
             log.error('Error uploading file %s: POST operation unsuccessful' % (filename))
@@ -107,6 +249,87 @@ class Conflux(Confluence):
                 return
         return r_id,filename
 
+    def with_retry(self, func, *args):
+        """
+        Call func, retrying with exponential backoff after
+        connection errors, interrupted responses, timeouts and
+        transient server errors.
+        :param func: function sending requests
+        :param args: arguments of func
+        :return: func result
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                with self.tracer.stage(func.__name__, attempt=attempt):
+                    return func(*args)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout,
+                    requests.exceptions.HTTPError) as e:
+                response = getattr(e, 'response', None)
+                status = getattr(response, 'status_code', None)
+                if attempt == self.retries or (
+                        isinstance(e, requests.exceptions.HTTPError)
+                        and status not in RETRY_STATUS):
+                    raise
+                delay = self.retry_backoff * 2 ** attempt
+                log.warning('%s failed (%s), retrying in %.1fs'
+                            % (func.__name__, repr(e), delay))
+                time.sleep(delay)
+
+    def run_concurrently(self, func, calls, concurrency=1):
+        """
+        Call func once per item of calls, up to concurrency calls at
+        a time, each one retried as in with_retry.
+        :param func: function sending requests
+        :param calls: dictionary of key:tuple of func arguments
+        :param concurrency: maximum number of calls in progress
+        :return: dictionary of key:func result, None if it failed
+        """
+        results = OrderedDict()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = OrderedDict(
+                (key, pool.submit(self.with_retry, func, *args))
+                for key, args in calls.items()
+            )
+            for key, future in futures.items():
+                try:
+                    results[key] = future.result()
+                except Exception as e:
+                    log.error('%s%s failed: %s' % (func.__name__, str(calls[key]), repr(e)))
+                    results[key] = None
+        return results
+
+    def attach_files(self, uploads, concurrency=1):
+        """
+        Add files as attachments, uploading up to concurrency
+        files at a time. Files with the same name uploaded to the
+        same page are only uploaded once.
+        :param uploads: list of (filepath, page_id, content_type,
+                        comment)
+        :param concurrency: maximum number of uploads in progress
+        :return: dictionary of (page_id, file name):(attachment ID,
+                 file name), None for failed uploads
+        """
+        calls = OrderedDict()
+        for filepath, page_id, content_type, comment in uploads:
+            key = (page_id, os.path.basename(filepath))
+            if key not in calls:
+                calls[key] = (filepath, page_id, content_type, comment)
+        return self.run_concurrently(self.attach_file_get_id, calls, concurrency)
+
+    def publish_pages(self, pages, concurrency=1):
+        """
+        Replace the whole body of existing pages, updating up to
+        concurrency pages at a time.
+        :param pages: list of (page_id, title, body)
+        :param concurrency: maximum number of updates in progress
+        :return: dictionary of page_id:new page version number, None
+                 for failed updates
+        """
+        calls = OrderedDict((page[0], page) for page in pages)
+        return self.run_concurrently(self.publish_page, calls, concurrency)
+
     def attach_svg_get_id (self,filepath,page_id):
         """
         Add SVG file as attachment. It is added with
@@ -151,7 +374,8 @@ class Conflux(Confluence):
         user = self.username
         pwd = self.password
         auth=(user, pwd)
-        r = requests.get(url, verify=False, headers=headers, auth=auth)
+        r = self._session.get(url, verify=False, headers=headers, auth=auth)
+        r.raise_for_status()
         if re.match(r'.*/rest/api/.*', url):
             id = self.get_page_id_from_json(r.json())
         else:
@@ -185,6 +409,17 @@ class Conflux(Confluence):
             id = match
         return id
 
+    def build_header(self, header, header_type="1"):
+        """
+        Return header field body, optionally choosing
+        header type (default 1 -> h1)
+        :param header: header text
+        :param header_type: Level of the header.
+                            One of {1|2|3|4|5|6|7}
+        :return: the HTML header snippet
+        """
+        return "<p><h" + header_type +">" + header + "</h" + header_type + "></p>"
+
     def prepend_header_to_page(self, page_id, header, header_type=1):
         """
         Append header field to page body, optionally choosing
@@ -195,8 +430,7 @@ class Conflux(Confluence):
                             One of {1|2|3|4|5|6|7}
         :return: True if all ok
         """
-        body = "<p><h" + header_type +">" + header + "</h" + header_type + "></p>"
-        self.prepend_to_page(page_id, body)
+        self.prepend_to_page(page_id, self.build_header(header, header_type))
         return True
 
     def append_header_to_page(self, page_id, header, header_type=1):
@@ -209,8 +443,7 @@ class Conflux(Confluence):
                             One of {1|2|3|4|5|6|7}
         :return: True if all ok
         """
-        body = "<p><h" + header_type +">" + header + "</h" + header_type + "></p>"
-        self.append_to_page(page_id, body)
+        self.append_to_page(page_id, self.build_header(header, header_type))
         return True
 
     def append_p_to_page(self, page_id, p):
@@ -277,16 +510,15 @@ class Conflux(Confluence):
         urlified = re.sub(r' ', r'%20', filename.rstrip())
         return urlified
 
-    def attach_svg_append_as_img(self, page_id, svg_file):
+    def build_svg_img(self, page_id, svg_file, att_id):
         """
-        Upload SVG file as attachment to page, and append
-        to page body as HTML <img> tag.
-        :param page_id: confluence id of target page
-        :param svg_file: path to SVG file to be attached
-        :return: True if all ok
+        Return HTML <img> tag displaying SVG file attached to page.
+        :param page_id: confluence id of page holding the attachment
+        :param svg_file: path to attached SVG file
+        :param att_id: attachment ID
+        :return: the HTML <img> snippet
         """
-        att_id = self.attach_svg_get_id(svg_file,page_id)
-        body = "<p><span class=\"confluence-embedded-file-wrapper\">" \
+        return "<p><span class=\"confluence-embedded-file-wrapper\">" \
                "<img class=\"confluence-embedded-image\" " \
                "src=\"/conf/download/attachments/" + page_id + "/" \
                + self.urlify_name(svg_file) \
@@ -300,6 +532,27 @@ class Conflux(Confluence):
                + "\" data-linked-resource-content-type=\"image/svg+xml\" " \
                  "data-linked-resource-container-id=\"" + page_id \
                + "\" data-linked-resource-container-version=\"63\"></img></span></p>"
+
+    def attach_svg_get_img(self, page_id, svg_file):
+        """
+        Upload SVG file as attachment to page, and return
+        HTML <img> tag displaying it.
+        :param page_id: confluence id of target page
+        :param svg_file: path to SVG file to be attached
+        :return: the HTML <img> snippet
+        """
+        att = self.attach_svg_get_id(svg_file,page_id)
+        return self.build_svg_img(page_id, svg_file, att[0] if att else "")
+
+    def attach_svg_append_as_img(self, page_id, svg_file):
+        """
+        Upload SVG file as attachment to page, and append
+        to page body as HTML <img> tag.
+        :param page_id: confluence id of target page
+        :param svg_file: path to SVG file to be attached
+        :return: True if all ok
+        """
+        body = self.attach_svg_get_img(page_id, svg_file)
         title = self.get_page_title(page_id)
         status = self.append_page(
             title=title,
@@ -353,35 +606,94 @@ class Conflux(Confluence):
         :return: HTML table body with file contents
         """
         with open(filepath, encoding="utf8", errors="ignore") as tf:
-            body = "<table class=\"wrapped relative-table\" style=\"width: 100.0%;\"><colgroup>" \
-                   "<col style=\"width: 100.0%;\" /></colgroup><tbody><tr><th><div class=\"content-wrapper\">"
+            body = ["<table class=\"wrapped relative-table\" style=\"width: 100.0%;\"><colgroup>"
+                    "<col style=\"width: 100.0%;\" /></colgroup><tbody><tr><th><div class=\"content-wrapper\">"]
             for l in tf:
                 l = re.sub(r'&', r'&amp;', l.rstrip())
                 l = re.sub(r'<', r'&lt;', l.rstrip())
                 l = re.sub(r'>', r'&gt;', l.rstrip())
                 if l == "":
                     l = "<br/>"
-                body = body + "<pre>" + l + "</pre>"
-        body = body + "</div></th></tr></tbody></table>"
-        return body
+                body.append("<pre>" + l + "</pre>")
+        body.append("</div></th></tr></tbody></table>")
+        return "".join(body)
 
 
-    def download_all_attachments(self, page_id, dir, pattern=".*"):
+    def download_all_attachments(self, page_id, dir, pattern=".*", concurrency=1):
         """
         Download all attachments in page, optionally matching regex pattern
-        to filenames.
+        to filenames. Up to concurrency files are downloaded at a time,
+        streamed to disk. Files already in dir are skipped if their hash
+        matches the one in the attachment comment or, for attachments
+        without hash, if their size matches.
         :param page_id: confluence id of target page
         :param dir: target directory where attachments should be downloaded
         :param pattern: regex pattern to filter filenames to be downloaded
+        :param concurrency: maximum number of downloads in progress, optional.
         :return: True if all ok
         """
-        d = self.get_attachments_urls(page_id)
-        for name in d:
+        d = self.get_attachments_info(page_id)
+        calls = OrderedDict()
+        for name in sorted(d):
             if re.match(pattern, name):
-                auth = (self.username, self.password)
-                r = requests.get(self.url + d[name], verify=False, auth=auth)
-                with open(dir + '/' + name, 'wb') as f:
-                    f.write(r.content)
+                filepath = os.path.join(dir, name)
+                if self.is_downloaded(filepath, d[name]):
+                    log.info('%s is up to date, skipping download' % (name))
+                    continue
+                calls[name] = (self.url + d[name]['download'], filepath,
+                               d[name]['size'])
+        results = self.run_concurrently(self.download_file, calls, concurrency)
+        return all(results.values())
+
+
+    def is_downloaded(self, filepath, att):
+        """
+        Return boolean True if local file matches attachment,
+        False otherwise.
+        :param filepath: path to local copy of attachment
+        :param att: attachment info, as returned by get_attachments_info
+        :return: Boolean
+        """
+        if not os.path.isfile(filepath):
+            return False
+        if att['comment'].startswith(HASH_COMMENT_PREFIX):
+            return file_sha256(filepath) == att['comment'][len(HASH_COMMENT_PREFIX):]
+        return att['size'] is not None and os.path.getsize(filepath) == att['size']
+
+
+    def download_file(self, url, filepath, size=None):
+        """
+        Download file streaming it to disk in chunks. The file is
+        written to filepath.part first, and a download interrupted
+        before is resumed from the end of that file.
+        :param url: download URL
+        :param filepath: target file path
+        :param size: expected file size in bytes, optional.
+        :return: True if all ok
+        """
+        part = filepath + PARTIAL_SUFFIX
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        if size is not None and offset > size:
+            offset = 0
+        headers = {'Range': 'bytes=%d-' % (offset)} if offset else {}
+        auth = (self.username, self.password)
+        with self._session.get(url, verify=False, auth=auth, headers=headers,
+                               stream=True) as r:
+            if r.status_code == 416 and offset == size:
+                # partial file already complete
+                pass
+            else:
+                r.raise_for_status()
+                # servers ignoring the range send the whole file
+                mode = 'ab' if offset and r.status_code == 206 else 'wb'
+                with open(part, mode) as f:
+                    for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+        if size is not None and os.path.getsize(part) != size:
+            raise requests.exceptions.ConnectionError(
+                'Incomplete download of %s: %d of %d bytes'
+                % (url, os.path.getsize(part), size))
+        os.replace(part, filepath)
         return True
 
 
@@ -392,20 +704,70 @@ class Conflux(Confluence):
         :param jump: pagination size when listing attachments, optional.
         :return: dictionary of filename:download_url
         """
+        d = self.get_attachments_info(page_id, jump)
+        return dict((name, d[name]['download']) for name in d)
+
+
+    def get_attachments_info(self, page_id, jump=50):
+        """
+        Get ID, download URL, size and comment of all attachments
+        :param page_id: confluence id of target page
+        :param jump: pagination size when listing attachments, optional.
+        :return: dictionary of filename:dictionary with id, download,
+                 size and comment
+        """
         d = dict()
         params = {}
         params['start'] = 0
         params['limit'] = jump
         next = 'rest/api/content/{id}/child/attachment'\
-            .format(id=page_id, params=params)
+            .format(id=page_id)
         while next:
-            result = self.get(next)
+            result = self.get(next, params=params)
             for att in result['results']:
                 title = att['title']
                 dl = att['_links']['download']
-                d[title.rstrip()] = dl.rstrip()
+                extensions = att.get('extensions', {})
+                comment = att.get('metadata', {}).get(
+                    'comment', extensions.get('comment', ''))
+                d[title.rstrip()] = {
+                    'id': att['id'],
+                    'download': dl.rstrip(),
+                    'size': extensions.get('fileSize'),
+                    'comment': comment or ''
+                }
             if 'next' in result['_links']:
+                # next link already carries start and limit
                 next = result['_links']['next']
+                params = None
+            else:
+                next = ''
+        return d
+
+
+    def get_child_pages_info(self, page_id, jump=50):
+        """
+        Get ID and version of all child pages
+        :param page_id: confluence id of parent page
+        :param jump: pagination size when listing pages, optional.
+        :return: dictionary of title:dictionary with id and version
+        """
+        d = dict()
+        params = {}
+        params['start'] = 0
+        params['limit'] = jump
+        params['expand'] = 'version'
+        next = 'rest/api/content/{id}/child/page'.format(id=page_id)
+        while next:
+            result = self.get(next, params=params)
+            for page in result['results']:
+                d[page['title']] = {
+                    'id': page['id'],
+                    'version': page.get('version', {}).get('number')
+                }
+            if 'next' in result['_links']:
+                next = result['_links']['next']
+                params = None
             else:
                 next = ''
         return d
@@ -475,55 +837,60 @@ class Conflux(Confluence):
                separators = (', ', ' : '))
                )
 
-    def append_workbook_as_tables(self, page_id, workbook, sheet_name=None):
+    def build_workbook_tables(self, workbook, sheet_name=None):
         '''
-        Appends workbook sheets as tables to target page body.
-        Optionally select title of sheet to be appended, by default
-        all sheets in workbook are added to the page.
-        :param page_id: confluence id of target page
+        Return workbook sheets as tables body.
+        Optionally select title of sheet to be added, by default
+        all sheets in workbook are added.
         :param workbook: excel workbook file.
         :param sheet_name: optional, name of sheet to process
         (will ignore the others). By default processes all sheets.
-        :return: True if all ok
+        :return: HTML body, None if sheet_name is not in the workbook
         '''
         # todo: if xls call xls_to_xlsx ()
+        import openpyxl
         wb = openpyxl.load_workbook(workbook)
         if sheet_name:
-            match = False
-            for sn in wb.sheetnames:
-                if sn == sheet_name:
-                    match = True
-            if match:
-                s = wb[sheet_name]
-                self.append_sheet_as_table(page_id,s)
-            else:
+            if sheet_name not in wb.sheetnames:
                 log.error('Error fetching sheet %s: '
                           'not found in workbook %s'
                           % (sheet_name,workbook))
-                return False
-        else:
-            sheet_names = wb.get_sheet_names()
-            for sn in sheet_names:
-                s = wb[sn]
-                self.append_sheet_as_table(page_id,s)
-        return True
+                return None
+            return self.build_sheet_table(wb[sheet_name])
+        return "".join(self.build_sheet_table(wb[sn]) for sn in wb.sheetnames)
 
-    def append_sheet_as_table(self, page_id, sheet):
+    def append_workbook_as_tables(self, page_id, workbook, sheet_name=None):
         '''
-        Adds contents of openpyxl sheet to target page
-        as an HTML table inside a scroll-title element.
+        Appends workbook sheets as tables to target page body.
+        Optionally select title of sheet to be appended, by default
+        all sheets in workbook are added to the page.
         :param page_id: confluence id of target page
-        :param sheet: openpyxl sheet object.
+        :param workbook: excel workbook file.
+        :param sheet_name: optional, name of sheet to process
+        (will ignore the others). By default processes all sheets.
         :return: True if all ok
         '''
-        body = "<p class=\"auto-cursor-target\"><br /></p>" \
-               "<ac:structured-macro ac:name=\"scroll-title\" ac:schema-version=\"1\">" \
-               "<ac:parameter ac:name=\"title\">" + sheet.title + \
-               "</ac:parameter><ac:rich-text-body>" \
-               "<p class=\"auto-cursor-target\"><br /></p>"
-        body = body + "<table><tbody>"
+        body = self.build_workbook_tables(workbook, sheet_name)
+        if body is None:
+            return False
+        self.append_body_to_page(page_id, body)
+        return True
+
+    def build_sheet_table(self, sheet):
+        '''
+        Return contents of openpyxl sheet as an HTML table
+        inside a scroll-title element.
+        :param sheet: openpyxl sheet object.
+        :return: HTML body
+        '''
+        body = ["<p class=\"auto-cursor-target\"><br /></p>"
+                "<ac:structured-macro ac:name=\"scroll-title\" ac:schema-version=\"1\">"
+                "<ac:parameter ac:name=\"title\">" + sheet.title +
+                "</ac:parameter><ac:rich-text-body>"
+                "<p class=\"auto-cursor-target\"><br /></p>"
+                "<table><tbody>"]
         for row in sheet.iter_rows(max_row=sheet.max_row, max_col=sheet.max_column):
-            body = body + "<tr>"
+            body.append("<tr>")
             for cell in row:
                 v = str(cell.value) or ""
                 v = re.sub(r'<', r'&lt;', v)
@@ -531,49 +898,75 @@ class Conflux(Confluence):
                 v = re.sub(r'"', r'&quot;', v)
                 v = re.sub(r'\\', r'\\\\', v)
                 if str(cell.row) == "1":
-                    body = body + "<th>" + v + "</th>"
+                    body.append("<th>" + v + "</th>")
                 else:
-                    body = body + "<td>" + v + "</td>"
-            body = body + "</tr>"
-        body = body + "</tbody></table>"
-        body = body + "<p class=\"auto-cursor-target\"><br /></p>" \
-                      "</ac:rich-text-body></ac:structured-macro><p><br /></p>"
-        self.append_body_to_page(page_id,body)
-        return True
+                    body.append("<td>" + v + "</td>")
+            body.append("</tr>")
+        body.append("</tbody></table>"
+                    "<p class=\"auto-cursor-target\"><br /></p>"
+                    "</ac:rich-text-body></ac:structured-macro><p><br /></p>")
+        return "".join(body)
 
-    def append_csv_as_table(self, page_id, csv_file):
+    def append_sheet_as_table(self, page_id, sheet):
         '''
-        Adds contents of csv file to target page
+        Adds contents of openpyxl sheet to target page
         as an HTML table inside a scroll-title element.
         :param page_id: confluence id of target page
-        :param csv_file: csv file.
+        :param sheet: openpyxl sheet object.
         :return: True if all ok
         '''
+        self.append_body_to_page(page_id, self.build_sheet_table(sheet))
+        return True
+
+    def build_csv_table(self, csv_file):
+        '''
+        Return contents of csv file as an HTML table
+        inside a scroll-title element.
+        :param csv_file: csv file.
+        :return: HTML body
+        '''
+        import pandas as pd
         c = pd.read_csv(csv_file)
         table = c.to_html()
-        body = "<p class=\"auto-cursor-target\"><br /></p>" \
+        return "<p class=\"auto-cursor-target\"><br /></p>" \
                "<ac:structured-macro ac:name=\"scroll-title\" ac:schema-version=\"1\">" \
                "<ac:parameter ac:name=\"title\">" + os.path.basename(csv_file) + \
                "</ac:parameter><ac:rich-text-body>" \
                "<p class=\"auto-cursor-target\"><br /></p>" + table + \
                "<p class=\"auto-cursor-target\"><br /></p>" \
                "</ac:rich-text-body></ac:structured-macro><p><br /></p>"
-        self.append_body_to_page(page_id, body)
-        return True
 
-    def append_children_macro(self, page_id, depth="1"):
+    def append_csv_as_table(self, page_id, csv_file):
         '''
-        Adds a list of child pages to page body.
+        Adds contents of csv file to target page
+        as an HTML table inside a scroll-title element.
         :param page_id: confluence id of target page
-        :param depth: number of child levels to display.
+        :param csv_file: csv file.
         :return: True if all ok
         '''
-        body = "<p><ac:structured-macro ac:name=\"children\" " \
+        self.append_body_to_page(page_id, self.build_csv_table(csv_file))
+        return True
+
+    def build_children_macro(self, depth="1"):
+        '''
+        Return list of child pages macro.
+        :param depth: number of child levels to display.
+        :return: HTML body
+        '''
+        return "<p><ac:structured-macro ac:name=\"children\" " \
                "ac:schema-version=\"2\">" \
                "<ac:parameter ac:name=\"depth\">" + depth + \
                "</ac:parameter><ac:parameter ac:name=\"sort\">" \
                "creation</ac:parameter></ac:structured-macro></p>"
-        self.append_body_to_page(page_id,body)
+
+    def append_children_macro(self, page_id, depth="1"):
+        '''
+        Adds a list of child pages to page body.
+        :param page_id: confluence id of target page
+        :param depth: number of child levels to display.
+        :return: True if all ok
+        '''
+        self.append_body_to_page(page_id, self.build_children_macro(depth))
         return True
 
     def xls_to_xlsx(self, filename):
@@ -584,6 +977,7 @@ class Conflux(Confluence):
         :param filename: xls file.
         :return: xlsx file
         '''
+        import xlrd
         book = xlrd.open_workbook(filename)
         index = 0
         nrows, ncols = 0, 0
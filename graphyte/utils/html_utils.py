@@ -6,13 +6,23 @@ Tools to assist with graphyte HTML creation and other XML-related tasks.
 """
 
 # imports
+import json
 import logging
 import os
 import re
+import threading
 from subprocess import Popen, PIPE
 from tempfile import mkstemp
 from os import fdopen
 from shutil import move, copy
+from plantuml_utils import render
+from manifest_utils import hash_file, hash_text, yang_dependencies
+from xml.parsers.expat import ExpatError
+from svg_utils import SvgRewriter, link_type
+from output_utils import OutputBuffer, SpooledOutput, CompiledTemplate, \
+    write_file
+from search_utils import SEARCH_DIR, SEARCH_INDEX_NAME
+from cache_utils import RenderCache, pyang_version, plantuml_version
 import pprint
 # import webbrowser
 
@@ -24,6 +34,31 @@ logger = logging.getLogger('graphyte')
 
 pp = pprint.PrettyPrinter(indent=4)
 
+UTILS_DIR = os.path.dirname(os.path.abspath(__file__))
+MOD_TEMPLATE_PATH = os.path.join(UTILS_DIR, "mod_template")
+MOD_TEMPLATE_SLOTS = (
+    "webTitle", "viewer_css", "viewer_js", "search_js", "search_box", "svg",
+    "templates", "menu", "alert", "viewer_init_content", "xls", "changes_tab"
+)
+# viewer runtime, inlined in every module or written once per model
+VIEWER_CSS_PATH = os.path.join(UTILS_DIR, "viewer.css")
+VIEWER_CSS_SLOTS = ("menuwidth",)
+VIEWER_JS_PATH = os.path.join(UTILS_DIR, "viewer.js")
+VIEWER_JS_SLOTS = ("params_csv_js", "changes_file_js")
+VIEWER_ASSET_PREFIX = "graphyte-viewer."
+# model search, written once per model
+SEARCH_JS_PATH = os.path.join(UTILS_DIR, "search.js")
+SEARCH_JS_SLOTS = ("search_index_js",)
+SEARCH_ASSET_PREFIX = "graphyte-search."
+SEARCH_BOX = '<li id="searchbox" style="float:left; padding: 6px 0px 0px 20px">' \
+    '<input id="searchInput" type="search" placeholder="Search model" ' \
+    'size="30"></li>'
+
+# templates compiled by this process, by path
+_compiled_templates = dict()
+_compiled_templates_lock = threading.Lock()
+
+
 def yang_2_uml(gm):
     """Convert YANG module into UML format and store in
     graphyte module object (in_diagram_path attribute).
@@ -37,6 +72,17 @@ def yang_2_uml(gm):
     work_uml_path = gm.work_dir + "/" + yang_fname_no_ext + ".uml"
     copy(gm.in_diagram_path,work_yang_path)
     uml_no_option = "--uml-no=" + gm.pyang_uml_no
+    cache_key = ""
+    if gm.render_cache:
+        cache_key = RenderCache.key(
+            "uml", hash_file(work_yang_path), yang_fname, uml_no_option,
+            pyang_version(gm.run_dir),
+            *yang_dependencies(gm.in_diagram_path, gm.file_index)
+        )
+        if gm.render_cache.get(cache_key, work_uml_path):
+            logger.info('         Reusing cached UML for ' + yang_fname + '\r\n')
+            gm.in_diagram_path = work_uml_path
+            return True
     #print ("\npyang --ignore-errors " + uml_no_option + " -f uml " + work_yang_path + " -o " + work_uml_path)
     p1 = Popen(["pyang", "--ignore-errors", uml_no_option, "-f", "uml", work_yang_path,
                 "-o", work_uml_path], cwd=gm.run_dir, stdout=PIPE, stderr=PIPE)
@@ -64,6 +110,8 @@ def yang_2_uml(gm):
     if os.path.exists(work_uml_path):
         os.remove(work_uml_path)
     copy(tmp_uml_path, work_uml_path)
+    if cache_key:
+        gm.render_cache.put(cache_key, work_uml_path)
     # store as reference diagram
     gm.in_diagram_path = work_uml_path
     return result
@@ -97,11 +145,18 @@ def uml_2_svg(gm):
     copy(tmp_uml_path, work_uml_path)
     plantuml_out_file = gm.work_dir + "/" + os.path.splitext(gm.in_diagram_name)[0] + ".svg"
 
-    # TODO: cath exception if plantuml not in place
-    #print ("java -Xmx1024m -jar utils/plantuml.jar -v -tsvg " + work_uml_path + " -o " + gm.work_dir)
-    p1 = Popen(["java","-Xmx1024m", "-jar", "utils/plantuml.jar", "-v", "-tsvg", work_uml_path,
-                "-o", gm.work_dir], cwd=gm.run_dir, stdout=PIPE, stderr=PIPE)
-    p1.communicate()  # wait for plantuml execution
+    cache_key = ""
+    if gm.render_cache:
+        cache_key = RenderCache.key(
+            "svg", hash_file(work_uml_path), plantuml_version(gm.run_dir)
+        )
+    if cache_key and gm.render_cache.get(cache_key, plantuml_out_file):
+        logger.info('             reusing cached SVG\r\n')
+    else:
+        # TODO: cath exception if plantuml not in place
+        render(work_uml_path, gm.work_dir, gm.run_dir, gm.plantuml_server)
+        if cache_key and os.path.exists(plantuml_out_file):
+            gm.render_cache.put(cache_key, plantuml_out_file)
     gm.svg_path = plantuml_out_file
     d = dict()
     d['modsvgpath'] = { os.path.basename(plantuml_out_file) : plantuml_out_file }
@@ -110,35 +165,32 @@ def uml_2_svg(gm):
     return d
 
 
-def atag_2_gtag(svg_lines, i):
-    """Figures out if <a tag should be replaced by <g tag
-    in SVG link group, depending on link label used:
+def link_index(svg_lines):
+    """Figures out, for every SVG line, if an <a tag found in it
+    should be replaced by <g tag in SVG link group, depending on
+    the first link label found from that line onwards:
 
-    <a ... xlink:href="mod:module.svg" -> do not replace by <g
-    <a ... xlink:href="lit:http://cisco.com" -> do not replace by <g
-    <a ... xlink:href="myfile.txt" -> replace by <g
+    <a ... xlink:href="mod:module.svg" -> "mod", do not replace by <g
+    <a ... xlink:href="lit:http://cisco.com" -> "lit", do not replace by <g
+    <a ... xlink:href="myfile.txt" -> "file", replace by <g
+
+    Lines are scanned once, from last to first, so the link type of
+    every anchor is known in a single linear pass.
 
     :param svg_lines: List of SVG lines
-    :param i: current line
-    :return: True if replace required, False otherwise.
+    :return: list of link types, one per line.
     """
-    while i < len(svg_lines):
+    link_re = re.compile('xlink:href="(.*?)"')
+    index = [None] * len(svg_lines)
+    kind = "file"  # no link found after the anchor
+    for i in range(len(svg_lines) - 1, -1, -1):
         line = svg_lines[i]
-        try:
-            link = re.search('xlink:href="(.*?)"', line).group(1)
-        except AttributeError:
-            link = False
-        if link:
-            mod = re.search('mod:(.*)', link)
-            lit = re.search('lit:(.*)', link)
-            if mod:
-                return False
-            elif lit:
-                return False
-            else:
-                return True
-        i += 1
-    return True
+        if 'xlink:href="' in line:
+            link = link_re.search(line)
+            if link and link.group(1):
+                kind = link_type(link.group(1))
+        index[i] = kind
+    return index
 
 
 def guess_module(gm, name, fullname):
@@ -174,17 +226,42 @@ def process_svg(gm):
     Plantuml, Draw.io, Visio specific sections are
     removed or modified to achieve browser support.
 
-    :param gm: the graphyte module object
-    :return: processed_svg, the processed SVG
+    The SVG is rewritten in a single streaming pass into a
+    SpooledOutput, so memory stays bounded for large diagrams. SVG
+    files that are not well-formed XML are processed line by line
+    instead, discarding the partial output.
 
+    :param gm: the graphyte module object
+    :return: SpooledOutput holding the processed SVG, to be closed by
+     the caller
     """
+    logger.info('         Processing SVG file...' + '\r\n')
+    svg_fname = os.path.basename(gm.svg_path)
+    logger.info('             ' + svg_fname + '\r\n')
+    out = SpooledOutput()
+    try:
+        SvgRewriter(gm, out, guess_module).rewrite(gm.svg_path)
+    except ExpatError as e:
+        logger.warning('              ' + svg_fname + ' is not well-formed XML ('
+                       + str(e) + '), processing line by line.\r\n')
+        out.close()
+        out = SpooledOutput()
+        gm.svg_links = []
+        out.write(process_svg_lines(gm))
+    logger.info('         ...ok' + '\r\n')
+    return out
 
-    # TODO: use xpath
 
-    logger.info('         Processing SVG file...' + '\r\n')
+def process_svg_lines(gm):
+    """Process SVG line by line so it can be embedded in HTML.
+
+    Used for SVG files that cannot be parsed as XML.
+
+    :param gm: the graphyte module object
+    :return: processed_svg, the processed SVG
+
+    """
     with open(gm.svg_path, 'r') as f:
-        svg_fname = os.path.basename(gm.svg_path)
-        logger.info('             ' + svg_fname + '\r\n')
         content = f.read()
 
         # plantuml svg
@@ -205,7 +282,7 @@ def process_svg(gm):
                              , r'viewBox="0 0 \1 \2"', content)
             content = re.sub(r'><', '>\n<', content)
 
-        processed_svg = ""
+        processed_svg = []
         a_tag = False
         svg_tag_level = 0
         svg_tag = False
@@ -215,6 +292,7 @@ def process_svg(gm):
         curr_tag = ""
 
         svg_lines = content.splitlines()
+        links = link_index(svg_lines)
         i = 0
         while i < len(svg_lines):
             line = svg_lines[i]
@@ -239,7 +317,7 @@ def process_svg(gm):
                 a_g_stack.append("g")
             if re.match(r'^\s*<a', line):
                 a_tag = True
-                if atag_2_gtag(svg_lines, i):
+                if links[i] == "file":
                     a_g_stack.append("g")
                     line = re.sub(r'<a', r'<g', line.rstrip())
                 else:
@@ -286,13 +364,12 @@ def process_svg(gm):
             if in_foreign_obj and not is_drawio_file:  # add here other conditions to skip line
                 skip_line = True
             if not skip_line:
-                processed_svg += (line.rstrip() + "\n")  # appends
+                processed_svg.append(line.rstrip() + "\n")
             skip_line = False
 
             # increase loop index
             i += 1
-    logger.info('         ...ok' + '\r\n')
-    return processed_svg
+    return "".join(processed_svg)
 
 
 def build_menu(gm):
@@ -306,22 +383,159 @@ def build_menu(gm):
     :return: None
     """
     logger.info('         Building navigation menu...' + '\r\n')
+    menu_tags = [gm.menu_tags]
     if gm.menu_items:
         item_list = gm.menu_items.split(",")
         for item in item_list:
             item = item.strip()
             item_no_sp = re.sub(r'\s+', r'_', item)
-            gm.menu_tags += "<li><a href=\"" + gm.model_no_sp \
-                            + "_" + item_no_sp + "_v" + gm.version \
-                            + ".html\">" + item + "</a></li>"
+            menu_tags.append("<li><a href=\"" + gm.model_no_sp
+                             + "_" + item_no_sp + "_v" + gm.version
+                             + ".html\">" + item + "</a></li>")
     else:
-        gm.menu_tags += "<li><a href=\"" + gm.model_no_sp \
-                        + "_" + gm.module_no_sp + "_v" + gm.version \
-                        + ".html\">" + gm.module + "</a></li>"
+        menu_tags.append("<li><a href=\"" + gm.model_no_sp
+                         + "_" + gm.module_no_sp + "_v" + gm.version
+                         + ".html\">" + gm.module + "</a></li>")
+    gm.menu_tags = "".join(menu_tags)
     logger.info('         ...ok' + '\r\n')
     return
 
 
+def get_compiled_template(path, slots):
+    """Returns a text template compiled by this process, compiling it
+    again if the file changed since.
+
+    :param path: path to the template file
+    :param slots: names of the template slots
+    :return: CompiledTemplate
+    """
+    with _compiled_templates_lock:
+        template = _compiled_templates.get(path)
+        if template is None or not template.is_current():
+            template = CompiledTemplate(path, slots)
+            _compiled_templates[path] = template
+        return template
+
+
+def get_mod_template():
+    """Returns mod_template compiled by this process.
+
+    :return: CompiledTemplate
+    """
+    return get_compiled_template(MOD_TEMPLATE_PATH, MOD_TEMPLATE_SLOTS)
+
+
+def fill_template(template, values):
+    """Fills a compiled template into a string.
+
+    :param template: CompiledTemplate
+    :param values: dictionary of slot name:string
+    :return: string
+    """
+    out = OutputBuffer()
+    template.write(out, values)
+    return out.getvalue()
+
+
+def write_viewer_asset(out_dir, text, ext, prefix=VIEWER_ASSET_PREFIX):
+    """Writes a viewer asset to the output directory, named after
+    the hash of its contents, unless it is already there.
+
+    :param out_dir: output directory
+    :param text: asset contents
+    :param ext: file extension, ".css" or ".js"
+    :param prefix: optional. Asset file name prefix
+    :return: asset file name
+    """
+    name = prefix + hash_text(text)[:16] + ext
+    path = os.path.join(out_dir, name)
+    if not os.path.isfile(path):
+        write_file(path, text)
+    return name
+
+
+def build_viewer(gm):
+    """Builds the viewer CSS and JS of a module.
+
+    By default both are embedded in the module HTML file. If the module
+    uses a shared viewer, they are written once per model to
+    graphyte-viewer.<hash>.css and .js files linked by every module,
+    so browsers can cache them across modules. The module specific
+    file names used by the viewer are then passed in JS globals.
+
+    :param gm: the graphyte module object
+    :return: viewer_css and viewer_js HTML tags, paths to the shared
+     viewer files
+    """
+    css = fill_template(
+        get_compiled_template(VIEWER_CSS_PATH, VIEWER_CSS_SLOTS),
+        {"menuwidth": gm.get_menu_width()}
+    )
+    js_template = get_compiled_template(VIEWER_JS_PATH, VIEWER_JS_SLOTS)
+    params_csv = gm.out_html_name_no_ext + "_parameters.csv"
+    if not gm.shared_viewer:
+        js = fill_template(js_template, {
+            "params_csv_js": '"' + params_csv + '"',
+            "changes_file_js": '"' + gm.changes_fname + '"'
+        })
+        return "<style>\n" + css + "      </style>", \
+            "<script>\n" + js + "      </script>", []
+    js = fill_template(js_template, {
+        "params_csv_js": "paramsCsv",
+        "changes_file_js": "changesFile"
+    })
+    css_name = write_viewer_asset(gm.out_dir, css, ".css")
+    js_name = write_viewer_asset(gm.out_dir, js, ".js")
+    viewer_css = '<link rel="stylesheet" href="' + css_name + '">'
+    viewer_js = "<script>\n" \
+        + "        var paramsCsv = " + json.dumps(params_csv) + ";\n" \
+        + "        var changesFile = " + json.dumps(gm.changes_fname) + ";\n" \
+        + "      </script>\n" \
+        + '      <script src="' + js_name + '"></script>'
+    return viewer_css, viewer_js, [os.path.join(gm.out_dir, css_name),
+                                   os.path.join(gm.out_dir, js_name)]
+
+
+def build_search_box(gm):
+    """Builds the model search box of a module. The search script is
+    written once per model to a graphyte-search.<hash>.js file linked
+    by every module, and loads the index shards on demand.
+
+    :param gm: the graphyte module object
+    :return: search_js and search_box HTML tags, paths to the search
+     script
+    """
+    if not gm.search_index:
+        return "", "", []
+    js = fill_template(
+        get_compiled_template(SEARCH_JS_PATH, SEARCH_JS_SLOTS),
+        {"search_index_js": json.dumps(SEARCH_DIR + "/" + SEARCH_INDEX_NAME)}
+    )
+    js_name = write_viewer_asset(gm.out_dir, js, ".js", SEARCH_ASSET_PREFIX)
+    search_js = '\n      <script src="' + js_name + '"></script>'
+    return search_js, SEARCH_BOX, [os.path.join(gm.out_dir, js_name)]
+
+
+def prune_viewer_assets(out_dir, keep):
+    """Removes shared viewer and search files not used by any module.
+
+    :param out_dir: output directory
+    :param keep: paths of the viewer files in use
+    :return: None
+    """
+    if not os.path.isdir(out_dir):
+        return
+    keep = set(os.path.abspath(p) for p in keep)
+    for file in os.listdir(out_dir):
+        path = os.path.join(out_dir, file)
+        if file.startswith((VIEWER_ASSET_PREFIX, SEARCH_ASSET_PREFIX)) \
+                and os.path.abspath(path) not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
 def build_html(gm, processed_svg, file_script, xls_to_script):
     """Assembles final HTML module.
 
@@ -329,38 +543,45 @@ def build_html(gm, processed_svg, file_script, xls_to_script):
     parameter lists, navigation menu, SVG diagram, title and viewer initial
     content.
 
+    The HTML file is written fragment by fragment, in template order,
+    without assembling the whole page in memory. mod_template is only
+    read and split once per process. The viewer CSS and JS are embedded
+    or linked as built by build_viewer, and the model search box is
+    added as built by build_search_box.
+
     :param gm: the graphyte module object
-    :param processed_svg: the SVG diagram adapted for browser support
+    :param processed_svg: the SVG diagram adapted for browser support,
+     string, OutputBuffer or SpooledOutput
     :param file_script: templates and template parameter table
-     in JS <script> array format
+     in JS <script> array format, string or OutputBuffer
     :param xls_to_script: optional. Input table of authorized parameters
-     in JS <script> array format
-    :return: None
+     in JS <script> array format, string or OutputBuffer
+    :return: paths to the shared viewer and search files linked by the
+     module
     """
-    with open("utils/mod_template", "r") as template_file:
-        blank_template = template_file.read()
-
     viewer_init_content = "<br>Click on a diagram element to display " \
                           "its contents on this viewer."
     if not gm.svg_links:
         viewer_init_content = ""
 
     logger.info('         Building HTML file...' + '\r\n')
-    filled_template = str(
-        blank_template.replace("%webTitle%", gm.title)
-            .replace("%params_csv%", gm.out_html_name_no_ext
-                     + "_parameters.csv")
-            .replace("%svg%", processed_svg)
-            .replace("%templates%", file_script)
-            .replace("%menu%", gm.menu_tags))\
-        .replace("%alert%", gm.invalid_param_found_alert)\
-        .replace("%viewer_init_content%", viewer_init_content)\
-        .replace("%xls%", xls_to_script)\
-        .replace("%menuwidth%", gm.get_menu_width())\
-        .replace("%changes_tab%", gm.changes_tab) \
-        .replace("%changes_file%", gm.changes_fname)
-    text_file = open(gm.out_html_path, "w")
-    text_file.write(filled_template)
-    text_file.close()
+    viewer_css, viewer_js, viewer_assets = build_viewer(gm)
+    search_js, search_box, search_assets = build_search_box(gm)
+    values = {
+        "webTitle": gm.title,
+        "viewer_css": viewer_css,
+        "viewer_js": viewer_js,
+        "search_js": search_js,
+        "search_box": search_box,
+        "svg": processed_svg,
+        "templates": file_script,
+        "menu": gm.menu_tags,
+        "alert": gm.invalid_param_found_alert,
+        "viewer_init_content": viewer_init_content,
+        "xls": xls_to_script,
+        "changes_tab": gm.changes_tab,
+    }
+    with open(gm.out_html_path, "w") as text_file:
+        get_mod_template().write(text_file, values)
     logger.info('         ...ok' + '\r\n')
-    return
+    return viewer_assets + search_assets
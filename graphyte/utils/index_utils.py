@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""index_utils.py
+
+Index of the input files of a graphyte model.
+
+The input directory is walked once per model build. The resulting index
+is shared by all modules, so linked files are resolved with a dictionary
+lookup instead of walking the input directory again for every module.
+
+"""
+
+# imports
+import logging
+import os
+from manifest_utils import hash_file
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+
+class FileEntry(object):
+    """Stores the attributes of an input file.
+
+    Attributes:
+        name (str): File name, including extension.
+        path (str): Path to the file.
+        size (int): File size in bytes.
+        mtime (float): Last modification time.
+        order (int): Position of the file in the input directory walk.
+
+    """
+    __slots__ = ('name', 'path', 'size', 'mtime', 'order', '_hash')
+
+    def __init__(self, name, path, size, mtime, order):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.order = order
+        self._hash = None
+
+    @property
+    def hash(self):
+        """SHA-256 of the file contents, computed on first use.
+
+        :return: hex digest string
+        """
+        if self._hash is None:
+            self._hash = hash_file(self.path)
+        return self._hash
+
+
+class FileIndex(object):
+    """Index of all files below the model input directory.
+
+    Attributes:
+        root (str): Input files directory.
+        entries (list): FileEntry objects in directory walk order.
+        by_name (dict): File name to FileEntry. If several files share
+        the same name, the last one found in the walk is indexed.
+        repeated (list): Paths of files whose name was already indexed.
+
+    """
+    def __init__(self, root):
+        """Walks the input directory and builds the index.
+
+        :param root: input files directory
+        """
+        self.root = root
+        self.entries = []
+        self.by_name = dict()
+        self.repeated = []
+        for base, dirs, files in os.walk(root):
+            for file in files:
+                path = os.path.join(base, file)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entry = FileEntry(
+                    file, path, st.st_size, st.st_mtime, len(self.entries)
+                )
+                if file in self.by_name:
+                    self.repeated.append(path)
+                self.by_name[file] = entry
+                self.entries.append(entry)
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    def get(self, name):
+        """Returns the entry of a file given its name.
+
+        :param name: file name, including extension
+        :return: FileEntry, None if not found
+        """
+        return self.by_name.get(name)
+
+    def path(self, name):
+        """Returns the path of a file given its name.
+
+        :param name: file name, including extension
+        :return: path string, None if not found
+        """
+        entry = self.by_name.get(name)
+        return entry.path if entry else None
+
+    def hash(self, name):
+        """Returns the contents hash of a file given its name.
+
+        :param name: file name, including extension
+        :return: hex digest string, None if not found
+        """
+        entry = self.by_name.get(name)
+        return entry.hash if entry else None
+
+    def lookup(self, names):
+        """Resolves a collection of file names.
+
+        :param names: file names, including extension
+        :return: list of FileEntry found, in directory walk order
+        """
+        found = [self.by_name[n] for n in set(names) if n in self.by_name]
+        return sorted(found, key=lambda e: e.order)
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""manifest_utils.py
+
+Tools to support incremental graphyte model builds.
+
+A build manifest stored in the output directory records, per module,
+the hashes of every input used to build it. Modules whose inputs hash
+the same on the next run are not rebuilt and their previous output is
+reused.
+
+"""
+
+# imports
+import hashlib
+import json
+import logging
+import os
+import re
+from output_utils import write_file
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+MANIFEST_NAME = ".graphyte-manifest.json"
+MANIFEST_FORMAT = 1
+
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file's contents.
+
+    :param path: path to file
+    :return: hex digest string, None if the file cannot be read
+    """
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    except (IOError, OSError):
+        return None
+    return h.hexdigest()
+
+
+def hash_text(text):
+    """Returns the SHA-256 hex digest of a string.
+
+    :param text: string to hash
+    :return: hex digest string
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def tool_version(run_dir):
+    """Identifies the graphyte code used for a build.
+
+    Combines the package version with the hashes of graphyte_gen.py
+    and the utils directory, so that upgrading or patching graphyte
+    invalidates previous build outputs.
+
+    :param run_dir: directory containing graphyte_gen.py
+    :return: tool version string
+    """
+    version = ""
+    try:
+        with open(os.path.join(run_dir, "__init__.py")) as f:
+            version = re.search(r'__version__\s*=\s*"(.*?)"', f.read()).group(1)
+    except (IOError, OSError, AttributeError):
+        pass
+    h = hashlib.sha256()
+    code_files = [os.path.join(run_dir, "graphyte_gen.py")]
+    utils_dir = os.path.join(run_dir, "utils")
+    if os.path.isdir(utils_dir):
+        code_files += [
+            os.path.join(utils_dir, f) for f in sorted(os.listdir(utils_dir))
+            if f.endswith(".py")
+            or f in ("mod_template", "viewer.css", "viewer.js", "search.js")
+        ]
+    for path in code_files:
+        h.update(os.path.basename(path).encode('utf-8'))
+        h.update((hash_file(path) or "").encode('utf-8'))
+    return version + "+" + h.hexdigest()[:16]
+
+
+def load_manifest(out_dir, tool):
+    """Loads the build manifest of a previous run.
+
+    :param out_dir: output directory of the model
+    :param tool: tool version of the current run
+    :return: dictionary of module:manifest entry, empty if no usable
+     manifest was found
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+    if manifest.get('format') != MANIFEST_FORMAT \
+            or manifest.get('tool') != tool:
+        logger.info('     Build manifest is outdated, rebuilding all modules.\r\n')
+        return {}
+    return manifest.get('modules', {})
+
+
+def save_manifest(out_dir, tool, modules):
+    """Stores the build manifest in the output directory.
+
+    :param out_dir: output directory of the model
+    :param tool: tool version of the current run
+    :param modules: dictionary of module:manifest entry
+    :return: None
+    """
+    write_file(os.path.join(out_dir, MANIFEST_NAME), json.dumps(
+        {'format': MANIFEST_FORMAT, 'tool': tool, 'modules': modules},
+        indent=1, sort_keys=True
+    ))
+
+
+def yang_dependencies(yang_path, file_index):
+    """Finds the hashes of modules imported or included by a YANG
+    module, recursively.
+
+    :param yang_path: path to YANG module
+    :param file_index: FileIndex of the model input files
+    :return: sorted list of "name:hash" strings
+    """
+    found = dict()
+    pending = [yang_path]
+    while pending:
+        path = pending.pop()
+        try:
+            with open(path, encoding="utf8", errors="ignore") as f:
+                text = f.read()
+        except (IOError, OSError):
+            continue
+        for name in re.findall(r'^\s*(?:import|include)\s+([\w\-\.]+)', text, re.M):
+            if name in found:
+                continue
+            entry = file_index.get(name + ".yang")
+            if entry is None:
+                # look for revision-named files, e.g. name@2019-01-01.yang
+                revisions = [e for n, e in file_index.by_name.items()
+                             if n.startswith(name + "@") and n.endswith(".yang")]
+                entry = max(revisions, key=lambda e: e.name) if revisions else None
+            if entry is None:
+                found[name] = ""
+            else:
+                found[name] = entry.hash
+                pending.append(entry.path)
+    return sorted(n + ":" + h for n, h in found.items())
+
+
+def module_inputs(mod_path, links, file_index, settings):
+    """Hashes all inputs of a module.
+
+    :param mod_path: path to the module diagram
+    :param links: names of the files linked from the module diagram
+    :param file_index: FileIndex of the model input files
+    :param settings: dictionary of module settings, including the param
+     sheet, changes file and navigation menu
+    :return: dictionary of input hashes
+    """
+    templates = dict()
+    for link in links:
+        templates[link] = file_index.hash(link)
+    inputs = {
+        'diagram': hash_file(mod_path),
+        'templates': templates,
+        'sheet': hash_file(settings['sheet']) if settings['sheet'] else None,
+        'changes': hash_file(settings['changes']) if settings['changes'] else None,
+        'nav': hash_text(settings['nav']),
+        'settings': hash_text(json.dumps(settings, sort_keys=True)),
+    }
+    if mod_path.endswith(".yang"):
+        # modules imported or included, resolved by pyang from the
+        # input files
+        inputs['yang'] = yang_dependencies(mod_path, file_index)
+    return inputs
+
+
+def module_is_current(entry, inputs):
+    """Whether a module can be reused from a previous build.
+
+    :param entry: manifest entry of the module from the previous build
+    :param inputs: input hashes of the module for the current build
+    :return: True if inputs are unchanged and outputs are in place
+    """
+    if not entry or entry.get('inputs') != inputs:
+        return False
+    files = entry.get('files', {})
+    outputs = [files.get('htmlpath', '')]
+    outputs += list(files.get('modsvgpath', {}).values())
+    outputs += files.get('chunks', [])
+    outputs += files.get('assets', [])
+    if 'searchdocs' in files:
+        outputs.append(files['searchdocs'])
+    return all(p and os.path.isfile(p) for p in outputs)
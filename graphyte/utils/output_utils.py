@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""output_utils.py
+
+Output buffers and compiled templates for the HTML and JS emitters.
+
+Emitters write fragments to an OutputBuffer instead of growing a string
+with +=, which copies the whole string on every append. Small fragments
+are joined into larger chunks as they come, so memory stays close to
+the output size, and the buffer is written to its destination chunk by
+chunk, without building the full output string.
+
+Outputs that can be as large as their input, e.g. processed SVG
+diagrams, are written to a SpooledOutput instead, which moves to a
+temporary file once it grows over SPOOL_SIZE.
+
+Text templates are split once into literal segments and slots, and
+filled by writing segments and slot values in order.
+
+"""
+
+# imports
+import logging
+import os
+import re
+import tempfile
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+# size in characters above which pending fragments are joined
+CHUNK_SIZE = 1 << 16
+# size in characters above which a SpooledOutput moves to disk
+SPOOL_SIZE = 1 << 22
+
+
+class OutputBuffer(object):
+    """Append-only text buffer.
+
+    Attributes:
+        chunks (list): Joined output chunks.
+
+    """
+    def __init__(self):
+        self.chunks = []
+        self._pending = []
+        self._pending_size = 0
+
+    def write(self, text):
+        """Appends text to the buffer.
+
+        :param text: string, or OutputBuffer whose contents are appended
+        :return: None
+        """
+        if isinstance(text, OutputBuffer):
+            self._flush()
+            text._flush()
+            self.chunks += text.chunks
+            return
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= CHUNK_SIZE:
+            self._flush()
+
+    def _flush(self):
+        """Joins pending fragments into one chunk.
+
+        :return: None
+        """
+        if self._pending:
+            self.chunks.append("".join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def write_to(self, sink):
+        """Writes the buffer contents to a sink.
+
+        :param sink: object with a write method, e.g. a file
+        :return: None
+        """
+        self._flush()
+        for chunk in self.chunks:
+            sink.write(chunk)
+
+    def getvalue(self):
+        """Returns the buffer contents.
+
+        :return: string
+        """
+        self._flush()
+        return "".join(self.chunks)
+
+    def __len__(self):
+        return sum(len(c) for c in self.chunks) + self._pending_size
+
+    def __str__(self):
+        return self.getvalue()
+
+
+class SpooledOutput(object):
+    """Text output kept in memory while small and in a temporary file
+    once it grows over SPOOL_SIZE, so its memory use is bounded.
+
+    Attributes:
+        file (SpooledTemporaryFile): Output contents.
+
+    """
+    def __init__(self):
+        self.file = tempfile.SpooledTemporaryFile(
+            max_size=SPOOL_SIZE, mode="w+", encoding="utf8", newline=""
+        )
+
+    def write(self, text):
+        """Appends text to the output.
+
+        :param text: string
+        :return: None
+        """
+        self.file.write(text)
+
+    def write_to(self, sink):
+        """Writes the output contents to a sink, chunk by chunk.
+
+        :param sink: object with a write method, e.g. a file
+        :return: None
+        """
+        self.file.seek(0)
+        for chunk in iter(lambda: self.file.read(CHUNK_SIZE), ""):
+            sink.write(chunk)
+        self.file.seek(0, os.SEEK_END)
+
+    def getvalue(self):
+        """Returns the output contents.
+
+        :return: string
+        """
+        self.file.seek(0)
+        text = self.file.read()
+        self.file.seek(0, os.SEEK_END)
+        return text
+
+    def close(self):
+        """Discards the output, removing its temporary file.
+
+        :return: None
+        """
+        self.file.close()
+
+
+def write_file(path, text):
+    """Writes a file through a temp file in the same directory, so
+    readers, including other workers writing the same file, never find
+    it partially written.
+
+    :param path: file path
+    :param text: file contents
+    :return: None
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_fragment(sink, fragment):
+    """Writes a string, OutputBuffer or SpooledOutput to a sink.
+
+    :param sink: object with a write method, e.g. a file
+    :param fragment: string, OutputBuffer or SpooledOutput
+    :return: None
+    """
+    if isinstance(fragment, (OutputBuffer, SpooledOutput)):
+        fragment.write_to(sink)
+    else:
+        sink.write(fragment)
+
+
+class CompiledTemplate(object):
+    """Text template split once into literal segments and named
+    slots, written out by alternating segments and slot values.
+
+    Slots are marked as %name% in the template. Only the given slot
+    names are recognized, and slot values are written as they are,
+    never searched for further slots.
+
+    Attributes:
+        path (str): Path to the template file.
+        mtime (float): Modification time of the template file when read.
+        segments (tuple): Literal text (even items) and slot names (odd
+        items), in template order.
+
+    """
+    def __init__(self, path, slots):
+        """Reads and splits the template.
+
+        :param path: path to the template file
+        :param slots: names of the template slots
+        """
+        self.path = path
+        self.mtime = os.stat(path).st_mtime
+        with open(path, "r") as f:
+            text = f.read()
+        self.segments = tuple(re.split(
+            "%(" + "|".join(re.escape(s) for s in slots) + ")%", text
+        ))
+
+    def is_current(self):
+        """Whether the template file did not change since it was read.
+
+        :return: True if unchanged, False otherwise.
+        """
+        try:
+            return os.stat(self.path).st_mtime == self.mtime
+        except OSError:
+            return False
+
+    def write(self, sink, values):
+        """Writes the filled template to a sink.
+
+        :param sink: object with a write method, e.g. a file
+        :param values: dictionary of slot name:string, OutputBuffer or
+         SpooledOutput
+        :return: None
+        """
+        for i, segment in enumerate(self.segments):
+            if i % 2:
+                write_fragment(sink, values[segment])
+            else:
+                sink.write(segment)
@@ -6,10 +6,16 @@ Tools for processing graphyte parameters.
 """
 
 # imports
+import difflib
+import json
 import logging
 import os
 import re
-import xlrd
+import threading
+from collections import namedtuple, Counter
+from manifest_utils import hash_file
+from cache_utils import RenderCache
+from output_utils import OutputBuffer
 # import pprint
 
 # info
@@ -18,12 +24,33 @@ __author__ = "Jorge Somavilla"
 # initialize logger
 logger = logging.getLogger('graphyte')
 
+# version of the parsed worksheets stored in the render cache, increase
+# when parse_param_sheet output changes
+PARAM_SHEET_FORMAT = 1
+
+# Authorized parameters worksheet, parsed once per model and shared,
+# read-only, by all its modules.
+#   path (str): Path to the worksheet.
+#   allowed_parameters (frozenset): Authorized parameter names.
+#   script (str): Worksheet in JS <script> array format.
+#   validator (ParamValidator): Validation engine of the parameters.
+#   hash (str): Hash of the worksheet contents, None if not read.
+ParamSheet = namedtuple(
+    'ParamSheet', ['path', 'allowed_parameters', 'script', 'validator',
+                   'hash']
+)
+
+# worksheets parsed by this process, by path and contents hash
+_sheets = dict()
+_sheets_lock = threading.Lock()
+
 
 def process_param_sheet(gm):
     """Process authorized parameters worksheet.
 
     Extracts list of allowed parameters and stores in graphyte module
-    object (gm) attribute.
+    object (gm) attribute. The worksheet shared by the model is used
+    if available, otherwise it is loaded.
 
     Returns table of parameters in JS <script> array format, to be
     embedded in output HTML module.
@@ -31,15 +58,82 @@ def process_param_sheet(gm):
     :param gm: the graphyte module object
     :return: xls_to_script
     """
+    param_sheet = gm.param_sheet
+    if param_sheet is None or param_sheet.path != gm.in_xls_path:
+        param_sheet = load_param_sheet(gm.in_xls_path, gm.render_cache)
+    gm.allowed_parameters = param_sheet.allowed_parameters
+    gm.param_validator = param_sheet.validator
+    gm.sheet_hash = param_sheet.hash
+    return param_sheet.script
+
+
+def load_param_sheet(in_xls_path, render_cache=None):
+    """Loads an authorized parameters worksheet, parsing it only if
+    it was not parsed before by this process or found in the render
+    cache.
+
+    :param in_xls_path: path to worksheet
+    :param render_cache: optional. RenderCache storing parsed worksheets
+    :return: ParamSheet
+    """
+    sheet_hash = hash_file(in_xls_path)
+    with _sheets_lock:
+        param_sheet = _sheets.get((in_xls_path, sheet_hash))
+    if param_sheet is not None:
+        return param_sheet
+    key = RenderCache.key(
+        "sheet", str(PARAM_SHEET_FORMAT), sheet_hash
+    )
+    cached = render_cache.load(key) if render_cache and sheet_hash else None
+    if cached is not None:
+        logger.info('         Reusing cached parameter worksheet '
+                    + os.path.basename(in_xls_path) + '\r\n')
+        data = json.loads(cached.decode('utf-8'))
+        allowed_parameters = frozenset(data['allowed_parameters'])
+        param_sheet = ParamSheet(
+            in_xls_path, allowed_parameters, data['script'],
+            ParamValidator(allowed_parameters), sheet_hash
+        )
+    else:
+        param_sheet = parse_param_sheet(in_xls_path, sheet_hash)
+        if render_cache and sheet_hash:
+            render_cache.store(key, json.dumps({
+                'allowed_parameters': sorted(param_sheet.allowed_parameters),
+                'script': param_sheet.script
+            }).encode('utf-8'))
+    with _sheets_lock:
+        _sheets[(in_xls_path, sheet_hash)] = param_sheet
+    return param_sheet
+
+
+def clear_param_sheets():
+    """Forgets the worksheets loaded by this process, e.g. once a
+    long-running process is done with their models. Worksheets stored
+    in the render cache are not parsed again.
+
+    :return: None
+    """
+    with _sheets_lock:
+        _sheets.clear()
+
+
+def parse_param_sheet(in_xls_path, sheet_hash=None):
+    """Parses authorized parameters worksheet.
+
+    :param in_xls_path: path to worksheet
+    :param sheet_hash: optional. Hash of the worksheet contents
+    :return: ParamSheet
+    """
     logger.info('         Processing parameter worksheet...' + '\r\n')
-    xls_to_script = ""
+    xls_to_script = OutputBuffer()
     allowed_parameters = []
-    in_xls_fname = os.path.basename(gm.in_xls_path)
+    in_xls_fname = os.path.basename(in_xls_path)
     module_logger = logging.getLogger('graphyte')
     module_logger.info('             ' + in_xls_fname + '\r\n')
     # book = open_workbook(in_xls_path)
+    import xlrd
     book = xlrd.open_workbook(
-        filename=gm.in_xls_path,
+        filename=in_xls_path,
         encoding_override="cp1252"
     )
     sheet = book.sheet_by_index(0)
@@ -114,17 +208,100 @@ def process_param_sheet(gm):
                 var_title = re.sub(r'\/', r'_backslash_', var_title.rstrip())
                 var_title = re.sub(r'\'', r'_singlequote_', var_title.rstrip())
                 # add variable name
-                xls_to_script += "    var " + var_title + " = [\n\"" \
-                                 + value_j.rstrip()
+                xls_to_script.write("    var " + var_title + " = [\n\""
+                                    + value_j.rstrip())
             else:
                 # add line
-                xls_to_script += "\",\n\"" + value_j.rstrip()
+                xls_to_script.write("\",\n\"" + value_j.rstrip())
             # if last item close java array
             if col_index == sheet.ncols - 1:
-                xls_to_script += "\"];\n\n"
-    gm.allowed_parameters = allowed_parameters
+                xls_to_script.write("\"];\n\n")
     logger.info('         ...ok' + '\r\n')
-    return xls_to_script
+    allowed_parameters = frozenset(allowed_parameters)
+    return ParamSheet(
+        in_xls_path, allowed_parameters, xls_to_script.getvalue(),
+        ParamValidator(allowed_parameters), sheet_hash
+    )
+
+
+class ParamValidator(object):
+    """Validates parameters against the authorized parameters, and
+    suggests the closest authorized names for unauthorized ones.
+
+    Legality is checked on a set. Suggestions are searched among the
+    authorized names sharing most n-grams (character trigrams) with
+    the unauthorized name, instead of comparing it with every name.
+    Names are compared ignoring case.
+
+    Attributes:
+        allowed_parameters (frozenset): Authorized parameter names.
+        ngrams (dict): Lowercase trigram to authorized names containing it.
+        max_suggestions (int): Maximum suggestions per parameter.
+        cutoff (float): Minimum similarity of a suggestion, 0 to 1.
+
+    """
+    def __init__(self, allowed_parameters, max_suggestions=3, cutoff=0.6):
+        self.allowed_parameters = frozenset(allowed_parameters)
+        self.max_suggestions = max_suggestions
+        self.cutoff = cutoff
+        self.ngrams = dict()
+        for name in self.allowed_parameters:
+            for ngram in set(param_ngrams(name)):
+                self.ngrams.setdefault(ngram, []).append(name)
+        self._suggestions = dict()
+
+    def is_legal(self, p):
+        """Returns whether a given parameter is authorized.
+
+        :param p: parameter under scrutiny
+        :return: Boolean. True if found, False if not
+        """
+        return p in self.allowed_parameters
+
+    def suggest(self, names):
+        """Finds the closest authorized names of a set of parameters.
+
+        :param names: iterable of unauthorized parameter names
+        :return: dictionary of name:list of suggested authorized names,
+         most similar first
+        """
+        result = dict()
+        for name in names:
+            if name not in self._suggestions:
+                self._suggestions[name] = self._closest(name)
+            result[name] = self._suggestions[name]
+        return result
+
+    def _closest(self, name):
+        """Finds the closest authorized names of a parameter.
+
+        :param name: parameter name
+        :return: list of authorized names, most similar first
+        """
+        shared = Counter()
+        for ngram in set(param_ngrams(name)):
+            shared.update(self.ngrams.get(ngram, ()))
+        # only rank the names sharing most n-grams with the parameter,
+        # compared in lowercase like the n-grams, so that case-only
+        # typos are suggested too
+        candidates = dict()
+        for n, count in shared.most_common(self.max_suggestions * 10):
+            candidates.setdefault(n.lower(), []).append(n)
+        closest = []
+        for key in difflib.get_close_matches(
+                name.lower(), candidates, self.max_suggestions, self.cutoff):
+            closest += sorted(candidates[key])
+        return closest[:self.max_suggestions]
+
+
+def param_ngrams(p):
+    """Splits a parameter name into lowercase character trigrams.
+
+    :param p: parameter name
+    :return: list of trigrams
+    """
+    p = " " + p.lower() + " "
+    return [p[i:i + 3] for i in range(len(p) - 2)]
 
 
 def param_name_is_valid(p, q):
@@ -161,7 +338,7 @@ def param_is_legal(p, gm):
     :param gm: the graphyte module object
     :return: Boolean. True if found, False if not
     """
-    return p in gm.allowed_parameters
+    return gm.param_validator.is_legal(p)
 
 
 def param_is_false_positive(p):
@@ -194,7 +371,8 @@ def add_params_to_script(gm, file_script):
     to file_script, to be embedded in the final HTML module.
 
     :param gm: the graphyte module object
-    :param file_script: template files in JS <script> array format
+    :param file_script: OutputBuffer with template files in JS <script>
+     array format
     :return: file_script, with the appended variable list.
     """
     logger.info('         Building parameters list...' + '\r\n')
@@ -216,21 +394,21 @@ def add_params_to_script(gm, file_script):
 
 
 
-    file_script += "    var v_" + params_csv_ + "_csv" + " = [\n \"" + params_csv + "\.csv"
+    file_script.write("    var v_" + params_csv_ + "_csv" + " = [\n \"" + params_csv + "\.csv")
     if not gm.decision_param_list and not gm.template_param_list:
-        file_script += "\",\n\"" + "No parameters found in module."
+        file_script.write("\",\n\"" + "No parameters found in module.")
     else:
         if gm.in_xls_path:
-            file_script += "\",\n\"" + "Module,Parameter,File,Validation,Data"
+            file_script.write("\",\n\"" + "Module,Parameter,File,Validation,Suggestions,Data")
         else:
-            file_script += "\",\n\"" + "Module,Parameter,File,Data"
+            file_script.write("\",\n\"" + "Module,Parameter,File,Data")
     for p in gm.decision_param_list:
         p = re.sub(r'(\\|\")', r'\\\1', p)
-        file_script += "\",\n\"" + gm.out_html_name_no_ext + "," + p.rstrip()
+        file_script.write("\",\n\"" + gm.out_html_name_no_ext + "," + p.rstrip())
     for p in gm.template_param_list:
         p = re.sub(r'(\\|\")', r'\\\1', p)
-        file_script += "\",\n\"" + gm.out_html_name_no_ext + "," + p.strip()
-    file_script += "\"];\n\n"
+        file_script.write("\",\n\"" + gm.out_html_name_no_ext + "," + p.strip())
+    file_script.write("\"];\n\n")
     logger.info('         ...ok' + '\r\n')
     return file_script
 
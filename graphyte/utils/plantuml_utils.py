@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""plantuml_utils.py
+
+Long-lived PlantUML renderer.
+
+Starting the JVM and loading plantuml.jar takes seconds, which used to
+be paid once per UML or YANG module. PlantUMLServer keeps a single
+PlantUML process running in pipe mode and streams diagram sources to it,
+reading back one SVG per diagram. If the pipe cannot be used, callers
+fall back to one PlantUML invocation per file.
+
+"""
+
+# imports
+import atexit
+import logging
+import os
+import threading
+from queue import Queue, Empty
+from subprocess import Popen, PIPE, DEVNULL
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+PLANTUML_JAR = "utils/plantuml.jar"
+DELIMITER = "__graphyte_end_of_diagram__"
+
+# renderer shared by all modules built by this process
+_server = None
+_server_pid = None
+_server_lock = threading.Lock()
+
+
+class PlantUMLServer(object):
+    """PlantUML process rendering diagrams received through its stdin.
+
+    Attributes:
+        run_dir (str): Execution directory, plantuml.jar is looked up
+        relative to it.
+        timeout (int): Maximum seconds to wait for a diagram.
+        broken (bool): Whether the pipe failed. No further diagrams
+        are sent to a broken renderer.
+
+    """
+    def __init__(self, run_dir, timeout=600):
+        self.run_dir = run_dir
+        self.timeout = timeout
+        self.broken = False
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the PlantUML process.
+
+        :return: True if started, False otherwise.
+        """
+        try:
+            self._proc = Popen(
+                ["java", "-Xmx1024m", "-Djava.awt.headless=true", "-jar",
+                 PLANTUML_JAR, "-tsvg", "-charset", "UTF-8", "-pipe",
+                 "-pipedelimitor", DELIMITER],
+                cwd=self.run_dir, stdin=PIPE, stdout=PIPE, stderr=DEVNULL,
+                universal_newlines=True, encoding="utf-8", bufsize=1
+            )
+        except (OSError, ValueError) as e:
+            logger.warning('              Could not start PlantUML renderer: '
+                           + str(e) + '\r\n')
+            self.broken = True
+            return False
+        self._lines = Queue()
+        reader = threading.Thread(target=self._read_output, daemon=True)
+        reader.start()
+        return True
+
+    def _read_output(self):
+        """Forwards PlantUML output lines to the lines queue.
+
+        :return: None
+        """
+        for line in self._proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)  # EOF
+
+    def render(self, uml):
+        """Renders one diagram.
+
+        :param uml: PlantUML source, from @startuml to @enduml
+        :return: SVG string, None if the diagram could not be rendered
+        """
+        with self._lock:
+            if self.broken:
+                return None
+            if self._proc is None and not self.start():
+                return None
+            try:
+                self._proc.stdin.write(uml.rstrip("\n") + "\n")
+                self._proc.stdin.flush()
+            except (OSError, ValueError):
+                self._fail("PlantUML renderer stopped accepting input")
+                return None
+            svg = []
+            while True:
+                try:
+                    line = self._lines.get(timeout=self.timeout)
+                except Empty:
+                    self._fail("PlantUML renderer timed out")
+                    return None
+                if line is None:
+                    self._fail("PlantUML renderer exited")
+                    return None
+                if line.rstrip("\r\n") == DELIMITER:
+                    break
+                svg.append(line)
+            svg = "".join(svg)
+            if "<svg" not in svg:
+                # PlantUML reported an error instead of a diagram
+                return None
+            return svg
+
+    def _fail(self, reason):
+        """Marks the renderer as broken and stops the process.
+
+        :param reason: message to log
+        :return: None
+        """
+        logger.warning('              ' + reason
+                       + ', rendering one diagram per process.\r\n')
+        self.broken = True
+        self.close()
+
+    def close(self):
+        """Stops the PlantUML process.
+
+        :return: None
+        """
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+        except (OSError, ValueError):
+            pass
+        try:
+            self._proc.wait(timeout=5)
+        except Exception:
+            self._proc.kill()
+        self._proc = None
+
+
+def get_server(run_dir):
+    """Returns the PlantUML renderer of this process, starting it
+    on first use.
+
+    A worker process forked after the renderer was started does not
+    inherit its output reader, so it starts its own renderer.
+
+    :param run_dir: execution directory
+    :return: PlantUMLServer
+    """
+    global _server, _server_pid
+    with _server_lock:
+        if _server is None or _server_pid != os.getpid():
+            _server = PlantUMLServer(run_dir)
+            _server_pid = os.getpid()
+            atexit.register(_server.close)
+        return _server
+
+
+def render_file(uml_path, out_dir, run_dir):
+    """Renders an UML file with a dedicated PlantUML invocation.
+
+    The SVG is written to out_dir with the UML file name and .svg
+    extension.
+
+    :param uml_path: path to UML file
+    :param out_dir: output directory
+    :param run_dir: execution directory
+    :return: None
+    """
+    p1 = Popen(["java", "-Xmx1024m", "-jar", PLANTUML_JAR, "-v", "-tsvg",
+                uml_path, "-o", out_dir], cwd=run_dir, stdout=PIPE,
+               stderr=PIPE)
+    p1.communicate()  # wait for plantuml execution
+
+
+def render(uml_path, out_dir, run_dir, use_server=True):
+    """Renders an UML file into SVG, through the long-lived renderer
+    if possible, or with a dedicated PlantUML invocation otherwise.
+
+    The SVG is written to out_dir with the UML file name and .svg
+    extension.
+
+    :param uml_path: path to UML file
+    :param out_dir: output directory
+    :param run_dir: execution directory
+    :param use_server: whether to use the long-lived renderer
+    :return: None
+    """
+    if use_server and os.path.exists(os.path.join(run_dir, PLANTUML_JAR)):
+        server = get_server(run_dir)
+        with open(uml_path, encoding="utf8", errors="ignore") as f:
+            svg = server.render(f.read())
+        if svg is not None:
+            svg_name = os.path.splitext(os.path.basename(uml_path))[0] + ".svg"
+            with open(os.path.join(out_dir, svg_name), "w", encoding="utf8") as f:
+                f.write(svg)
+            return
+    render_file(uml_path, out_dir, run_dir)
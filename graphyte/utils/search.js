@@ -0,0 +1,181 @@
+        var graphyteSearch = (function(){
+          var indexURL = %search_index_js%;
+          var searchDir = indexURL.replace(/[^\/]*$/, "");
+          var index = null;
+          var shards = {};
+          var waiting = {};
+          var maxResults = 50;
+
+          // index and shards are JS files calling setIndex and addShard
+          function loadScript(url, key, callback){
+            if (waiting[key]){
+              waiting[key].push(callback);
+              return;
+            }
+            waiting[key] = [callback];
+            var script = document.createElement("script");
+            script.charset = "utf-8";
+            script.onerror = function(){
+              var callbacks = waiting[key] || [];
+              delete waiting[key];
+              for (var i = 0; i < callbacks.length; i++){ callbacks[i](false); }
+            };
+            script.src = url;
+            document.body.appendChild(script);
+          }
+
+          function loaded(key){
+            var callbacks = waiting[key] || [];
+            delete waiting[key];
+            for (var i = 0; i < callbacks.length; i++){ callbacks[i](true); }
+          }
+
+          function setIndex(data){
+            index = data;
+            loaded("index");
+          }
+
+          function addShard(key, postings){
+            shards[key] = postings;
+            loaded("shard:" + key);
+          }
+
+          function queryTerms(query){
+            var terms = query.toLowerCase().match(/[a-z0-9_]+/g) || [];
+            return terms.filter(function(t){ return t.length >= 2; });
+          }
+
+          function withIndex(callback){
+            if (index){ callback(true); return; }
+            loadScript(indexURL, "index", callback);
+          }
+
+          function withShard(key, callback){
+            if (shards[key]){ callback(true); return; }
+            loadScript(searchDir + index.shards[key], "shard:" + key, callback);
+          }
+
+          // keys of the shards holding a term, or every term starting by it
+          function shardKeys(term, prefix){
+            return Object.keys(index.shards).filter(function(key){
+              return term.indexOf(key) === 0 || (prefix && key.indexOf(term) === 0);
+            });
+          }
+
+          // document ids of a term, or of every term starting by it
+          function postings(term, prefix){
+            var ids = {};
+            shardKeys(term, prefix).forEach(function(key){
+              var shard = shards[key] || {};
+              for (var t in shard){
+                if (t === term || (prefix && t.indexOf(term) === 0)){
+                  for (var i = 0; i < shard[t].length; i++){ ids[shard[t][i]] = true; }
+                }
+              }
+            });
+            return Object.keys(ids).map(Number);
+          }
+
+          // documents containing every term, the last one as a prefix
+          function search(query, callback){
+            var terms = queryTerms(query);
+            if (!terms.length){ callback([]); return; }
+            withIndex(function(ok){
+              if (!ok){ callback(null); return; }
+              var keys = {};
+              terms.forEach(function(t, i){
+                shardKeys(t, i == terms.length - 1).forEach(function(key){ keys[key] = true; });
+              });
+              var needed = Object.keys(keys);
+              var pending = needed.length + 1;
+              var done = function(){
+                if (--pending > 0){ return; }
+                var result = null;
+                for (var i = 0; i < terms.length; i++){
+                  var ids = postings(terms[i], i == terms.length - 1);
+                  if (result === null){
+                    result = ids;
+                  } else {
+                    var set = {};
+                    ids.forEach(function(id){ set[id] = true; });
+                    result = result.filter(function(id){ return set[id]; });
+                  }
+                }
+                result.sort(function(a, b){ return a - b; });
+                callback(result.map(function(id){
+                  var doc = index.docs[id];
+                  var module = index.modules[doc[0]];
+                  return {module: module[0], html: module[1], file: doc[1]};
+                }));
+              };
+              needed.forEach(function(key){ withShard(key, done); });
+              done();
+            });
+          }
+
+          function escapeHtml(text){
+            return String(text).replace(/&/g, "&amp;").replace(/</g, "&lt;")
+              .replace(/>/g, "&gt;").replace(/"/g, "&quot;");
+          }
+
+          function showResults(query, results, elapsed){
+            var panel = document.getElementsByClassName('floatright')[0];
+            panel.style.backgroundColor = 'rgba(255, 255, 255, 0.7)';
+            panel.style.boxShadow = "0 7px 20px rgba(0,0,0,.3)";
+            panel.style.height = "auto";
+            document.getElementById('editbottom').innerHTML = "";
+            document.getElementById('texttitle').innerHTML = "Search: " + escapeHtml(query);
+            var textDiv = document.getElementById('text');
+            if (results === null){
+              textDiv.innerHTML = "Could not load the search index.";
+              return;
+            }
+            var html = results.length + " result" + (results.length == 1 ? "" : "s")
+              + " (" + elapsed + " ms)<br>";
+            var page = decodeURIComponent(window.location.pathname.replace(/^.*\//, ""));
+            results.slice(0, maxResults).forEach(function(r){
+              var href = (r.html == page ? "" : encodeURI(r.html))
+                + (r.file ? "#open=" + encodeURIComponent(r.file) : "");
+              html += "<br><a class=\"searchresult\" href=\"" + (href || "#") + "\">"
+                + escapeHtml(r.module) + (r.file ? ": " + escapeHtml(r.file) : "") + "</a>";
+            });
+            if (results.length > maxResults){
+              html += "<br>...";
+            }
+            textDiv.innerHTML = html;
+            var links = textDiv.getElementsByClassName("searchresult");
+            for (var i = 0; i < links.length; i++){
+              links[i].addEventListener("click", reopen, false);
+            }
+          }
+
+          // following a link to the file already open in this module
+          // does not change the URL, display the file again
+          function reopen(evt){
+            var href = evt.currentTarget.getAttribute("href");
+            if (href.charAt(0) == "#" && href == window.location.hash){
+              evt.preventDefault();
+              window.location.hash = "";
+              window.location.hash = href;
+            }
+          }
+
+          function onInput(evt){
+            var query = evt.target.value;
+            var start = Date.now();
+            search(query, function(results){
+              if (evt.target.value != query){ return; }
+              if (!queryTerms(query).length){ return; }
+              showResults(query, results, Date.now() - start);
+            });
+          }
+
+          window.addEventListener("load", function(){
+            var input = document.getElementById("searchInput");
+            if (input){
+              input.addEventListener("input", onInput, false);
+            }
+          }, false);
+
+          return {setIndex: setIndex, addShard: addShard, search: search};
+        })();
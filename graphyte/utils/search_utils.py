@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""search_utils.py
+
+Full-text search index of a graphyte model.
+
+Every module records the terms of the module name and of each linked
+template, collected while its templates are read. Once all modules are
+built, their terms are merged into an inverted index, split in shards
+by the first characters of the terms, so the viewer only loads the
+shards needed to answer a query. Shards with too many entries are split
+again by one more character.
+
+Index and shards are written as JS files passing JSON data to the
+viewer search, which can be loaded by browsers from local files too:
+
+search/index.js: modules, documents (module, file) and shard files
+search/<key>.<hash>.js: term:document ids of the terms starting by key,
+except for the terms in shards with longer keys
+
+"""
+
+# imports
+import json
+import logging
+import os
+import re
+import shutil
+from collections import defaultdict
+from manifest_utils import hash_text
+from output_utils import write_file
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+SEARCH_DIR = "search"
+SEARCH_INDEX_NAME = "index.js"
+# terms of every module, kept for incremental builds
+SEARCH_DOCS_DIR = ".graphyte-search"
+SEARCH_FORMAT = 1
+MIN_TERM_LENGTH = 2
+SHARD_KEY_LENGTH = 2
+# document ids above which a shard is split
+MAX_SHARD_POSTINGS = 20000
+
+_TERM_RE = re.compile(r'[a-z0-9_]+')
+
+
+def text_terms(text):
+    """Extracts the search terms of a text: lowercase runs of letters,
+    digits and underscores. <param> is indexed as param.
+
+    :param text: string
+    :return: set of terms
+    """
+    return set(t for t in _TERM_RE.findall(text.lower())
+               if len(t) >= MIN_TERM_LENGTH)
+
+
+def write_search_docs(gm):
+    """Writes the search terms of a module: one document for the module
+    itself and one for each linked template.
+
+    :param gm: the graphyte module object
+    :return: path to the module terms file
+    """
+    docs_dir = os.path.join(gm.out_dir, SEARCH_DOCS_DIR)
+    os.makedirs(docs_dir, exist_ok=True)
+    docs = [["", sorted(text_terms(gm.module + " " + gm.title))]]
+    for name, terms in gm.search_docs:
+        docs.append([name, sorted(terms | text_terms(name))])
+    path = os.path.join(docs_dir, gm.out_html_name_no_ext + ".json")
+    write_file(path, json.dumps({
+        'format': SEARCH_FORMAT,
+        'module': gm.module,
+        'html': os.path.basename(gm.out_html_path),
+        'docs': docs
+    }, sort_keys=True))
+    return path
+
+
+def shard_terms(postings, key_length=SHARD_KEY_LENGTH):
+    """Splits the index in shards by the first key_length characters of
+    the terms. Shards above MAX_SHARD_POSTINGS document ids are split
+    by one more character, only terms as long as the key remain in them.
+
+    :param postings: dictionary of term:document ids
+    :param key_length: optional. Number of characters of the shard keys
+    :return: dictionary of shard key:(dictionary of term:document ids)
+    """
+    groups = defaultdict(dict)
+    for term, doc_ids in postings.items():
+        groups[term[:key_length]][term] = doc_ids
+    shards = dict()
+    for key, group in groups.items():
+        longer = dict((t, v) for t, v in group.items() if len(t) > key_length)
+        if longer and sum(len(v) for v in group.values()) > MAX_SHARD_POSTINGS:
+            if len(longer) < len(group):
+                shards[key] = dict((t, v) for t, v in group.items()
+                                   if len(t) <= key_length)
+            shards.update(shard_terms(longer, key_length + 1))
+        else:
+            shards[key] = group
+    return shards
+
+
+def build_search_index(out_dir, docs_paths):
+    """Merges the search terms of all modules into the sharded index
+    of the model, replacing the previous one.
+
+    :param out_dir: output directory
+    :param docs_paths: paths to the module terms files, in module order
+    :return: number of documents indexed
+    """
+    modules = []
+    docs = []
+    postings = defaultdict(list)
+    for path in docs_paths:
+        try:
+            with open(path, encoding="utf8") as f:
+                module_docs = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("     Could not read search terms {}: {}\r\n"
+                           .format(path, repr(e)))
+            continue
+        if module_docs.get('format') != SEARCH_FORMAT:
+            continue
+        module_id = len(modules)
+        modules.append([module_docs['module'], module_docs['html']])
+        for name, terms in module_docs['docs']:
+            doc_id = len(docs)
+            docs.append([module_id, name])
+            for term in terms:
+                postings[term].append(doc_id)
+
+    shards = shard_terms(postings)
+    search_dir = os.path.join(out_dir, SEARCH_DIR)
+    os.makedirs(search_dir, exist_ok=True)
+    shard_files = dict()
+    for key, shard in shards.items():
+        data = json.dumps(shard, sort_keys=True, separators=(',', ':'))
+        name = key + "." + hash_text(data)[:12] + ".js"
+        shard_files[key] = name
+        path = os.path.join(search_dir, name)
+        if not os.path.isfile(path):
+            write_file(path, "graphyteSearch.addShard("
+                       + json.dumps(key) + "," + data + ");\n")
+    write_file(
+        os.path.join(search_dir, SEARCH_INDEX_NAME),
+        "graphyteSearch.setIndex(" + json.dumps({
+            'modules': modules, 'docs': docs, 'shards': shard_files
+        }, sort_keys=True, separators=(',', ':')) + ");\n"
+    )
+
+    # remove shards of previous builds
+    keep = set(shard_files.values())
+    keep.add(SEARCH_INDEX_NAME)
+    for file in os.listdir(search_dir):
+        if file not in keep:
+            try:
+                os.remove(os.path.join(search_dir, file))
+            except OSError:
+                pass
+    # remove terms of modules no longer in the model
+    docs_dir = os.path.join(out_dir, SEARCH_DOCS_DIR)
+    keep = set(os.path.abspath(p) for p in docs_paths)
+    if os.path.isdir(docs_dir):
+        for file in os.listdir(docs_dir):
+            path = os.path.join(docs_dir, file)
+            if os.path.abspath(path) not in keep:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+    logger.info("     Search index: {} documents, {} terms, {} shards\r\n"
+                .format(len(docs), len(postings), len(shard_files)))
+    return len(docs)
+
+
+def remove_search_index(out_dir):
+    """Removes the search index and module terms of a previous build.
+
+    :param out_dir: output directory
+    :return: None
+    """
+    for d in (SEARCH_DIR, SEARCH_DOCS_DIR):
+        shutil.rmtree(os.path.join(out_dir, d), ignore_errors=True)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""svg_utils.py
+
+Streaming SVG rewriter.
+
+Adapts SVG diagrams so they can be embedded in the HTML module, in a
+single pass over the parser events and with memory bounded by the
+largest element, regardless of the diagram size:
+
+- root <svg> attributes are rewritten for the viewer,
+- <a> elements linking templates become <g class="wrapper"> groups,
+- mod: and lit: links are resolved,
+- foreignObject elements are stripped (except for draw.io diagrams).
+
+Output is written directly to a sink (any object with a write method).
+
+"""
+
+# imports
+import logging
+import os
+import re
+from xml.parsers import expat
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+READ_CHUNK = 1 << 20
+
+# attributes removed from <a> elements converted to <g>
+A2G_REMOVED_ATTRS = (
+    'id', 'xlink:href', 'xlink:actuate', 'xlink:show', 'xlink:type'
+)
+# attributes removed from the root <svg> element
+ROOT_REMOVED_ATTRS = ('id', 'width', 'height', 'preserveAspectRatio', 'style')
+
+_ATTR_ESCAPES = str.maketrans({
+    '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+    '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'
+})
+_TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+
+def is_drawio(attrs):
+    """Whether the root <svg> attributes identify a draw.io diagram.
+
+    :param attrs: dictionary of root element attributes
+    :return: True if draw.io, False otherwise.
+    """
+    content = attrs.get('content', '')
+    return 'editor="www.draw.io"' in content \
+        or 'host="www.draw.io"' in content \
+        or 'host="scdp.cisco.com"' in content \
+        or 'host="app.diagrams.net"' in content \
+        or bool(re.search(r'agent=[^>]+draw.io', content))
+
+
+def link_type(link):
+    """Classifies an SVG hyperlink.
+
+    <a ... xlink:href="mod:module.svg" -> "mod"
+    <a ... xlink:href="lit:http://cisco.com" -> "lit"
+    <a ... xlink:href="myfile.txt" -> "file"
+
+    :param link: xlink:href value, None if the element has no link
+    :return: "mod", "lit" or "file"
+    """
+    if link is not None:
+        if re.search('mod:(.*)', link):
+            return "mod"
+        if re.search('lit:(.*)', link):
+            return "lit"
+    return "file"
+
+
+class SvgRewriter(object):
+    """Rewrites an SVG diagram for a graphyte module.
+
+    Attributes:
+        gm (GraphyteModule): The graphyte module object. Linked file
+        names are pushed to it.
+        sink: Object receiving the output through its write method.
+        guess_module (function): Resolves mod: links into module HTML
+        file names.
+
+    """
+    def __init__(self, gm, sink, guess_module):
+        self.gm = gm
+        self.sink = sink
+        self.guess_module = guess_module
+        self.depth = 0
+        self.drawio = False
+        self.skip_depth = 0  # depth of skipped foreignObject, 0 if none
+        self.a_stack = []  # output tag of each open <a>
+        self.in_cdata = False
+        self.open_start = False  # start tag written without its ">"
+        self.parser = expat.ParserCreate()
+        self.parser.ordered_attributes = True
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = self.start_element
+        self.parser.EndElementHandler = self.end_element
+        self.parser.CharacterDataHandler = self.char_data
+        self.parser.CommentHandler = self.comment
+        self.parser.StartCdataSectionHandler = self.start_cdata
+        self.parser.EndCdataSectionHandler = self.end_cdata
+
+    def rewrite(self, svg_path):
+        """Reads and rewrites the SVG file.
+
+        :param svg_path: path to SVG file
+        :return: None
+        :raises expat.ExpatError: if the SVG is not well-formed XML
+        """
+        with open(svg_path, 'rb') as f:
+            while True:
+                chunk = f.read(READ_CHUNK)
+                self.parser.Parse(chunk, not chunk)
+                if not chunk:
+                    break
+        self.sink.write("\n")
+
+    def write_start(self, name, attrs):
+        """Writes an element start tag. The tag is closed by the next
+        output, as "/>" if the element turns out to be empty, so that
+        void HTML elements in draw.io labels (<br/>, <img/>) keep a
+        single tag.
+
+        :param name: element name
+        :param attrs: list of (name, value) tuples
+        :return: None
+        """
+        self.close_start()
+        self.sink.write("<" + name + "".join(
+            ' ' + k + '="' + v.translate(_ATTR_ESCAPES) + '"' for k, v in attrs
+        ))
+        self.open_start = True
+
+    def close_start(self):
+        """Closes the last start tag written, before its content.
+
+        :return: None
+        """
+        if self.open_start:
+            self.open_start = False
+            self.sink.write(">")
+
+    def start_element(self, name, attr_list):
+        self.depth += 1
+        if self.skip_depth:
+            return
+        attrs = list(zip(attr_list[::2], attr_list[1::2]))
+        if self.depth == 1 and name == 'svg':
+            attrs = self.root_attrs(attrs)
+        elif name == 'foreignObject' and not self.drawio:
+            self.skip_depth = self.depth
+            return
+        elif name == 'a':
+            name, attrs = self.rewrite_link(attrs)
+            self.a_stack.append(name)
+        self.write_start(name, attrs)
+
+    def end_element(self, name):
+        if self.skip_depth:
+            if self.depth == self.skip_depth:
+                self.skip_depth = 0
+            self.depth -= 1
+            return
+        self.depth -= 1
+        if name == 'a':
+            name = self.a_stack.pop()
+        if self.open_start:
+            self.open_start = False
+            self.sink.write("/>")
+        else:
+            self.sink.write("</" + name + ">")
+
+    def char_data(self, data):
+        if self.skip_depth or not self.depth:
+            return
+        self.close_start()
+        if self.in_cdata:
+            self.sink.write(data)
+        else:
+            self.sink.write(data.translate(_TEXT_ESCAPES))
+
+    def comment(self, data):
+        if self.skip_depth or not self.depth:
+            return
+        self.close_start()
+        self.sink.write("<!--" + data + "-->")
+
+    def start_cdata(self):
+        if self.skip_depth:
+            return
+        self.in_cdata = True
+        self.close_start()
+        self.sink.write("<![CDATA[")
+
+    def end_cdata(self):
+        if self.skip_depth:
+            return
+        self.in_cdata = False
+        self.sink.write("]]>")
+
+    def root_attrs(self, attrs):
+        """Rewrites the root <svg> attributes, so the diagram scales
+        with the viewer.
+
+        :param attrs: list of (name, value) tuples
+        :return: rewritten attributes list
+        """
+        d = dict(attrs)
+        self.drawio = is_drawio(d)
+        new_attrs = [('id', 'svg'), ('width', '100%'),
+                     ('preserveAspectRatio', 'xMinYMin slice')]
+        view_box = None
+        if self.drawio:
+            w = re.match(r'^(.*?)px$', d.get('width', ''))
+            h = re.match(r'^(.*?)px$', d.get('height', ''))
+            if w and h:
+                view_box = "0 0 " + w.group(1) + " " + h.group(1)
+                new_attrs.append(('viewBox', view_box))
+        for k, v in attrs:
+            if k in ROOT_REMOVED_ATTRS or (view_box and k == 'viewBox'):
+                continue
+            new_attrs.append((k, v))
+        return new_attrs
+
+    def rewrite_link(self, attrs):
+        """Rewrites an <a> element depending on its link:
+
+        mod:module -> <a> linking the module HTML file
+        lit:url -> <a> linking url
+        file -> <g class="wrapper" id="file">, file is pushed to the
+        list of linked files of the graphyte module.
+
+        :param attrs: list of (name, value) tuples
+        :return: output element name, rewritten attributes list
+        """
+        link = dict(attrs).get('xlink:href')
+        kind = link_type(link)
+        if kind == "mod":
+            module = re.search('mod:(.*)', os.path.splitext(link)[0]).group(1)
+            new_link = self.guess_module(self.gm, module, link)
+            return 'a', [(k, new_link if k == 'xlink:href' else v)
+                         for k, v in attrs]
+        if kind == "lit":
+            new_link = re.search('lit:(.*)', link).group(1)
+            return 'a', [(k, new_link if k == 'xlink:href' else v)
+                         for k, v in attrs]
+        new_attrs = []
+        for k, v in attrs:
+            if k == 'xlink:href':
+                file_name = v.split("\\")[-1].split("/")[-1]
+                self.gm.push_link(file_name)
+                new_attrs.append(('class', 'wrapper'))
+                new_attrs.append(('id', file_name))
+            elif k not in A2G_REMOVED_ATTRS:
+                new_attrs.append((k, v))
+        return 'g', new_attrs
@@ -6,10 +6,15 @@ Tools to assist with graphyte template processing.
 """
 
 # imports
+import json
 import logging
 import os
 import re
+import threading
 from param_utils import param_is_false_positive, param_is_legal
+from manifest_utils import hash_text
+from output_utils import OutputBuffer, write_file
+from search_utils import text_terms
 import pprint
 
 pp = pprint.PrettyPrinter(indent=4)
@@ -20,130 +25,327 @@ __author__ = "Jorge Somavilla"
 # initialize logger
 logger = logging.getLogger('graphyte')
 
+TEMPLATE_STORE_DIR = "templates"
+
+# characters escaped in JS template arrays
+_JS_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '-': '\\-'})
+# template parameters, e.g. <param>, <{param}>, <(param)>, <[param]>
+_PARAM_RE = re.compile(r'(<.*?>)', re.S)
+
+# template stores used by this process, by output directory
+_stores = dict()
+_stores_lock = threading.Lock()
+
+
+class ProcessedTemplate(object):
+    """Stores the result of processing a template file.
+
+    Attributes:
+        file_var (str): Name of the JS variable holding the template.
+        script (str): Template in JS array format.
+        decision_params (list): Decision parameter table rows.
+        template_params (list): Template parameter table rows.
+        invalid (bool): Whether unauthorized parameters were found.
+        chunk_name (str): File name of the template chunk, named after
+        the hash of the template script.
+        terms (frozenset): Search terms of the template, None if not
+        collected.
+
+    """
+    __slots__ = ('file_var', 'script', 'decision_params', 'template_params',
+                 'invalid', 'chunk_name', 'terms')
+
+    def __init__(self, file_var, script, decision_params, template_params,
+                 invalid, terms=None):
+        self.file_var = file_var
+        self.script = script
+        self.decision_params = decision_params
+        self.template_params = template_params
+        self.invalid = invalid
+        self.terms = terms
+        self.chunk_name = hash_text(script) + ".js"
+
+
+class TemplateStore(object):
+    """Model-wide store of processed templates.
+
+    Templates linked from several modules are processed once per
+    process and, for lazy templates, written once to the store
+    directory, in a JS chunk named after the hash of its contents
+    which every module links.
+
+    Attributes:
+        store_dir (str): Directory of the template chunks.
+        processed (dict): Processed templates, by template file path,
+        modification time, size and parameter sheet.
+
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.processed = dict()
+        self._lock = threading.Lock()
+
+    def process(self, gm, entry, sheet_hash):
+        """Processes a template file, or returns the result of a
+        previous processing of the same file contents.
+
+        :param gm: the graphyte module object
+        :param entry: FileEntry of the template file
+        :param sheet_hash: hash of the parameter sheet, None if the
+         module has none
+        :return: ProcessedTemplate
+        """
+        # keyed on file status rather than contents hash, so that the
+        # template is only read when tokenized
+        st = os.stat(entry.path)
+        key = (entry.path, st.st_mtime_ns, st.st_size, gm.in_xls_path,
+               sheet_hash, entry.name == gm.changes_fname, gm.search_index)
+        with self._lock:
+            processed = self.processed.get(key)
+        if processed is None:
+            processed = process_template(gm, entry.name, entry.path)
+            with self._lock:
+                self.processed[key] = processed
+        return processed
+
+    def chunk(self, processed):
+        """Writes a processed template to the store, unless a chunk
+        with the same contents is already there.
+
+        :param processed: ProcessedTemplate
+        :return: path to the template chunk
+        """
+        chunk_path = os.path.join(self.store_dir, processed.chunk_name)
+        if not os.path.isfile(chunk_path):
+            os.makedirs(self.store_dir, exist_ok=True)
+            write_file(chunk_path, processed.script)
+        return chunk_path
+
+    def prune(self, keep):
+        """Removes chunks not used by any module.
+
+        :param keep: paths of the chunks in use
+        :return: None
+        """
+        if not os.path.isdir(self.store_dir):
+            return
+        keep = set(os.path.abspath(p) for p in keep)
+        for file in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, file)
+            if os.path.abspath(path) not in keep and os.path.isfile(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def get_template_store(out_dir):
+    """Returns the template store of a model output directory.
+
+    :param out_dir: output directory
+    :return: TemplateStore
+    """
+    store_dir = os.path.join(out_dir, TEMPLATE_STORE_DIR)
+    with _stores_lock:
+        if store_dir not in _stores:
+            _stores[store_dir] = TemplateStore(store_dir)
+        return _stores[store_dir]
+
+
+def clear_template_stores():
+    """Forgets the template stores used by this process, e.g. once a
+    long-running process is done with their output directories.
+
+    :return: None
+    """
+    with _stores_lock:
+        _stores.clear()
+
+
+def tokenize_template(file_var, src_file_name, file_path, params=None,
+                      terms=None):
+    """Reads a template text file once, transforming it into a JS
+    array declaration and extracting its parameters and search terms
+    at the same time. The first array item is the file name, followed
+    by one item per line.
+
+    :param file_var: name of the JS variable
+    :param src_file_name: template file name
+    :param file_path: path to template file
+    :param params: optional. "csv" to extract the parameters of
+     decision tables (first item of every line), "txt" to extract
+     <...> parameters, None to skip parameter extraction
+    :param terms: optional. Set the search terms of the template are
+     added to, None to skip term extraction
+    :return: template in JS array format, list of parameter
+     occurrences as (parameter, line number, stripped line) tuples
+    """
+    template_script = ["    var " + file_var + " = [\n \"" + src_file_name]
+    occurrences = []
+    with open(file_path,
+              encoding="utf8",
+              errors='ignore') as f:
+        for line_no, line in enumerate(f, 1):
+            # escape '\', '"' and '-', protect </script>
+            escaped = line.rstrip().translate(_JS_ESCAPES)
+            if '</script>' in escaped:
+                escaped = escaped.replace('</script>', '<\\/script>')
+            template_script.append("\",\n\"" + escaped)
+            if terms is not None:
+                terms |= text_terms(line)
+            if params == "txt":
+                if '<' in line:
+                    text = line.strip()
+                    for paramfound in _PARAM_RE.findall(line):
+                        occurrences.append((paramfound, line_no, text))
+            elif params == "csv":
+                text = line.strip()
+                if text:
+                    occurrences.append((text.split(",")[0], line_no, text))
+    template_script.append("\"];\n\n")
+    return "".join(template_script), occurrences
+
+
+def process_template(gm, src_file_name, file_path):
+    """Transforms a template text file into a JS array and
+    extracts its parameters for validation.
+
+    :param gm: the graphyte module object
+    :param src_file_name: template file name
+    :param file_path: path to template file
+    :return: ProcessedTemplate
+    """
+    file_name = os.path.splitext(src_file_name)[0]
+    # spaces dots or hyphens -> underscores
+    file_name = re.sub(r'\s|-|\.|\(|\)|\+', r'_',
+                       file_name.rstrip()
+                       )
+    file_ext = os.path.splitext(src_file_name)[1]
+    file_ext = re.sub(r'\.', r'_', file_ext.rstrip())
+    file_var = "v_" + file_name + file_ext
+
+    # Find decision parameters (csv) or template parameters (txt + others)
+    if file_ext == "_yang" or file_ext == "_xml" or src_file_name == gm.changes_fname:
+        params = None
+    elif file_ext == "_csv":
+        params = "csv"
+    else:
+        params = "txt"
+    terms = set() if gm.search_index else None
+    template_script, occurrences = tokenize_template(
+        file_var, src_file_name, file_path, params, terms
+    )
+
+    # parameter table rows as (head, unauthorized parameter or None,
+    # tail). If the module validates parameters, a suggestions column
+    # is inserted between head and tail.
+    rows = []
+    invalid = False
+    for paramfound, line_no, text in occurrences:
+        if params == "txt":
+            if param_is_false_positive(paramfound):
+                continue
+            tail = text.replace(",", "")
+        else:
+            # decision values
+            items = text.split(",")
+            tail = (" | ".join(items[1:]) if len(items) > 1 else items[0]) \
+                + "\n"
+        head = paramfound + "," + src_file_name + ","
+        unauthorized = None
+        if gm.in_xls_path:
+            if param_is_legal(paramfound, gm):
+                head += "ok,"
+            else:
+                head += "unauthorized,"
+                invalid = True
+                unauthorized = paramfound
+                logger.info('                 Unauthorized parameter '
+                            + paramfound + ' (' + src_file_name + ', line '
+                            + str(line_no) + ')\r\n')
+        rows.append((head, unauthorized, tail))
+
+    # Find closest authorized names of all unauthorized parameters
+    suggestions = dict()
+    if gm.in_xls_path:
+        suggestions = gm.param_validator.suggest(
+            set(row[1] for row in rows if row[1] is not None)
+        )
+    table = []
+    for head, unauthorized, tail in rows:
+        if gm.in_xls_path:
+            head += " | ".join(
+                n.replace(",", "") for n in suggestions.get(unauthorized, [])
+            ) + ","
+        table.append(head + tail)
+    decision_params = table if params == "csv" else []
+    template_params = table if params == "txt" else []
+    return ProcessedTemplate(
+        file_var, template_script, decision_params, template_params, invalid,
+        frozenset(terms) if terms is not None else None
+    )
+
 
 def add_templates_to_script(gm):
     """Transforms template text files into JS <script>
     arrays to be embedded in the final HTML module.
     Extracts parameters for validation while doing so.
 
+    Templates are processed through the model template store, so
+    templates linked from several modules are only processed once.
+    If the module builds lazy templates, each template is written
+    instead to a JS chunk in the template store, and only the table
+    of chunks is embedded.
+
     :param gm: the graphyte module object
-    :return: file_script, templates in JS <script> array format.
+    :return: file_script, templates in JS <script> array format,
+     as an OutputBuffer.
     """
 
     logger.info('         Processing template files...' + '\r\n')
-    file_script = ""
+    file_script = OutputBuffer()
     mod_linked_templates = dict()
     #mod_linked_templates['templates'] = {}
     mod_linked_templates = {}
-    for dirpath, dirs, src_files in os.walk(gm.file_dir):
-        for src_file_name in src_files:
-            # Check if file has been linked or is Changes file
-            if src_file_name in gm.svg_links or src_file_name == gm.changes_fname:
-                # Link to file has been found in the SVG or is Changes file, process it.
-                logger.info('             ' + src_file_name + '\r\n')
-                file_path = os.path.join(dirpath, src_file_name)
-                if os.path.isfile(file_path):
-                    file_name = os.path.splitext(src_file_name)[0]
-                    #mod_linked_templates['templates'][src_file_name]=file_path
-                    if not src_file_name == gm.changes_fname:
-                        # do not add changesfile to module templates dict
-                        mod_linked_templates[src_file_name] = file_path
-                    # spaces dots or hyphens -> underscores
-                    file_name = re.sub(r'\s|-|\.|\(|\)|\+', r'_',
-                                       file_name.rstrip()
-                                       )
-                    file_ext = os.path.splitext(src_file_name)[1]
-                    file_ext = re.sub(r'\.', r'_', file_ext.rstrip())
-                    file_script += "    var v_" + file_name + file_ext \
-                                   + " = [\n \"" + src_file_name
-                    with open(file_path,
-                              encoding="utf8",
-                              errors='ignore') as f:
-                        for line in f:
-                            line = re.sub(r'(\\|\")', r'\\\1', line.rstrip())
-                            line = re.sub(r'-', r'\-', line.rstrip())
-                            line = re.sub(r'</script>', r'<\/script>', line.rstrip())
-                            # line = line.decode('utf-8')
-                            file_script += "\",\n\"" + line.rstrip()
-                        file_script += "\"];\n\n"
-
-                    # Find decision parameters
-                    if file_ext == "_yang" or file_ext == "_xml" or src_file_name == gm.changes_fname:
-                        # do nothing
-                        continue
-                    else:
-                        if file_ext == "_csv":
-                            with open(file_path,
-                                      encoding="utf8",
-                                      errors='ignore') as f:
-                                for line in f:
-                                    if not (line.strip() == ""):
-                                        items = line.strip().split(",")
-                                        # items.insert(1,src_file_name)
-                                        newline = items[0] + "," \
-                                            + src_file_name + ","
-                                        if gm.in_xls_path:
-                                            # define legality of parameter
-                                            param_validation_result = ""
-                                            # print "Legal?:" + items[0]
-                                            if param_is_legal(items[0], gm):
-                                                param_validation_result = "ok"
-                                                # print "yes csv\n\n"
-                                            else:
-                                                param_validation_result \
-                                                    = "unauthorized"
-                                                # print "no csv\n\n"
-                                                gm.invalid_param_found_alert \
-                                                    = "(!)"
-                                            newline += param_validation_result \
-                                                       + ","
-                                        for item in items[1:-1]:
-                                            newline += item + " | "
-                                        newline += items[-1]
-                                        gm.decision_param_list.append(newline
-                                                                      + "\n")
-                        else: # txt + others
-                        # Find template parameters
-                        #if file_ext == "_txt":
-                            with open(file_path,
-                                      encoding="utf8",
-                                      errors='ignore') as f:
-                                for line in f:
-                                    line.encode('utf-8').strip()
-                                    matches = re.findall(r'(<.*?>)',
-                                                         line, re.S)
-                                    if matches:
-                                        for paramfound in matches:
-                                            if not param_is_false_positive(
-                                                    paramfound
-                                            ):
-                                                if gm.in_xls_path:
-                                                    param_validation_result = ""
-                                                    if param_is_legal(
-                                                            paramfound, gm
-                                                    ):
-                                                        param_validation_result\
-                                                            = "ok"
-                                                    else:
-                                                        param_validation_result\
-                                                            = "unauthorized"
-                                                        gm.invalid_param_found_alert = "(!)"
-                                                    gm.template_param_list.append(
-                                                        paramfound + ","
-                                                        + src_file_name + ","
-                                                        + param_validation_result
-                                                        + "," + re.sub(
-                                                            r',', r''
-                                                            , line.strip()))
-                                                else:
-                                                    gm.template_param_list.append(
-                                                        paramfound + ","
-                                                        + src_file_name
-                                                        + "," + re.sub(r',',
-                                                                       r'',
-                                                                       line.strip()))
+    chunks = dict()
+    chunk_paths = []
+    store = gm.template_store
+    linked_files = list(gm.svg_links)
+    if gm.changes_fname:
+        linked_files.append(gm.changes_fname)
+    # Resolve files linked in the SVG and the Changes file in the
+    # model file index, process them.
+    for entry in gm.file_index.lookup(linked_files):
+        src_file_name = entry.name
+        logger.info('             ' + src_file_name + '\r\n')
+        file_path = entry.path
+        if os.path.isfile(file_path):
+            #mod_linked_templates['templates'][src_file_name]=file_path
+            if not src_file_name == gm.changes_fname:
+                # do not add changesfile to module templates dict
+                mod_linked_templates[src_file_name] = file_path
+            processed = store.process(gm, entry, gm.sheet_hash)
+            if gm.search_index and src_file_name != gm.changes_fname:
+                gm.search_docs.append((src_file_name, processed.terms))
+            if gm.lazy_templates:
+                # template is loaded by the viewer when first displayed
+                chunk_path = store.chunk(processed)
+                chunks[processed.file_var] = TEMPLATE_STORE_DIR + "/" \
+                    + processed.chunk_name
+                chunk_paths.append(chunk_path)
+            else:
+                file_script.write(processed.script)
+            gm.decision_param_list += processed.decision_params
+            gm.template_param_list += processed.template_params
+            if processed.invalid:
+                gm.invalid_param_found_alert = "(!)"
+    if gm.lazy_templates:
+        file_script.write("    var templateChunks = "
+                          + json.dumps(chunks, sort_keys=True) + ";\n\n")
     logger.info('         ...ok' + '\r\n')
     mod_linked_templates2 = dict()
     mod_linked_templates2['templates'] = {}
     mod_linked_templates2['templates'] = mod_linked_templates
+    if gm.lazy_templates:
+        mod_linked_templates2['chunks'] = chunk_paths
     return file_script,mod_linked_templates2
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""trace_utils.py
+
+Build stage instrumentation.
+
+Every traced stage records its wall time, the CPU time of the process
+and of the subprocesses it waited for (pyang, PlantUML), the bytes read
+and written by the process and its peak resident memory. Stages are
+written as complete events of the Chrome trace-event format, which
+chrome://tracing and Perfetto display as a timeline with one row per
+process and thread.
+
+Module builder worker processes trace their stages with their own
+Tracer and return the events, which the parent merges in the model
+trace.
+
+I/O counters are read from /proc/self/io and are only available on
+Linux, peak memory is not available on Windows. Counters are per
+process, stages running at the same time in different threads share
+them.
+
+"""
+
+# imports
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# info
+__author__ = "Jorge Somavilla"
+
+# initialize logger
+logger = logging.getLogger('graphyte')
+
+TRACE_NAME = "graphyte-trace.json"
+TRACE_CATEGORY = "graphyte"
+_PROC_IO = "/proc/self/io"
+
+
+def read_io_counters():
+    """Reads the bytes read and written by this process.
+
+    :return: (bytes read, bytes written), None if not available
+    """
+    try:
+        with open(_PROC_IO) as f:
+            counters = dict(line.split(":") for line in f if ":" in line)
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+
+def max_rss_kb():
+    """Returns the peak resident memory of this process.
+
+    :return: peak RSS in KB, None if not available
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KB elsewhere
+    if sys.platform == "darwin":
+        rss //= 1024
+    return rss
+
+
+class Stage(object):
+    """Counters of a stage in progress.
+
+    Attributes:
+        name (str): Stage name.
+        args (dict): Stage arguments, e.g. module name.
+
+    """
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+        self.ts = time.time()
+        self.cpu = time.process_time()
+        self.times = os.times()
+        self.io = read_io_counters()
+        self.start = time.perf_counter()
+
+
+class Tracer(object):
+    """Collects the trace events of the stages of a build.
+
+    A disabled tracer records nothing, so stages can be traced
+    unconditionally.
+
+    Attributes:
+        enabled (bool): Whether stages are recorded.
+        args (dict): Arguments added to every event, e.g. module name.
+        events (list): Trace events recorded.
+
+    """
+    def __init__(self, enabled=True, **args):
+        self.enabled = enabled
+        self.args = args
+        self.events = []
+        self._pids = set()
+
+    def begin(self, name, **args):
+        """Starts a stage.
+
+        :param name: stage name
+        :param args: stage arguments
+        :return: Stage, None if the tracer is disabled
+        """
+        if not self.enabled:
+            return None
+        stage_args = dict(self.args)
+        stage_args.update(args)
+        return Stage(name, stage_args)
+
+    def end(self, stage):
+        """Ends a stage and records its event.
+
+        :param stage: Stage returned by begin
+        :return: None
+        """
+        if stage is None:
+            return
+        dur = time.perf_counter() - stage.start
+        cpu = time.process_time() - stage.cpu
+        times = os.times()
+        args = dict(stage.args)
+        args['cpu_ms'] = round(cpu * 1000, 3)
+        args['children_cpu_ms'] = round(max(0.0, times[2] + times[3]
+                                            - stage.times[2]
+                                            - stage.times[3]) * 1000, 3)
+        io = read_io_counters()
+        if io and stage.io:
+            args['read_bytes'] = io[0] - stage.io[0]
+            args['written_bytes'] = io[1] - stage.io[1]
+        rss = max_rss_kb()
+        if rss is not None:
+            args['max_rss_kb'] = rss
+        pid = os.getpid()
+        if pid not in self._pids:
+            self._pids.add(pid)
+            self.events.append({
+                'name': 'process_name', 'ph': 'M', 'pid': pid,
+                'args': {'name': 'graphyte ' + str(pid)}
+            })
+        self.events.append({
+            'name': stage.name,
+            'cat': TRACE_CATEGORY,
+            'ph': 'X',
+            'ts': int(stage.ts * 1e6),
+            'dur': int(dur * 1e6),
+            'pid': pid,
+            'tid': threading.get_ident(),
+            'args': args
+        })
+
+    @contextmanager
+    def stage(self, name, **args):
+        """Traces the code run inside a with block as a stage.
+
+        :param name: stage name
+        :param args: stage arguments
+        :return: None
+        """
+        stage = self.begin(name, **args)
+        try:
+            yield
+        finally:
+            self.end(stage)
+
+    def add_events(self, events):
+        """Merges events traced by another tracer, e.g. in a worker
+        process.
+
+        :param events: list of trace events
+        :return: None
+        """
+        if not self.enabled or not events:
+            return
+        for event in events:
+            if event['ph'] == 'M':
+                # one process name per process
+                if event['pid'] in self._pids:
+                    continue
+                self._pids.add(event['pid'])
+            self.events.append(event)
+
+    def durations(self):
+        """Sums the wall time of the recorded stages by name, e.g. over
+        all modules of a model.
+
+        :return: dictionary of stage name:seconds
+        """
+        durations = dict()
+        for event in self.events:
+            if event['ph'] == 'X':
+                durations[event['name']] = \
+                    durations.get(event['name'], 0.0) + event['dur'] / 1e6
+        return durations
+
+    def write(self, path, **metadata):
+        """Writes the trace in Chrome trace-event JSON format.
+
+        :param path: trace file path
+        :param metadata: build information added to the trace
+        :return: None
+        """
+        with open(path, "w") as f:
+            json.dump({
+                'traceEvents': self.events,
+                'displayTimeUnit': 'ms',
+                'otherData': metadata
+            }, f)
+        logger.info("     Build trace written to {}\r\n".format(path))
+
+
+def remove_trace(out_dir):
+    """Removes the build trace of a previous build.
+
+    :param out_dir: output directory
+    :return: None
+    """
+    try:
+        os.remove(os.path.join(out_dir, TRACE_NAME))
+    except OSError:
+        pass
+
+
+# tracer recording nothing
+NULL_TRACER = Tracer(False)
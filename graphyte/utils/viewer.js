@@ -0,0 +1,353 @@
+        $(window).load(function(){
+
+          var element = $('.floatright'),
+              originalY = element.offset().top;
+          // Space between element and top of screen (when scrolling)
+          var topMargin = 40;
+          element.css('position', 'relative');
+
+          var lastevent = null;
+          var mapsvgdoc = null;
+          var svgURL = "";
+
+          var latestclicked = "";
+          var latestedited = "";
+
+          htmlElement = document.getElementsByTagName('html')[0];
+          htmlElement.addEventListener("mousedown", htmlElmMouseDown, false);
+
+        function htmlElmMouseDown(evt){
+          if ($(evt.target).closest('#svg').length) {svgElmMouseDown(evt);}
+          else if ($(evt.target).closest('#editbutton').length) {texteditorElmMouseDown(evt);}
+          else if ($(evt.target).closest('#cancelbutton').length) {processClick(latestedited,false);}
+          else if ($(evt.target).closest('#savebutton').length) {saveTextAsFile(evt);}
+          else if ($(evt.target).closest('.floatright').length) {/*do nothing*/}
+          else if ($(evt.target).closest('#searchbox').length) {/*do nothing*/}
+          else if ($(evt.target).closest('#zoomOut').length) {zoomOutElmMouseDown(evt);}
+          else if ($(evt.target).closest('#zoomIn').length) {zoomInElmMouseDown(evt);}
+          else if ($(evt.target).closest('#params').length) {paramsElmMouseDown(evt);}
+          else if ($(evt.target).closest('#changes').length) {changesElmMouseDown(evt);}
+          else {
+            cleardisplay("3");
+          }
+        }
+
+        function saveTextAsFile(){
+          var textToSave = document.getElementById("inputTextToSave").value;
+          textToSave = textToSave.replace(/([^\r])\n/g, "$1\r\n");
+          var textToSaveAsBlob = new Blob([textToSave], {type:"text/plain"});
+          var textToSaveAsURL = window.URL.createObjectURL(textToSaveAsBlob);
+          var fileNameToSaveAs = latestedited;
+
+          var ie = navigator.userAgent.match(/MSIE\s([\d.]+)/),
+                ie11 = navigator.userAgent.match(/Trident\/7.0/) && navigator.userAgent.match(/rv:11/),
+                ieEDGE = navigator.userAgent.match(/Edge/g),
+                ieVer=(ie ? ie[1] : (ie11 ? 11 : (ieEDGE ? 12 : -1)));
+          if (ieVer>-1) { // No blobs on IE ver<10
+            window.navigator.msSaveBlob(textToSaveAsBlob, fileNameToSaveAs);
+          } else {
+            var downloadLink = document.createElement("a");
+            downloadLink.download = fileNameToSaveAs;
+            downloadLink.innerHTML = "Download File";
+            downloadLink.href = textToSaveAsURL;
+            downloadLink.onclick = destroyClickedElement;
+            downloadLink.style.display = "none";
+            document.body.appendChild(downloadLink);
+            downloadLink.click();
+          }
+        }
+
+        function texteditorElmMouseDown(evt){
+          cleardisplay("1");
+          editbuttonDIV = document.getElementById('editbottom');
+          editbuttonDIV.innerHTML = "";
+          textDiv = document.getElementById('text');
+          textDiv.innerHTML = "<table class=\"ed\"><td class=\"ed\" colspan=\"3\"><textarea id=\"inputTextToSave\" cols=\"80\" rows=\"25\" style=\"width: 82vh; height: 75vh\"></textarea></td></tr><tr class=\"edr\"><td class=\"edr\"><button id=\"savebutton\">Save</button>&nbsp<button id=\"cancelbutton\">Cancel</button></td></tr></table>";
+          loadFileAsText();
+        }
+
+        function loadFileAsText(){
+          data = window[latestclicked].join("\n");
+          var re = /^(.*)$/m;
+          var fname_retr = re.exec(data)[0];
+          latestedited = fname_retr;
+          data = data.replace(/^.*\n/g,"");
+          document.getElementById("inputTextToSave").value = data;
+        }
+
+        function destroyClickedElement(event){
+          document.body.removeChild(event.target);
+        }
+
+        function zoomInElmMouseDown(){
+          modifyZoom(30);
+        }
+        function zoomOutElmMouseDown(){
+          modifyZoom(-30);
+        }
+        function cleardisplay(level){
+          //level 1,2,3
+          textDiv = document.getElementById('text');
+          textDiv.innerHTML = "";
+          //level 2,3
+          if (level != "1"){
+            texttitleDiv = document.getElementById('texttitle');
+            texttitleDiv.innerHTML = "";
+          }
+          //level 3
+          if (level == "3"){
+            var y = document.getElementsByClassName('floatright');
+            var aNode = y[0];
+            aNode.style.backgroundColor = "transparent";
+            aNode.style.boxShadow = "none";
+            aNode.style.height = "0px";
+          }
+        }
+
+        function modifyZoom(zoom){
+          svgWidth = document.getElementById("svg").getAttribute("width");
+          svgWidth = svgWidth.replace("%", "");
+          newWidth = parseInt(svgWidth) + zoom;
+          if (newWidth > 0) {
+            document.getElementById("svg").setAttribute("width",newWidth + "%");
+          }
+        }
+
+        function processClick(filename,ctrlKey) {
+          var y = document.getElementsByClassName('floatright');
+          var aNode = y[0];
+          aNode.style.backgroundColor = 'rgba(255, 255, 255, 0.7)';
+          aNode.style.boxShadow = "0 7px 20px rgba(0,0,0,.3)";
+          aNode.style.height = "auto";
+          filename = filename.replace(/=/g,'_equal_');
+          //filename = filename.replace(/\./g,'_dot_');
+          filename = filename.replace(/\[/g,'_openbracket_');
+          filename = filename.replace(/\]/g,'_closebracket_');
+          filename = filename.replace(/\//g,'_backslash_');
+          filename = filename.replace(/\'/g,'_singlequote_');
+
+          var map = {
+            '&': '&amp;',
+            '<{': '<b><span style=background-color:LightSkyBlue>&lt;{',
+            '}>': '}&gt;</span></b>',
+            '<(': '<b><span style=background-color:greenyellow>&lt;(',
+            ')>': ')&gt;</span></b>',
+            '<[': '<b><span style=background-color:gold>&lt;[',
+            ']>': ']&gt;</span></b>',
+            '<': '<b><span style=background-color:yellow>&lt;',
+            '>': '&gt;</span></b>',
+            '"': '&quot;',
+            "'": '&#039;',
+            ",": '</td><td style="padding:0 3px 0 3px;">',
+            "\n": '</td></tr><tr align="left" width="auto"><td>'
+          };
+          var map2 = {
+            '&': '&amp;',
+            '<': '</b></span><span style=color:#555555>&lt;',
+            '>': '&gt;</span><span style=color:Black><b>',
+            '{': '<b><span style=background-color:yellow;color:Black>{',
+            '}': '}</span></b>',
+            '"': '&quot;',
+            "'": '&#039;',
+          };
+          /*if (ctrlKey){
+            //var url = filesDir.concat(filename);
+            //window.open(url);
+          }else{*/
+            cleardisplay("1");
+            texttitleDiv = document.getElementById('texttitle');
+            texttitleDiv.textContent = String(filename) + ":";
+            editbuttonDIV = document.getElementById('editbottom');
+            editbuttonDIV.innerHTML = "<tr class=\"ed\"><td class=\"ed\"><button id=\"editbutton\">Edit</button></td></tr>";
+            // get the filename extension
+            var re = /(?:\.([^.]+))?$/;
+            var ext = re.exec(filename)[1];
+            filename_var = "v_" + filename.replace(/\s|\.|-|\(|\)|\+/g, '_');
+            latestclicked = filename_var;
+            if (ext != "htm" && ext != "html" && typeof window[filename_var] === "undefined"
+                && typeof templateChunks !== "undefined" && templateChunks[filename_var]){
+              // template not embedded, load its chunk and display it when ready
+              loadTemplateChunk(filename_var, function(){processClick(filename,ctrlKey);});
+              return;
+            }
+            if (ext == "htm" || ext == "html"){
+              jQuery("#text").load(filesDir + filename);
+            }else if (ext == "csv"){
+              data = window[filename_var].join("\n");
+              var re = /^(.*)$/m;
+              var fname_retr = re.exec(data)[0];
+              data = data.replace(/^.*\n/g,"");
+              var lines = data.split('\n');
+              dataout = ""
+              for(var i = 0;i < lines.length;i++){
+                lines[i] = lines[i].replace(/&/g,'&amp');
+                lines[i] = lines[i].replace(/<([$,a-z,A-Z,0-9,\.,\[,\],/,=,\-,_]+)>/g, "<b><span style=background-color:yellow>&lt;$1&gt;</span></b>"); // param <type1>
+                lines[i] = lines[i].replace(/<{([$,a-z,A-Z,0-9,\.,\[,\],\/,=,&#039;,\-,_]+)}>/g, "<b><span style=background-color:LightSkyBlue>&lt;{$1}&gt;</span></b>"); // param <{type2}>
+                lines[i] = lines[i].replace(/<\(([$,a-z,A-Z,0-9,\.,\[,\],\/,=,&#039;,\-,_]+)\)>/g, "<b><span style=background-color:greenyellow>&lt;($1)&gt;</span></b>"); // param <(type3)>
+                lines[i] = lines[i].replace(/<\[([$,a-z,A-Z,0-9,\.,\[,\],\/,=,&#039;,\-,_]+)\]>/g, "<b><span style=background-color:gold>&lt;[$1]&gt;</span></b>"); // param <[type4]>
+                lines[i] = lines[i].replace(/,/g,'</td><td style="padding:0 3px 0 3px;">');
+                //lines[i] = lines[i].replace(/\n/g,'</td></tr><tr align="left" width="auto"><td>');
+                lines[i] = lines[i] + '</td></tr>';
+                if (i < lines.length-1) {
+                  lines[i] = lines[i] + '<tr align="left" width="auto"><td>';
+                }
+                dataout  = dataout + lines[i] + "\n";
+
+              }
+              
+              //data = data.replace(/^.*\n/g,"");
+              //data = data.replace(/(&)|(<\{)|(\}>)|(<\()|(\)>)|(<\[(?!\*>)|\]>)|(<)(?!\*>)|(>)|(")|(')|(,)|(\n)/g, function(m) { return map[m]; });
+              textDiv.innerHTML = "<table><tr align=\"left\" width=\"auto\"><td>" + dataout + "</table>";
+            }else if (ext == "xml"){
+             data = window[filename_var].join("\n");
+             textDiv = document.getElementById('text');
+             var re = /^(.*)$/m;
+             var fname_retr = re.exec(data)[0];
+             data = data.replace(/^.*\n/g,"");
+             data = data.replace(/(&)|(<)|(>)|({)|(})|(")|(')/g, function(n) { return map2[n]; });
+             data = data.replace(/([^\r])\n/g, "$1<br>");
+             textDiv.innerHTML = data;
+            }else{
+              data = window[filename_var].join("\n");
+              var re = /^(.*)$/m;
+              var fname_retr = re.exec(data)[0];
+              data = data.replace(/^.*\n/g,"");
+              var lines = data.split('\n');
+              dataout = ""
+              for(var i = 0;i < lines.length;i++){
+                lines[i] = lines[i].replace(/"/g, "&quot;"); // replace " by entity
+                lines[i] = lines[i].replace(/'/g, "&#039;"); // replace ' by entity
+                lines[i] = lines[i].replace(/&lt;/g, "/&lt;"); // protect &lt; string
+                lines[i] = lines[i].replace(/&gt;/g, "/&gt;"); // protect &gt; string
+                lines[i] = lines[i].replace(/</g, "-&lt;"); // identify < string
+                lines[i] = lines[i].replace(/>/g, "-&gt;"); // identify > string
+
+<!--            lines[i] = lines[i].replace(/\-&lt;([$,a-z,A-Z,0-9,\-,_]+)\-&gt;/g, "<b><span style=background-color:yellow>&lt;$1&gt;</span></b>"); // param <type1>
+                lines[i] = lines[i].replace(/\-&lt;{([$,a-z,A-Z,0-9,\-,_]+)}\-&gt;/g, "<b><span style=background-color:LightSkyBlue>&lt;{$1}&gt;</span></b>"); // param <{type2}>
+                lines[i] = lines[i].replace(/\-&lt;\(([$,a-z,A-Z,0-9,\-,_]+)\)\-&gt;/g, "<b><span style=background-color:greenyellow>&lt;($1)&gt;</span></b>"); // param <(type3)>
+                lines[i] = lines[i].replace(/\-&lt;\[([$,a-z,A-Z,0-9,\-,_]+)\]\-&gt;/g, "<b><span style=background-color:gold>&lt;[$1]&gt;</span></b>"); // param <[type4]>-->
+
+                lines[i] = lines[i].replace(/\-&lt;([$,a-z,A-Z,0-9,\.,\[,\],\/,=,&#039;,\-,_]+)\-&gt;/g, "<b><span style=background-color:yellow>&lt;$1&gt;</span></b>"); // param <type1>
+                lines[i] = lines[i].replace(/\-&lt;{([$,a-z,A-Z,0-9,\.,\[,\],\/,=,&#039;,\-,_]+)}\-&gt;/g, "<b><span style=background-color:LightSkyBlue>&lt;{$1}&gt;</span></b>"); // param <{type2}>
+                lines[i] = lines[i].replace(/\-&lt;\(([$,a-z,A-Z,0-9,\.,\[,\],\/,=,&#039;,\-,_]+)\)\-&gt;/g, "<b><span style=background-color:greenyellow>&lt;($1)&gt;</span></b>"); // param <(type3)>
+                lines[i] = lines[i].replace(/\-&lt;\[([$,a-z,A-Z,0-9,\.,\[,\],\/,=,&#039;,\-,_]+)\]\-&gt;/g, "<b><span style=background-color:gold>&lt;[$1]&gt;</span></b>"); // param <[type4]>
+
+                lines[i] = lines[i].replace(/\/&lt;/g, "&amp;lt;"); // restore &lt; string
+                lines[i] = lines[i].replace(/\/&gt;/g, "&amp;gt;");  // restore &gt; string
+                lines[i] = lines[i].replace(/\-&lt;/g, "&lt;"); // replace < by entity
+                lines[i] = lines[i].replace(/\-&gt;/g, "&gt;"); // replace > by entity
+                dataout  = dataout + lines[i] + "\n";
+
+              }
+              dataout = dataout.replace(/([^\r])\n/g, "$1<br>");
+              textDiv.innerHTML = dataout;
+          }
+        }
+
+        function loadTemplateChunk(filename_var,callback){
+          var chunkURL = templateChunks[filename_var];
+          var script = document.createElement("script");
+          script.charset = "utf-8";
+          script.onload = function(){
+            if (typeof window[filename_var] === "undefined"){
+              script.onerror();
+            }else{
+              callback();
+            }
+          };
+          script.onerror = function(){
+            textDiv = document.getElementById('text');
+            textDiv.innerHTML = "Could not load " + chunkURL;
+          };
+          script.src = chunkURL;
+          document.body.appendChild(script);
+        }
+
+        function paramsElmMouseDown(evt){
+          cleardisplay("1");
+          processClick(%params_csv_js%,evt.ctrlKey);
+        }
+
+        function changesElmMouseDown(evt){
+          cleardisplay("1");
+          processClick(%changes_file_js%,evt.ctrlKey);
+        }
+
+        function scrollTextDiv(){
+          var scrollTop = $(window).scrollTop();
+          element.stop(false, false).animate({
+            top: scrollTop < originalY
+              ? 0
+              : scrollTop - originalY + topMargin
+          }, 300);
+        }
+
+        function svgElmMouseDown(evt) {
+          cleardisplay("3");
+          if(!lastevent)
+            lastevent = evt;
+
+          dx = Math.abs(lastevent.clientX-evt.clientX);
+          dy = Math.abs(lastevent.clientY-evt.clientY);
+
+          lastevent = evt;
+          var elm = evt.target;
+          var classattr = null;
+          var idattr = null;
+
+          while(elm && !classattr) {
+            if(elm.nodeType == Node.ELEMENT_NODE && elm.hasAttribute("class") && elm.hasAttribute("id")){
+              classattr = elm.getAttribute("class");
+            }
+            if (classattr){
+              idattr = elm.getAttribute("id");
+            }
+              elm = elm.parentNode;
+          }
+
+          var found = false;
+          if(classattr) {
+            if (classattr == "wrapper"){
+               processClick(idattr,evt.ctrlKey);
+            }
+          }
+          scrollTextDiv();
+        }
+
+        function svgElmMouseUp(evt) {
+          dx = Math.abs(lastevent.clientX-evt.clientX);
+          dy = Math.abs(lastevent.clientY-evt.clientY);
+          lastevent = evt;
+        }
+
+        function svgElmHovered(evt) {}
+
+        // #open=filename in the URL displays a linked file, e.g. when
+        // following a search result. Only templates of this module are
+        // opened, the URL may come from anywhere
+        function hashChanged() {
+          var m = /^#open=(.+)$/.exec(window.location.hash);
+          if (!m) {
+            return;
+          }
+          var filename;
+          try {
+            filename = decodeURIComponent(m[1]);
+          } catch (e) {
+            return;
+          }
+          var filename_var = "v_" + filename.replace(/\s|\.|-|\(|\)|\+/g, '_');
+          if (!/^[A-Za-z0-9_]+$/.test(filename_var)) {
+            return;
+          }
+          if (typeof window[filename_var] !== "undefined"
+              || (typeof templateChunks !== "undefined" && templateChunks[filename_var])) {
+            processClick(filename,false);
+            scrollTextDiv();
+          }
+        }
+        window.addEventListener("hashchange", hashChanged, false);
+        hashChanged();
+
+    });
+